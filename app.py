@@ -1,21 +1,40 @@
 import streamlit as st
-import requests
+import numpy as np
 import pandas as pd
-import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
 import time
+import functools
 import math
 import os
 import textwrap
-import random
+import sqlite3
+
+from disk_cache import SessionStore
+from json_stream import columns_from_rows, iso_dates
+from lap_analytics import LapAnalytics
+from lap_chart import LapChart, lttb
+from live_data import (FEED_SCHEMAS, POLL_SCHEDULE, IncrementalFeed, LivePoller, SessionSnapshot, TimingTower,
+                       fetch_snapshot, snapshot_requests)
+from metrics import Metrics
+from openf1_client import (BACKGROUND_PRIORITY, OPENF1_BASE, OPENF1_TOKEN_URL, OpenF1Http, RequestScheduler, TokenManager,
+                           endpoint_name)
+from prefetch import Prefetcher
+from race_state import RaceState
+from render_cache import RenderCache
+from replay import ReplayPlayer, ReplayRecorder
+from segment_store import SegmentStore
+from session_compare import LapStore, pace_bands, stint_pace
+from telemetry import TELEMETRY_FIELDS, TELEMETRY_POLL, TelemetryFeed, TelemetryPoller, samples_for_laps
+
+# Whole-script time includes page setup, styling and the sidebar, not just the data
+_script_started = time.perf_counter()
 
 st.set_page_config(
     page_title="F1 Live Analytics by MPH",
     layout="wide",
 )
 
-OPENF1_BASE = "https://api.openf1.org/v1"
-OPENF1_TOKEN_URL = "https://api.openf1.org/token"
-
 # -----------------------------
 # TV Broadcast Styling (Mobile-first, True Black + NO top blank space)
 # -----------------------------
@@ -228,6 +247,16 @@ header {visibility: hidden;}
 .gapDir { font-size: 12px; color: var(--muted); margin-bottom: 6px; font-weight: 800; }
 .gapVal { font-size: 16px; font-weight: 900; color: var(--text); text-shadow: 0 2px 10px rgba(0,0,0,0.65); }
 
+/* Timing tower */
+.tower { width: 100%; border-collapse: collapse; font-size: 13px; }
+.tower th {
+  text-align: left; font-size: 11px; font-weight: 800; color: var(--muted);
+  padding: 4px 8px; border-bottom: 1px solid rgba(255,255,255,0.14);
+}
+.tower td { padding: 5px 8px; font-weight: 800; color: var(--text); white-space: nowrap; }
+.tower tr.me td { background: rgba(255,255,255,0.10); }
+.towerStripe { display:inline-block; width: 4px; height: 14px; border-radius: 2px; margin-right: 8px; transform: translateY(2px); }
+
 /* Stint timeline */
 .timelineWrap{
   width:100%;
@@ -301,87 +330,305 @@ debug = st.toggle("Debug (show API status)", value=False)
 # -----------------------------
 # OpenF1 OAuth Token (username/password -> access_token)
 # -----------------------------
-@st.cache_data(ttl=300)  # 5 minutes
-def get_openf1_token_cached(username: str, password: str):
-    payload = {"username": username, "password": password}
-    headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    resp = requests.post(OPENF1_TOKEN_URL, data=payload, headers=headers, timeout=10)
-    return resp.status_code, (resp.json() if resp.status_code == 200 else None)
+def _setting(name: str, default=None):
+    # Environment variables win over Streamlit Secrets
+    value = os.environ.get(name)
+    if value is not None:
+        return value
+    try:
+        return st.secrets.get(name, default)
+    except Exception:
+        return default
 
-def get_openf1_token():
+@st.cache_resource
+def metrics():
+    # Spans and counters for the debug panel; F1_METRICS_FILE and/or
+    # F1_METRICS_PORT also export them in Prometheus text format.
+    m = Metrics()
+    m.add_collector(_component_metrics)
+    path = _setting("F1_METRICS_FILE")
+    if path:
+        m.export_to_file(str(path))
+    port = _setting("F1_METRICS_PORT")
+    if port:
+        try:
+            m.serve(int(port))
+        except (OSError, ValueError):
+            pass
+    return m
+
+def _component_metrics():
+    for endpoint, s in openf1_http().stats().items():
+        labels = {"endpoint": endpoint}
+        yield "openf1_requests_total", "counter", labels, s["requests"]
+        yield "openf1_not_modified_total", "counter", labels, s["not_modified"]
+        yield "openf1_stale_total", "counter", labels, s["stale"]
+        yield "openf1_errors_total", "counter", labels, s["errors"]
+        yield "openf1_bytes_wire_total", "counter", labels, s["bytes_wire"]
+        yield "openf1_bytes_decoded_total", "counter", labels, s["bytes_decoded"]
+        yield "openf1_request_seconds_total", "counter", labels, s["seconds"]
+    sched = openf1_http().scheduler.stats()
+    yield "openf1_rate_limited_total", "counter", {}, sched["rate_limited"]
+    yield "scheduler_throttled_total", "counter", {}, sched["throttled"]
+    yield "scheduler_rejected_total", "counter", {}, sched["rejected"]
+    yield "scheduler_queue_depth", "gauge", {}, sched["queue_depth"]
+    store = session_store()
+    if store is not None:
+        yield "session_store_hits_total", "counter", {}, store.hits
+        yield "session_store_misses_total", "counter", {}, store.misses
+    segments = segment_store()
+    if segments is not None:
+        yield "segment_store_hits_total", "counter", {}, segments.hits
+        yield "segment_store_misses_total", "counter", {}, segments.misses
+        yield "segment_store_version", "gauge", {}, segments.version
+    warm = prefetcher()
+    if warm is not None:
+        stats = warm.stats()
+        yield "prefetch_warmed_total", "counter", {}, stats["warmed"]
+        yield "prefetch_hits_total", "counter", {}, stats["hits"]
+        yield "prefetch_cancelled_total", "counter", {}, stats["cancelled"]
+        yield "prefetch_pending", "gauge", {}, stats["pending"]
+    for fragment, s in render_cache().stats().items():
+        yield "render_cache_hits_total", "counter", {"fragment": fragment}, s["hits"]
+        yield "render_cache_misses_total", "counter", {"fragment": fragment}, s["misses"]
+
+@st.cache_resource
+def openf1_http():
+    # One pooled keep-alive client per process, shared by viewers and pollers.
+    # Its scheduler enforces OpenF1's quotas for the whole process.
+    scheduler = RequestScheduler(
+        per_second=float(_setting("OPENF1_RATE_PER_SECOND", 6)),
+        per_minute=float(_setting("OPENF1_RATE_PER_MINUTE", 60)),
+    )
+    return OpenF1Http(scheduler=scheduler)
+
+def rate_limit_warning():
+    wait = openf1_http().scheduler.backoff_remaining
+    st.warning(f"OpenF1 rate limit (429): backing off for {wait:.0f}s, showing the last data received…")
+
+def ingestion_pending_note(endpoint: str):
+    st.info(f"Waiting for the ingestion worker to fetch {endpoint_name(endpoint.split('?', 1)[0])}…")
+
+def openf1_credentials():
     try:
-        username = st.secrets.get("OPENF1_USERNAME", None)
-        password = st.secrets.get("OPENF1_PASSWORD", None)
+        return st.secrets.get("OPENF1_USERNAME", None), st.secrets.get("OPENF1_PASSWORD", None)
     except Exception:
-        username = None
-        password = None
+        return None, None
 
+@st.cache_resource
+def token_manager():
+    # One token per process, refreshed in the background before it expires
+    username, password = openf1_credentials()
     if not username or not password:
+        return None
+    return TokenManager(openf1_http(), OPENF1_TOKEN_URL, username, password)
+
+def get_openf1_token():
+    manager = token_manager()
+    if manager is None:
         st.error("Missing OpenF1 credentials. Add OPENF1_USERNAME and OPENF1_PASSWORD to Streamlit Secrets.")
         return None
 
-    code, data = get_openf1_token_cached(username, password)
+    token = manager.token()
     if debug:
-        st.caption(f"POST /token → {code}")
-    if code != 200 or not data:
-        st.error(f"Failed to obtain OpenF1 token: {code}")
+        st.caption(f"POST /token → {manager.last_status} • expires in {manager.expires_in:.0f}s")
+    if not token:
+        st.error(f"Failed to obtain OpenF1 token: {manager.last_status}")
         return None
-    return data.get("access_token")
+    return token
 
-def _cooldown_active():
-    now = time.time()
-    until = st.session_state.get("rate_limit_until", 0)
-    return now < until, int(max(until - now, 0))
+def _access_token():
+    manager = token_manager()
+    if manager is None:
+        return None
+    with metrics().span("token"):
+        return manager.token()
+
+@st.cache_resource
+def session_store():
+    # Finished sessions never change: keep them on disk and skip the network.
+    # Set F1_CACHE_DIR=off to disable.
+    directory = str(_setting("F1_CACHE_DIR", ".f1_cache"))
+    if directory.lower() in ("", "off", "none", "0"):
+        return None
+    try:
+        return SessionStore(directory)
+    except (OSError, sqlite3.Error):
+        return None
 
-def get_json(endpoint: str):
-    # Rate-limit cooldown: avoid hammering the API during 429 windows
-    active, secs_left = _cooldown_active()
-    if active:
-        if debug:
-            st.caption(f"⏳ cooldown {secs_left}s: skipping {endpoint}")
-        return []
+@st.cache_resource
+def replay_player():
+    # F1_REPLAY_PATH plays a recorded log back instead of calling OpenF1,
+    # F1_REPLAY_SPEED times faster than real time (e.g. 1, 4, 20).
+    path = _setting("F1_REPLAY_PATH")
+    if not path:
+        return None
+    speed = float(_setting("F1_REPLAY_SPEED", 1) or 1)
+    loop = str(_setting("F1_REPLAY_LOOP", "")).lower() in ("1", "true", "yes")
+    return ReplayPlayer(path, speed=speed, loop=loop)
+
+@st.cache_resource
+def segment_store():
+    # F1_BACKEND=store reads everything from the directory an ingest.py
+    # worker writes (F1_STORE_DIR) and never calls OpenF1 from this process.
+    if str(_setting("F1_BACKEND", "openf1")).lower() != "store":
+        return None
+    return SegmentStore(str(_setting("F1_STORE_DIR", ".f1_store")))
+
+@st.cache_resource
+def replay_recorder():
+    # F1_RECORD_PATH appends every response to a log ReplayPlayer can read
+    path = _setting("F1_RECORD_PATH")
+    return ReplayRecorder(path) if path else None
+
+def fetch_openf1(endpoint: str, schema=None):
+    """GET an OpenF1 endpoint -> (status_code, payload).
+
+    Finished sessions are answered from the on-disk store, and a replay log
+    or an ingestion worker's segment store (if configured) stands in for
+    OpenF1 entirely. Never writes to the page,
+    so it is safe to call from background threads.
+
+    With a `schema` ({column: dtype}) the payload is a dict of typed column
+    arrays holding only those columns; from OpenF1 it is parsed while it
+    streams in, for the large intervals/positions/telemetry responses.
+    """
+    name = endpoint_name(endpoint.split("?", 1)[0])
+    with metrics().span(f"fetch:{name}"):
+        code, payload = _fetch(endpoint, schema)
+    metrics().incr("fetch", endpoint=name, status=code)
+    return code, payload
+
+@st.cache_resource
+def prefetcher():
+    # Warms the sessions a viewer is likely to open next on a couple of
+    # shared threads; F1_PREFETCH_WORKERS=0 turns it off.
+    workers = int(_setting("F1_PREFETCH_WORKERS", 2) or 0)
+    if segment_store() is not None:
+        return None  # already local, nothing to warm
+    return Prefetcher(_prefetch, max_workers=workers) if workers > 0 else None
+
+def _prefetch(endpoint: str, schema=None):
+    name = endpoint_name(endpoint.split("?", 1)[0])
+    with metrics().span(f"prefetch:{name}"):
+        # Last in the rate-limit queue, and dropped when tokens run low
+        return _fetch_uncached(endpoint, schema, priority=BACKGROUND_PRIORITY)
+
+def _fetch(endpoint: str, schema):
+    warm = prefetcher()
+    warmed = warm.take(endpoint, schema) if warm is not None else None
+    if warmed is not None:
+        return warmed
+    return _fetch_uncached(endpoint, schema)
+
+def _fetch_uncached(endpoint: str, schema, priority=None):
+    player = replay_player()
+    if player is not None:
+        return _as_columns(*player.fetch(endpoint), schema)
+
+    segments = segment_store()
+    if segments is not None:
+        return segments.fetch(endpoint, schema)
+
+    recorder = replay_recorder()
+    if schema is not None and recorder is None:
+        return _fetch_stored_or_remote(endpoint, schema, priority)
+
+    code, payload = _fetch_stored_or_remote(endpoint, priority=priority)
+    if recorder is not None:
+        recorder.record(endpoint, code, payload)
+    return _as_columns(code, payload, schema)
+
+def _as_columns(code, payload, schema):
+    if schema is None or code != 200:
+        return code, payload
+    return code, columns_from_rows(payload, schema)
+
+def _fetch_stored_or_remote(endpoint: str, schema=None, priority=None):
+    store = session_store()
+    if store is not None:
+        # Typed feeds are kept as column arrays: no list of rows either way
+        cached = store.get(endpoint) if schema is None else store.get_columns(endpoint, schema)
+        if cached is not None:
+            return 200, cached
+
+    try:
+        code, payload = _request_openf1(endpoint, schema, priority)
+    except Exception:
+        # Offline: fall back to the last copy we have, if any
+        stale = store.get(endpoint, stale_ok=True) if store is not None else None
+        if stale is None:
+            raise
+        return _as_columns(200, stale, schema)
+
+    if code == 200 and store is not None:
+        if schema is None:
+            store.put(endpoint, payload)
+        else:
+            store.put_columns(endpoint, payload, schema)
+    return code, payload
 
-    token = get_openf1_token()
+def _request_openf1(endpoint: str, schema=None, priority=None):
+    token = _access_token()
     if not token:
-        return []
+        return 401, "No OpenF1 access token"
 
+    http = openf1_http()
     url = f"{OPENF1_BASE}/{endpoint}"
-    headers = {"Authorization": f"Bearer {token}"}
 
+    def get(tok):
+        headers = {"Authorization": f"Bearer {tok}"}
+        if schema is not None:
+            return http.get_columns(url, schema, headers=headers, priority=priority)
+        return http.get_json(url, headers=headers, priority=priority)
+
+    code, payload = get(token)
+
+    # Token expired → refresh once (shared by every thread that saw the 401) and retry
+    if code == 401:
+        token2 = token_manager().invalidate(token)
+        if not token2:
+            return code, payload
+        code, payload = get(token2)
+
+    return code, payload
+
+def get_json(endpoint: str):
+    # Rate limiting is handled process-wide by the scheduler in openf1_http():
+    # during a backoff it answers with the last good payload where it has one.
+    # None when there is no answer yet, so cached loaders can skip caching it.
     try:
         if debug:
-            st.caption(f"GET {url}")
+            st.caption(f"GET {OPENF1_BASE}/{endpoint}")
+
+        code, payload = fetch_openf1(endpoint)
 
-        r = requests.get(url, headers=headers, timeout=12)
+        # Missing credentials / token failures: explain on the page
+        if code == 401 and not get_openf1_token():
+            return None
 
-        # Token expired → clear cache and retry once
-        if r.status_code == 401:
-            get_openf1_token_cached.clear()
-            token2 = get_openf1_token()
-            if not token2:
-                return []
-            headers2 = {"Authorization": f"Bearer {token2}"}
-            r = requests.get(url, headers=headers2, timeout=12)
+        # Store backend: the worker has not fetched this yet (it will shortly)
+        if code == 503 and segment_store() is not None:
+            ingestion_pending_note(endpoint)
+            return None
 
         # Rate limited
-        if r.status_code == 429:
-            wait = random.randint(30, 60)
-            st.session_state["rate_limit_until"] = time.time() + wait
-            st.warning(f"OpenF1 request failed: 429 (rate limit). Cooling down for {wait}s…")
-            return []
+        if code == 429:
+            rate_limit_warning()
+            return None
 
         # Other failures
-        if r.status_code != 200:
-            st.warning(f"OpenF1 request failed: {r.status_code}")
+        if code != 200:
+            st.warning(f"OpenF1 request failed: {code}")
             if debug:
-                st.caption(f"Response text: {r.text[:200]}")
-            return []
+                st.caption(f"Response text: {str(payload)[:200]}")
+            return None
 
-        return r.json()
+        return payload
 
     except Exception as e:
         st.warning(f"Network error calling OpenF1: {e}")
-        return []
+        return None
 
 # -----------------------------
 # Helpers
@@ -400,6 +647,14 @@ def format_lap_time(value):
     except:
         return "--"
 
+def gap_text(seconds, laps_down=0, default="--"):
+    """Gap in seconds, or "+N LAP(S)" when the schema split out laps down."""
+    if laps_down is not None and pd.notna(laps_down) and laps_down > 0:
+        return f"+{int(laps_down)} LAP{'S' if laps_down > 1 else ''}"
+    if seconds is None or pd.isna(seconds):
+        return default
+    return f"{seconds:.3f}"
+
 def tire_color(compound: str):
     colors = {"SOFT":"#ff2e2e","MEDIUM":"#ffd800","HARD":"#ffffff","INTERMEDIATE":"#00ff66","WET":"#0099ff"}
     return colors.get((compound or "").upper(), "#aaaaaa")
@@ -433,12 +688,6 @@ def plotly_force_dark(fig):
     )
     return fig
 
-def acronym_for(drivers_full_df: pd.DataFrame, num: int):
-    row = drivers_full_df[drivers_full_df["driver_number"] == num]
-    if not row.empty:
-        return safe_str(row.iloc[0].get("name_acronym"), str(num))
-    return str(num)
-
 # -----------------------------
 # Header (logo)
 # -----------------------------
@@ -471,16 +720,48 @@ with col_title:
     </div>
     """, unsafe_allow_html=True)
 
+player = replay_player()
+if player is not None:
+    st.caption(f"⏯ Replay {player.speed:g}x • {player.progress:.0%} of {os.path.basename(player.path)}")
+elif segment_store() is not None:
+    st.caption(f"🗄 Store {segment_store().root} • version {segment_store().version}")
+
 # -----------------------------
 # Season → Meeting → Session
 # -----------------------------
+class NotCached(Exception):
+    """Raised out of a cached loader so a pending or failed answer is not cached; `value` is shown meanwhile."""
+
+    def __init__(self, value):
+        super().__init__("answer not cached")
+        self.value = value
+
+def uncached_on_failure(loader, *args):
+    # The next rerun asks again instead of showing the failure for hours
+    try:
+        return loader(*args)
+    except NotCached as e:
+        return e.value
+
 @st.cache_data(ttl=6*60*60)
-def load_meetings():
-    return pd.DataFrame(get_json("meetings"))
+def cached_meetings():
+    rows = get_json("meetings")
+    if rows is None:
+        raise NotCached(pd.DataFrame())
+    return pd.DataFrame(rows)
 
 @st.cache_data(ttl=6*60*60)
+def cached_sessions_for_meeting(meeting_key: int):
+    rows = get_json(f"sessions?meeting_key={meeting_key}")
+    if rows is None:
+        raise NotCached(pd.DataFrame())
+    return pd.DataFrame(rows)
+
+def load_meetings():
+    return uncached_on_failure(cached_meetings)
+
 def load_sessions_for_meeting(meeting_key: int):
-    return pd.DataFrame(get_json(f"sessions?meeting_key={meeting_key}"))
+    return uncached_on_failure(cached_sessions_for_meeting, meeting_key)
 
 meetings = load_meetings()
 if meetings.empty or "year" not in meetings.columns:
@@ -529,12 +810,102 @@ session_options = {
 sel_session_label = st.selectbox("Session", list(session_options.keys()))
 session_key = session_options[sel_session_label]
 
+def prefetch_requests(session_keys, current_session, meeting_keys, current_meeting):
+    # Neighbouring weekends' session lists first (one request each), then the
+    # weekend's other sessions, nearest to the selected one first.
+    reqs = []
+    i = meeting_keys.index(current_meeting) if current_meeting in meeting_keys else -1
+    if i >= 0:
+        reqs += [(f"sessions?meeting_key={meeting_keys[j]}", None) for j in (i + 1, i - 1) if 0 <= j < len(meeting_keys)]
+    pos = session_keys.index(current_session)
+    for key in sorted((k for k in session_keys if k != current_session), key=lambda k: abs(session_keys.index(k) - pos)):
+        reqs += snapshot_requests(key)
+    return reqs
+
+# Warm the rest of the weekend in the background so the next click is usually
+# a cache hit; choosing something else replaces this viewer's plan.
+if prefetcher() is not None and not openf1_http().scheduler.backoff_remaining:
+    prefetcher().warm(
+        st.session_state.setdefault("prefetch_owner", os.urandom(8).hex()),
+        prefetch_requests(list(session_options.values()), session_key, list(meeting_options.values()), sel_meeting_key),
+    )
+
 # Auto Refresh selector default 10s
 refresh_choice = st.selectbox("Auto Refresh", ["Off", "5s", "10s", "20s"], index=2)
 refresh_seconds = {"Off": 0, "5s": 5, "10s": 10, "20s": 20}[refresh_choice]
 
+# -----------------------------
+# Session data: one shared poller per live session, or a one-off load
+# -----------------------------
+@st.cache_resource(max_entries=8)
+def live_feeds(session_key_int: int):
+    # Shared by every viewer of the session: each rerun only pulls rows newer
+    # than the last `date` seen instead of the whole session.
+    return {
+        "intervals": IncrementalFeed("intervals", session_key_int, schema=FEED_SCHEMAS["intervals"], keep_history=True),
+        "positions": IncrementalFeed("positions", session_key_int, schema=FEED_SCHEMAS["positions"], keep_history=True),
+    }
+
+@st.cache_resource(max_entries=8)
+def live_poller(session_key_int: int):
+    return LivePoller(session_key_int, fetch_openf1, feeds=live_feeds(session_key_int))
+
+class IncompleteSnapshot(Exception):
+    """A snapshot with parts that failed to load, raised so that it is not cached."""
+
+    def __init__(self, snapshot, failures):
+        super().__init__(f"{len(failures)} endpoint(s) failed")
+        self.snapshot = snapshot
+        self.failures = failures
+
+@st.cache_resource(ttl=30, max_entries=8)
+def complete_snapshot(session_key_int: int):
+    # Cached so that changing the Driver selectbox never goes back to OpenF1,
+    # but only when every part arrived: otherwise the next rerun asks again.
+    with metrics().span("snapshot"):
+        snapshot, failures = fetch_snapshot(session_key_int, fetch_openf1, feeds=live_feeds(session_key_int))
+    if failures:
+        raise IncompleteSnapshot(snapshot, failures)
+    return snapshot
+
+def load_snapshot(session_key_int: int):
+    # All endpoints are fetched at once; problems are reported here, on the
+    # script thread, once the fan-out has finished.
+    try:
+        return complete_snapshot(session_key_int)
+    except IncompleteSnapshot as e:
+        if not (401 in e.failures.values() and not get_openf1_token()):
+            report_failures(e.failures)
+        return e.snapshot
+
+def report_failures(failures, limit=None):
+    # Background fetches collect their failures; report them on the page here
+    for i, (endpoint, code) in enumerate(failures.items()):
+        if code == 429:
+            rate_limit_warning()
+            break
+        if limit is not None and i >= limit:
+            break
+        if code == 503 and segment_store() is not None:
+            ingestion_pending_note(endpoint)
+        elif isinstance(code, str):
+            st.warning(f"Network error calling OpenF1: {code}")
+        else:
+            st.warning(f"OpenF1 request failed: {code}")
+        if debug:
+            st.caption(f"GET {OPENF1_BASE}/{endpoint} → {code}")
+
+def current_snapshot():
+    if refresh_seconds > 0:
+        return live_poller(int(session_key)).snapshot()
+    return load_snapshot(int(session_key))
+
+snapshot = current_snapshot()
+if debug and refresh_seconds > 0:
+    st.caption(f"Live poller v{snapshot.version} • last error: {live_poller(int(session_key)).last_error or '-'}")
+
 # Pull session info
-session_data = get_json(f"sessions?session_key={session_key}")
+session_data = list(snapshot.session)
 session_name = safe_str(session_data[0].get("session_name")) if session_data else safe_str(sel_session_label)
 location = safe_str(session_data[0].get("location")) if session_data else safe_str(sel_meeting_label)
 total_laps = session_data[0].get("total_laps", 0) if session_data else 0
@@ -542,124 +913,101 @@ total_laps = session_data[0].get("total_laps", 0) if session_data else 0
 # -----------------------------
 # Driver Selection
 # -----------------------------
-drivers_data = get_json(f"drivers?session_key={session_key}")
-if not drivers_data:
+# Built once per drivers load; every lookup below is a dict hit
+drivers = snapshot.drivers
+if not len(drivers):
     st.error("No drivers found for this session.")
     st.stop()
 
-drivers_full = pd.DataFrame(drivers_data)
-
-driver_map = {}
-for d in drivers_data:
-    dn = d.get("driver_number")
-    acr2 = d.get("name_acronym", "?")
-    if dn is not None:
-        driver_map[f"{acr2} ({dn})"] = int(dn)
+driver_map = {f"{d.acronym} ({d.number})": d.number for d in drivers}
 
 selected_driver = st.selectbox("Driver", list(driver_map.keys()))
 driver_number = int(driver_map[selected_driver])
 
-# -----------------------------
-# Load Laps + Stints
-# -----------------------------
-laps = pd.DataFrame(get_json(f"laps?session_key={session_key}&driver_number={driver_number}"))
-if laps.empty or "lap_number" not in laps.columns:
+# Driver identity / team color
+me_driver = drivers.get(driver_number)
+acr = safe_str(me_driver.acronym) if me_driver is not None else "DRV"
+team = safe_str(me_driver.team) if me_driver is not None else "-"
+team_colour = normalize_hex_color(me_driver.colour) if me_driver is not None else "#888888"
+full_name = safe_str(me_driver.full_name, acr) if me_driver is not None else acr
+
+if snapshot.laps.driver(driver_number).empty:
     st.warning("No lap data available for this driver/session.")
     st.stop()
 
-laps = laps.sort_values("lap_number")
-
-if "lap_duration" in laps.columns:
-    laps["lap_duration_num"] = pd.to_numeric(laps["lap_duration"], errors="coerce")
-elif "lap_time" in laps.columns:
-    laps["lap_duration_num"] = pd.to_numeric(laps["lap_time"], errors="coerce")
-else:
-    laps["lap_duration_num"] = pd.NA
-
-stints = pd.DataFrame(get_json(f"stints?session_key={session_key}&driver_number={driver_number}"))
-
-current_lap = laps.iloc[-1]
-previous_lap = laps.iloc[-2] if len(laps) > 1 else None
-current_lap_number = int(current_lap["lap_number"])
-
-valid_laps = laps[laps["lap_duration_num"].notna()].copy()
-if valid_laps.empty:
-    best_lap = None
-    best_lap_number = None
-else:
-    best_lap = valid_laps.loc[valid_laps["lap_duration_num"].idxmin()]
-    best_lap_number = int(best_lap["lap_number"])
-
-# Tires
-current_tire = "-"
-best_lap_tire = "-"
-if not stints.empty and all(c in stints.columns for c in ["lap_start", "lap_end", "compound"]):
-    cur = stints[(stints.lap_start <= current_lap_number) & (stints.lap_end >= current_lap_number)]
-    if not cur.empty:
-        current_tire = safe_str(cur.iloc[0].get("compound"))
-    if best_lap_number is not None:
-        bl = stints[(stints.lap_start <= best_lap_number) & (stints.lap_end >= best_lap_number)]
-        if not bl.empty:
-            best_lap_tire = safe_str(bl.iloc[0].get("compound"))
-
-# Driver identity / team color
-me_driver = drivers_full[drivers_full["driver_number"] == driver_number]
-acr = safe_str(me_driver.iloc[0].get("name_acronym")) if not me_driver.empty else "DRV"
-team = safe_str(me_driver.iloc[0].get("team_name")) if (not me_driver.empty and "team_name" in me_driver.columns) else "-"
-team_colour = normalize_hex_color(me_driver.iloc[0].get("team_colour")) if (not me_driver.empty and "team_colour" in me_driver.columns) else "#888888"
-full_name = safe_str(me_driver.iloc[0].get("full_name")) if (not me_driver.empty and "full_name" in me_driver.columns) else acr
-
 # -----------------------------
-# GAPS via /intervals + /positions + capture ahead/behind driver_numbers
+# Laps + Stints (the live cards below recompute these from the latest snapshot)
 # -----------------------------
-intervals = pd.DataFrame(get_json(f"intervals?session_key={session_key}"))
-driver_ahead = "-"
-driver_behind = "-"
-gap_ahead = "--"
-gap_behind = "--"
-gap_leader = "--"
-my_pos = None
-
-ahead_number = None
-behind_number = None
-
-if not intervals.empty and "driver_number" in intervals.columns:
-    if "date" in intervals.columns:
-        snap = intervals.sort_values("date").groupby("driver_number").tail(1)
+def lap_summary(laps: pd.DataFrame):
+    # laps is a slice of the session lap table, indexed by lap_number
+    current_lap = laps.iloc[-1]
+    previous_lap = laps.iloc[-2] if len(laps) > 1 else None
+    current_lap_number = int(current_lap.name)
+
+    if laps["lap_duration_num"].notna().any():
+        best_lap_number = int(laps["lap_duration_num"].idxmin())
+        best_lap = laps.loc[best_lap_number]
     else:
-        snap = intervals.groupby("driver_number").tail(1)
-
-    positions = pd.DataFrame(get_json(f"positions?session_key={session_key}"))
-    if not positions.empty and "driver_number" in positions.columns and "position" in positions.columns:
-        if "date" in positions.columns:
-            pos_snap = positions.sort_values("date").groupby("driver_number").tail(1)
-        else:
-            pos_snap = positions.groupby("driver_number").tail(1)
-
-        merged = pos_snap[["driver_number", "position"]].merge(
-            snap[[c for c in snap.columns if c in ["driver_number", "gap_to_leader", "interval"]]],
-            on="driver_number",
-            how="left"
-        ).sort_values("position")
-
-        me = merged[merged["driver_number"] == driver_number]
-        if not me.empty:
-            my_pos = int(me.iloc[0]["position"]) if pd.notna(me.iloc[0]["position"]) else None
-            gap_leader = safe_str(me.iloc[0].get("gap_to_leader"), "--")
-            gap_ahead = safe_str(me.iloc[0].get("interval"), "--")
+        best_lap = None
+        best_lap_number = None
+    return current_lap, previous_lap, current_lap_number, best_lap, best_lap_number
 
-            if my_pos is not None:
-                ahead = merged[merged["position"] == my_pos - 1]
-                behind = merged[merged["position"] == my_pos + 1]
+def tire_at(snap: SessionSnapshot, driver_num: int, lap_number):
+    compound, _ = snap.stints.at(driver_num, lap_number)
+    return safe_str(compound)
 
-                if not ahead.empty:
-                    ahead_number = int(ahead.iloc[0]["driver_number"])
-                    driver_ahead = acronym_for(drivers_full, ahead_number)
-
-                if not behind.empty:
-                    behind_number = int(behind.iloc[0]["driver_number"])
-                    driver_behind = acronym_for(drivers_full, behind_number)
-                    gap_behind = safe_str(behind.iloc[0].get("interval"), "--")
+# -----------------------------
+# GAPS via /intervals + /positions + capture ahead/behind driver_numbers
+# -----------------------------
+def race_gaps(snap: SessionSnapshot, driver_num: int):
+    with metrics().span("merge:gaps"):
+        return _race_gaps(snap, driver_num)
+
+def _race_gaps(snap: SessionSnapshot, driver_num: int):
+    gaps = {
+        "my_pos": None,
+        "gap_leader": "--",
+        "driver_ahead": "-",
+        "gap_ahead": "--",
+        "ahead_number": None,
+        "driver_behind": "-",
+        "gap_behind": "--",
+        "behind_number": None,
+    }
+    latest = snap.intervals
+    pos_latest = snap.positions
+    if latest.empty or "driver_number" not in latest.columns:
+        return gaps
+    if pos_latest.empty or "driver_number" not in pos_latest.columns or "position" not in pos_latest.columns:
+        return gaps
+
+    merged = pos_latest[["driver_number", "position"]].merge(
+        latest[[c for c in latest.columns if c in ["driver_number", "gap_to_leader", "laps_down", "interval", "interval_laps"]]],
+        on="driver_number",
+        how="left"
+    ).sort_values("position")
+
+    me = merged[merged["driver_number"] == driver_num]
+    if me.empty:
+        return gaps
+    my_pos = int(me.iloc[0]["position"]) if pd.notna(me.iloc[0]["position"]) else None
+    gaps["my_pos"] = my_pos
+    gaps["gap_leader"] = gap_text(me.iloc[0].get("gap_to_leader"), me.iloc[0].get("laps_down"))
+    gaps["gap_ahead"] = gap_text(me.iloc[0].get("interval"), me.iloc[0].get("interval_laps"))
+
+    if my_pos is not None:
+        ahead = merged[merged["position"] == my_pos - 1]
+        behind = merged[merged["position"] == my_pos + 1]
+
+        if not ahead.empty:
+            gaps["ahead_number"] = int(ahead.iloc[0]["driver_number"])
+            gaps["driver_ahead"] = snap.drivers.acronym(gaps["ahead_number"])
+
+        if not behind.empty:
+            gaps["behind_number"] = int(behind.iloc[0]["driver_number"])
+            gaps["driver_behind"] = snap.drivers.acronym(gaps["behind_number"])
+            gaps["gap_behind"] = gap_text(behind.iloc[0].get("interval"), behind.iloc[0].get("interval_laps"))
+    return gaps
 
 # -----------------------------
 # Stint timeline: markers only (HTML only; never printed as text)
@@ -668,20 +1016,20 @@ def stint_timeline_html(stints_df: pd.DataFrame, total_laps_hint: int, current_l
     if stints_df.empty or not all(c in stints_df.columns for c in ["lap_start", "lap_end", "compound"]):
         return "<div class='timelineWrap'><div style='color:rgba(255,255,255,0.55);'>No stint data available.</div></div>"
 
-    df = stints_df.sort_values("lap_start").copy()
+    # Already in lap order; an open stint runs to the current lap
+    starts = stints_df["lap_start"].to_numpy(dtype=int)
+    ends = np.minimum(stints_df["lap_end"].to_numpy(dtype=float), max(current_lap_num, starts[-1])).astype(int)
 
     if total_laps_hint and isinstance(total_laps_hint, (int, float)) and total_laps_hint > 0:
         total = int(total_laps_hint)
     else:
-        total = int(max(df["lap_end"].max(), current_lap_num))
+        total = int(max(ends.max(), current_lap_num))
 
     segs, markers = [], []
 
-    first_ls = int(df.iloc[0]["lap_start"])
-    for _, r in df.iterrows():
-        ls = int(r["lap_start"])
-        le = int(r["lap_end"])
-        comp = safe_str(r["compound"], "-").upper()
+    first_ls = int(starts[0])
+    for ls, le, comp in zip(starts.tolist(), ends.tolist(), stints_df["compound"].tolist()):
+        comp = safe_str(comp, "-").upper()
         color = tire_color(comp)
 
         length = max(le - ls + 1, 1)
@@ -713,37 +1061,236 @@ def stint_timeline_html(stints_df: pd.DataFrame, total_laps_hint: int, current_l
 """
     return textwrap.dedent(html).strip()
 
+# -----------------------------
+# Timing tower: the whole field, one row per driver
+# -----------------------------
+@st.cache_resource(max_entries=8)
+def timing_tower(session_key_int: int):
+    # Shared by every viewer; each update only rewrites the columns whose
+    # source (positions, intervals, laps, stints) changed.
+    return TimingTower()
+
+@st.cache_resource(max_entries=8)
+def race_state(session_key_int: int):
+    # Shared by every viewer; grows by the laps completed since the last
+    # update, so moving the lap slider is only a lookup.
+    return RaceState()
+
+def format_gap(seconds, laps_down=0, position=None):
+    if position == 1:
+        return "LEADER"
+    if pd.notna(laps_down) and laps_down > 0:
+        return gap_text(seconds, laps_down)
+    return f"+{seconds:.3f}" if pd.notna(seconds) else "--"
+
+def timing_tower_html(tower: pd.DataFrame, registry, highlight: int):
+    rows = []
+    for r in tower.itertuples():
+        info = registry.get(r.Index)
+        acronym = safe_str(info.acronym) if info is not None else str(r.Index)
+        colour = normalize_hex_color(info.colour) if info is not None else "#888888"
+        position = int(r.position) if pd.notna(r.position) else None
+        compound = safe_str(r.compound, "-").upper()
+        tyre = "-" if compound == "-" else f"{compound[:1]} {int(r.tyre_age) if pd.notna(r.tyre_age) else '-'}"
+        rows.append(
+            f"<tr class='{'me' if r.Index == highlight else ''}'>"
+            f"<td>{position or '-'}</td>"
+            f"<td><span class='towerStripe' style='background:{colour};'></span>{acronym}</td>"
+            f"<td>{format_gap(r.gap_to_leader, r.laps_down, position)}</td>"
+            f"<td>{'--' if position == 1 else format_gap(r.interval, r.interval_laps)}</td>"
+            f"<td>{format_lap_time(r.last_lap)}</td>"
+            f"<td>{format_lap_time(r.best_lap)}</td>"
+            f"<td><span class='tireDot' style='background:{tire_color(compound)};'></span>{tyre}</td>"
+            "</tr>"
+        )
+    head = "".join(f"<th>{h}</th>" for h in ["POS", "DRIVER", "GAP", "INT", "LAST", "BEST", "TYRE"])
+    return f"<table class='tower'><thead><tr>{head}</tr></thead><tbody>{''.join(rows)}</tbody></table>"
+
+# -----------------------------
+# Pace & degradation (session-wide, updated lap by lap)
+# -----------------------------
+@st.cache_resource(max_entries=8)
+def lap_analytics(session_key_int: int):
+    return LapAnalytics(session_key_int)
+
+def degradation_html(deg: pd.DataFrame):
+    if deg.empty:
+        return "<div style='color:rgba(255,255,255,0.55);'>Not enough clean laps yet.</div>"
+    cells = []
+    for (_, stint), r in zip(deg.index, deg.itertuples()):
+        compound = safe_str(r.compound, "-")
+        slope = f"{r.slope:+.3f} s/lap" if pd.notna(r.slope) else "--"
+        cells.append(
+            f"<div class='gapCell'><div class='gapDir'><span class='tireDot' style='background:{tire_color(compound)};'></span>"
+            f"Stint {int(stint)} • {compound}</div><div class='gapVal'>{slope}</div>"
+            f"<div class='small-note'>{r.laps} clean laps • pace {format_lap_time(r.pace)}</div></div>"
+        )
+    return f"<div class='gapGrid'>{''.join(cells)}</div>"
+
 # -----------------------------
 # Lap Trend Chart (Compare: Me vs Ahead vs Behind)
 # -----------------------------
-@st.cache_data(ttl=10)
-def load_driver_laps(session_key_int: int, driver_num_int: int):
-    df = pd.DataFrame(get_json(f"laps?session_key={session_key_int}&driver_number={driver_num_int}"))
-    if df.empty or "lap_number" not in df.columns:
-        return df
-    df = df.sort_values("lap_number")
-    if "lap_duration" in df.columns:
-        df["lap_duration_num"] = pd.to_numeric(df["lap_duration"], errors="coerce")
-    elif "lap_time" in df.columns:
-        df["lap_duration_num"] = pd.to_numeric(df["lap_time"], errors="coerce")
-    else:
-        df["lap_duration_num"] = pd.NA
-    return df[["lap_number", "lap_duration_num"]].dropna(subset=["lap_duration_num"])
+def lap_chart_layout(fig):
+    plotly_force_dark(fig)
+    fig.update_layout(height=380, legend_title_text="", xaxis_title="lap_number", yaxis_title="lap_duration_num")
+
+@st.cache_resource(max_entries=32)
+def lap_chart(session_key_int: int, numbers: tuple):
+    # One persistent figure per (session, driver set); each refresh only
+    # appends the laps completed since the last one. Keyed on the numbers
+    # alone: labels change with every overtake and are set at draw time.
+    return LapChart(numbers, layout=lap_chart_layout)
 
 # -----------------------------
-# Render Broadcast Header + Cards
+# Pace across sessions: the whole weekend, or this circuit every season
 # -----------------------------
-cur_time_str = format_lap_time(current_lap.get("lap_duration_num"))
-prev_time_str = format_lap_time(previous_lap.get("lap_duration_num")) if previous_lap is not None else "--"
-best_time_str = format_lap_time(best_lap.get("lap_duration_num")) if best_lap is not None else "--"
+@st.cache_resource
+def lap_store():
+    # Clean laps of every session anyone has compared, parsed once per process
+    return LapStore()
+
+def session_over(date_end, settle_hours: float = 1.0):
+    end = pd.to_datetime(date_end, utc=True, errors="coerce")
+    return pd.notna(end) and end < pd.Timestamp.now(tz="UTC") - pd.Timedelta(hours=settle_hours)
+
+def weekend_sessions():
+    """(label, session_key, date_end) for every session of the selected meeting."""
+    return [
+        (safe_str(r.get("session_name"), "Session"), int(r["session_key"]), r.get("date_end"))
+        for _, r in sessions_df.iterrows()
+        if pd.notna(r.get("session_key"))
+    ]
+
+def circuit_sessions(meeting_key: int, name: str):
+    """(label, session_key, date_end) for the session called `name` at this meeting's circuit, one per season."""
+    return uncached_on_failure(cached_circuit_sessions, meeting_key, name)
+
+@st.cache_data(ttl=6*60*60, max_entries=64)
+def cached_circuit_sessions(meeting_key: int, name: str):
+    # Cached per meeting: the season-by-season session lists are looked up
+    # once, not on every rerun of the compare card. A season whose list did
+    # not load leaves the result uncached.
+    meetings = load_meetings()
+    column = next((c for c in ("circuit_key", "circuit_short_name", "location") if c in meetings.columns), None)
+    current = meetings[meetings["meeting_key"] == meeting_key]
+    if column is None or current.empty:
+        return []
+    same = meetings[meetings[column] == current.iloc[0][column]].sort_values("year")
+    out, complete = [], True
+    for _, m in same.iterrows():
+        try:
+            sessions = cached_sessions_for_meeting(int(m["meeting_key"]))
+        except NotCached:
+            complete = False
+            continue
+        if sessions.empty or "session_name" not in sessions.columns:
+            continue
+        match = sessions[sessions["session_name"] == name]
+        if not match.empty and pd.notna(match.iloc[0].get("session_key")):
+            row = match.iloc[0]
+            out.append((f"{m['year']} {name}", int(row["session_key"]), row.get("date_end")))
+    if not complete:
+        raise NotCached(out)
+    return out
+
+def session_compare_figure(bands: pd.DataFrame, sessions, numbers):
+    # Box per (session, driver) from the precomputed percentiles: the box is
+    # p25–p75, whiskers p10–p90
+    labels = {key: label for label, key, _ in sessions}
+    fig = go.Figure()
+    present = set(bands.index.get_level_values("driver_number"))
+    for number in numbers:
+        if number not in present:
+            continue
+        b = bands.xs(number, level="driver_number")
+        d = drivers.get(number)
+        fig.add_trace(go.Box(
+            x=[labels[k] for k in b.index],
+            lowerfence=b["p10"], q1=b["p25"], median=b["p50"], q3=b["p75"], upperfence=b["p90"],
+            name=d.acronym if d is not None else str(number),
+            marker_color=normalize_hex_color(d.colour) if d is not None else None,
+            customdata=b["laps"], hovertemplate="%{x}<br>median %{median:.3f}s • %{customdata} laps",
+        ))
+    plotly_force_dark(fig)
+    fig.update_layout(
+        boxmode="group", height=380, legend_title_text="", yaxis_title="clean lap (s)",
+        xaxis=dict(categoryorder="array", categoryarray=[label for label, _, _ in sessions]),
+    )
+    return fig
 
-pos_pill = f"P{my_pos}" if my_pos is not None else "P-"
-lap_pill = f"LAP {current_lap_number}/{total_laps}" if total_laps else f"LAP {current_lap_number}"
+# -----------------------------
+# Car telemetry (car_data + location), last few laps only
+# -----------------------------
+TELEMETRY_LAPS = 3
+
+@st.cache_resource(max_entries=8)
+def telemetry_poller(session_key_int: int, driver_num: int):
+    # One poll loop per (session, driver) for every viewer; fragments only read its buffers
+    capacity = samples_for_laps(TELEMETRY_LAPS)
+    feeds = {ep: TelemetryFeed(ep, session_key_int, driver_num, capacity) for ep in TELEMETRY_FIELDS}
+    return TelemetryPoller(feeds, fetch_openf1)
+
+def telemetry_since(snap: SessionSnapshot, driver_num: int):
+    # Start the first download at the lap TELEMETRY_LAPS back, not lap 1
+    laps = snap.laps.driver(driver_num)
+    if "date_start" not in laps.columns:
+        return None
+    starts = laps["date_start"].dropna().to_numpy()
+    return str(iso_dates(starts[-min(TELEMETRY_LAPS, len(starts))])) if len(starts) else None
+
+def telemetry_figure(car: np.ndarray, max_points: int = 600):
+    keep = lttb(car["t"], car["speed"].astype("float64"), max_points)
+    car = car[keep]
+    t = car["t"] - car["t"][-1]
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.6, 0.4], vertical_spacing=0.06)
+    fig.add_scatter(x=t, y=car["speed"], name="Speed (km/h)", mode="lines", row=1, col=1)
+    fig.add_scatter(x=t, y=car["throttle"], name="Throttle %", mode="lines", row=2, col=1)
+    fig.add_scatter(x=t, y=car["brake"], name="Brake", mode="lines", row=2, col=1)
+    plotly_force_dark(fig)
+    fig.update_layout(height=360, legend_title_text="", xaxis2_title="seconds")
+    return fig
 
-current_tire_dot = tire_color(current_tire)
-best_tire_dot = tire_color(best_lap_tire)
+def track_map_figure(loc: np.ndarray, max_points: int = 600):
+    step = max(len(loc) // max_points, 1)
+    loc = loc[::step]
+    fig = go.Figure(go.Scatter(x=loc["x"], y=loc["y"], mode="lines", name="Track", hoverinfo="skip"))
+    fig.add_scatter(x=loc["x"][-1:], y=loc["y"][-1:], mode="markers", marker=dict(size=12, color=team_colour), name=acr)
+    plotly_force_dark(fig)
+    fig.update_layout(height=360, showlegend=False, yaxis=dict(scaleanchor="x", visible=False), xaxis=dict(visible=False))
+    return fig
 
-st.markdown(f"""
+# -----------------------------
+# Render Broadcast Header + Cards
+# Each live card is a fragment with its own timer: a refresh reruns only
+# that card against the shared snapshot, never the selectors and header.
+# -----------------------------
+@st.cache_resource
+def render_cache():
+    # Markup for unchanged inputs is reused as-is; Streamlit still needs each
+    # element re-emitted on a fragment rerun, or it would clear it.
+    return RenderCache()
+
+def live_fragment(every: float = 0):
+    fragment = st.fragment(run_every=max(refresh_seconds, every) if refresh_seconds > 0 else None)
+
+    def timed(render):
+        @functools.wraps(render)
+        def run():
+            with metrics().span(f"card:{render.__name__.removeprefix('render_')}"):
+                return render()
+        return fragment(run)
+    return timed
+
+def cached_html(name: str, inputs, build):
+    with metrics().span(f"html:{name}"):
+        return render_cache().render(name, inputs, build)
+
+def topbar_html(location, session_name, acr, driver_number, team, team_colour, full_name, pos_pill, lap_pill,
+                current_tire, best_lap_tire, gap_leader, driver_ahead, gap_ahead, driver_behind, gap_behind, cur_time_str, prev_time_str,
+                best_time_str, best_lap_number):
+    current_tire_dot = tire_color(current_tire)
+    best_tire_dot = tire_color(best_lap_tire)
+    return f"""
 <div class="topbar">
   <div class="leftBlock">
     <div class="driverBadge">
@@ -777,10 +1324,10 @@ st.markdown(f"""
     <div class="kpi"><div class="kpiLabel">Driver</div><div class="kpiValue">{safe_str(full_name, acr)}</div><div class="small-note">{safe_str(team)}</div></div>
   </div>
 </div>
-""", unsafe_allow_html=True)
+"""
 
-# Gaps card
-st.markdown(f"""
+def gaps_html(gap_leader, driver_ahead, gap_ahead, driver_behind, gap_behind):
+    return f"""
 <div class="card" style="margin-top:12px;">
   <div class="sectionTitle">📏 Gaps</div>
   <div class="gapGrid">
@@ -789,71 +1336,285 @@ st.markdown(f"""
     <div class="gapCell"><div class="gapDir">⬇ {safe_str(driver_behind, "-")}</div><div class="gapVal">{safe_str(gap_behind, "--")}</div></div>
   </div>
 </div>
+"""
+
+@live_fragment()
+def render_header_cards():
+    snap = current_snapshot()
+    laps = snap.laps.driver(driver_number)
+    if laps.empty:
+        st.info("Waiting for lap data…")
+        return
+    current_lap, previous_lap, current_lap_number, best_lap, best_lap_number = lap_summary(laps)
+    current_tire = tire_at(snap, driver_number, current_lap_number)
+    best_lap_tire = tire_at(snap, driver_number, best_lap_number)
+    gaps = race_gaps(snap, driver_number)
+    my_pos = gaps["my_pos"]
+    gap_leader, gap_ahead, gap_behind = gaps["gap_leader"], gaps["gap_ahead"], gaps["gap_behind"]
+    driver_ahead, driver_behind = gaps["driver_ahead"], gaps["driver_behind"]
+
+    cur_time_str = format_lap_time(current_lap.get("lap_duration_num"))
+    prev_time_str = format_lap_time(previous_lap.get("lap_duration_num")) if previous_lap is not None else "--"
+    best_time_str = format_lap_time(best_lap.get("lap_duration_num")) if best_lap is not None else "--"
+
+    pos_pill = f"P{my_pos}" if my_pos is not None else "P-"
+    lap_pill = f"LAP {current_lap_number}/{total_laps}" if total_laps else f"LAP {current_lap_number}"
+
+    topbar = dict(
+        location=location, session_name=session_name, acr=acr, driver_number=driver_number, team=team, team_colour=team_colour, full_name=full_name,
+        pos_pill=pos_pill, lap_pill=lap_pill, current_tire=current_tire, best_lap_tire=best_lap_tire,
+        gap_leader=gap_leader, driver_ahead=driver_ahead, gap_ahead=gap_ahead,
+        driver_behind=driver_behind, gap_behind=gap_behind, cur_time_str=cur_time_str,
+        prev_time_str=prev_time_str, best_time_str=best_time_str, best_lap_number=best_lap_number,
+    )
+    st.markdown(cached_html("topbar", topbar, lambda: topbar_html(**topbar)), unsafe_allow_html=True)
+
+    # Gaps card
+    gap_inputs = dict(gap_leader=gap_leader, driver_ahead=driver_ahead, gap_ahead=gap_ahead,
+                      driver_behind=driver_behind, gap_behind=gap_behind)
+    st.markdown(cached_html("gaps", gap_inputs, lambda: gaps_html(**gap_inputs)), unsafe_allow_html=True)
+
+@live_fragment()
+def render_timing_tower():
+    snap = current_snapshot()
+    with metrics().span("merge:timing_tower"):
+        tower = timing_tower(int(session_key)).update(snap)
+    if tower.empty:
+        return
+    tower_html = cached_html(
+        "timing_tower", (int(session_key), tower, snap.drivers, driver_number),
+        lambda: timing_tower_html(tower, snap.drivers, driver_number),
+    )
+    st.markdown(f"""
+<div class="card" style="margin-top:12px;">
+  <div class="sectionTitle">🗼 Timing Tower</div>
+  {tower_html}
+</div>
+""", unsafe_allow_html=True)
+
+@live_fragment(POLL_SCHEDULE["laps"])
+def render_race_rewind():
+    snap = current_snapshot()
+    feeds = live_feeds(int(session_key))
+    with metrics().span("merge:race_state"):
+        state = race_state(int(session_key))
+        last_lap = state.update(snap.laps, snap.stints, feeds["intervals"], feeds["positions"])
+    if last_lap < 2:
+        return
+    # Stay on the newest lap until the viewer scrubs back; keep the pick in range
+    chosen = st.session_state.get("rewind_lap")
+    if chosen is None or chosen == st.session_state.get("rewind_max") or chosen > last_lap:
+        st.session_state["rewind_lap"] = last_lap
+    st.session_state["rewind_max"] = last_lap
+    lap = st.slider("Rewind to lap", 1, last_lap, key="rewind_lap")
+    standings = state.at(lap)
+    rewind_html = cached_html(
+        "race_state", (int(session_key), standings, snap.drivers, driver_number),
+        lambda: timing_tower_html(standings, snap.drivers, driver_number),
+    )
+    st.markdown(f"""
+<div class="card" style="margin-top:12px;">
+  <div class="sectionTitle">⏪ Standings at lap {lap}</div>
+  {rewind_html}
+</div>
 """, unsafe_allow_html=True)
 
-# Stint timeline card (render HTML safely)
-timeline_html = stint_timeline_html(stints, int(total_laps) if total_laps else 0, current_lap_number)
-st.markdown(f"""
+@live_fragment(POLL_SCHEDULE["stints"])
+def render_stint_card():
+    snap = current_snapshot()
+    laps = snap.laps.driver(driver_number)
+    current_lap_number = int(laps.index[-1]) if not laps.empty else 0
+
+    # Stint timeline card (render HTML safely)
+    stints = snap.stints.driver(driver_number)
+    total = int(total_laps) if total_laps else 0
+    timeline_html = cached_html(
+        "stint_timeline", (stints, total, current_lap_number),
+        lambda: stint_timeline_html(stints, total, current_lap_number),
+    )
+    st.markdown(f"""
 <div class="card" style="margin-top:12px;">
   <div class="sectionTitle">🛞 Stint Timeline</div>
   {timeline_html}
 </div>
 """, unsafe_allow_html=True)
 
-# Lap Time Evolution (Comparison Chart)
-st.markdown("<div class='card' style='margin-top:12px;'>", unsafe_allow_html=True)
-st.markdown("<div class='sectionTitle'>📊 Lap Time Evolution (Comparison)</div>", unsafe_allow_html=True)
-
-series = []
-
-me_df = load_driver_laps(int(session_key), int(driver_number))
-if not me_df.empty:
-    me_df = me_df.copy()
-    me_df["Driver"] = f"{acr} (You)"
-    series.append(me_df)
-
-if ahead_number is not None:
-    a_df = load_driver_laps(int(session_key), int(ahead_number))
-    if not a_df.empty:
-        a_df = a_df.copy()
-        a_df["Driver"] = f"{driver_ahead} (Ahead)"
-        series.append(a_df)
-
-if behind_number is not None:
-    b_df = load_driver_laps(int(session_key), int(behind_number))
-    if not b_df.empty:
-        b_df = b_df.copy()
-        b_df["Driver"] = f"{driver_behind} (Behind)"
-        series.append(b_df)
-
-if not series:
-    st.info("No lap data available to compare.")
-else:
-    plot_df = pd.concat(series, ignore_index=True)
-    plot_df = plot_df[plot_df["lap_number"] <= current_lap_number]
-
-    fig = px.line(
-        plot_df,
-        x="lap_number",
-        y="lap_duration_num",
-        color="Driver",
+@live_fragment(POLL_SCHEDULE["laps"])
+def render_pace_card():
+    snap = current_snapshot()
+    analytics = lap_analytics(int(session_key))
+    with metrics().span("analytics"):
+        analytics.update(snap.laps, snap.stints)
+    deg = analytics.degradation()
+    mine = deg.xs(driver_number, level="driver_number", drop_level=False) if driver_number in deg.index.get_level_values(0) else deg.iloc[:0]
+    laps = analytics.frame()
+    pace = laps.loc[driver_number, "rolling_pace"].dropna() if driver_number in laps.index.get_level_values(0) else pd.Series(dtype=float)
+    pace_note = f"Rolling pace ({analytics.window} clean laps): {format_lap_time(pace.iloc[-1])}" if not pace.empty else ""
+    st.markdown(f"""
+<div class="card" style="margin-top:12px;">
+  <div class="sectionTitle">📉 Tyre Degradation (fuel-corrected)</div>
+  {degradation_html(mine)}
+  <div class="small-note">{pace_note}</div>
+</div>
+""", unsafe_allow_html=True)
+
+@live_fragment(10)
+def render_lap_chart():
+    snap = current_snapshot()
+    gaps = race_gaps(snap, driver_number)
+
+    # Lap Time Evolution (Comparison Chart)
+    st.markdown("<div class='card' style='margin-top:12px;'>", unsafe_allow_html=True)
+    st.markdown("<div class='sectionTitle'>📊 Lap Time Evolution (Comparison)</div>", unsafe_allow_html=True)
+
+    series = [(driver_number, f"{acr} (You)")]
+    if gaps["ahead_number"] is not None:
+        series.append((gaps["ahead_number"], f"{gaps['driver_ahead']} (Ahead)"))
+    if gaps["behind_number"] is not None:
+        series.append((gaps["behind_number"], f"{gaps['driver_behind']} (Behind)"))
+    shown = {number for number, _ in series}
+    extra = st.multiselect(
+        "Compare with",
+        [label for label, number in driver_map.items() if number not in shown],
+        key="compare_with",
     )
-    fig = plotly_force_dark(fig)
-    fig.update_layout(height=380, legend_title_text="")
-    st.plotly_chart(fig, use_container_width=True)
+    series += [(driver_map[label], label) for label in extra]
+
+    chart = lap_chart(int(session_key), tuple(sorted(number for number, _ in series)))
+    with metrics().span("figure:lap_chart"):
+        chart.update(snap.laps, snap.stints)
+    mine = snap.laps.driver(driver_number)
+    with chart.lock:
+        fig = chart.show(series, last_lap=int(mine.index[-1]) if not mine.empty else None)
+        if not any(len(trace.x) for trace in fig.data):
+            st.info("No lap data available to compare.")
+        else:
+            st.plotly_chart(fig, use_container_width=True)
+
+    st.markdown("</div>", unsafe_allow_html=True)
 
-st.markdown("</div>", unsafe_allow_html=True)
+@live_fragment(POLL_SCHEDULE["laps"])
+def render_session_compare():
+    st.markdown("<div class='card' style='margin-top:12px;'>", unsafe_allow_html=True)
+    st.markdown("<div class='sectionTitle'>🧮 Pace Across Sessions</div>", unsafe_allow_html=True)
+
+    scope = st.radio("Compare", ["This weekend", "This circuit, every season"], horizontal=True, key="compare_scope")
+    # Opt-in: nothing is loaded for the comparison until a driver is picked
+    picked = st.multiselect("Drivers", list(driver_map), default=[], key="compare_drivers",
+                            placeholder="Pick drivers to compare their pace across sessions")
+    numbers = [driver_map[label] for label in picked]
+    if not numbers:
+        st.markdown("</div>", unsafe_allow_html=True)
+        return
+    sessions = weekend_sessions() if scope == "This weekend" else circuit_sessions(int(sel_meeting_key), session_name)
+    if not sessions:
+        st.info("No other sessions to compare yet.")
+        st.markdown("</div>", unsafe_allow_html=True)
+        return
+
+    keys = [key for _, key, _ in sessions]
+    with metrics().span("compare:load"):
+        failures = lap_store().load(keys, fetch_openf1, live=[key for _, key, end in sessions if not session_over(end)])
+    if 401 not in failures.values() or get_openf1_token():
+        report_failures(failures, limit=1)
+    with metrics().span("compare:aggregate"):
+        columns = lap_store().columns(keys)
+        bands = pace_bands(columns, numbers)
+        stints = stint_pace(columns, numbers)
+
+    if bands.empty:
+        st.info("No clean laps for these drivers in these sessions yet.")
+    else:
+        with metrics().span("figure:compare"):
+            fig = session_compare_figure(bands, sessions, numbers)
+        st.plotly_chart(fig, use_container_width=True)
+        labels = {key: label for label, key, _ in sessions}
+        order = {key: i for i, key in enumerate(keys)}
+        stints = stints.sort_values("session_key", key=lambda k: k.map(order), kind="stable")
+        st.dataframe(
+            pd.DataFrame({
+                "Session": stints["session_key"].map(labels),
+                "Driver": stints["driver_number"].map(lambda n: drivers.get(n).acronym if drivers.get(n) else str(n)),
+                "Stint": stints["stint_number"],
+                "Compound": stints["compound"].fillna("-"),
+                "Laps": stints["laps"],
+                "Median": stints["median"].map(lambda v: f"{v:.3f}"),
+            }),
+            hide_index=True, use_container_width=True,
+        )
+
+    st.markdown("</div>", unsafe_allow_html=True)
 
-# Race progress
-if total_laps:
+@live_fragment(TELEMETRY_POLL)
+def render_telemetry():
+    snap = current_snapshot()
+    poller = telemetry_poller(int(session_key), driver_number)
+    samples = poller.samples(telemetry_since(snap, driver_number), live=refresh_seconds > 0)
+    for endpoint, status in poller.status.items():
+        if status != 200 and debug:
+            st.caption(f"GET {OPENF1_BASE}/{poller.feeds[endpoint].query(poller.since)} → {status}")
+    car, loc = samples["car_data"], samples["location"]
+
+    st.markdown("<div class='card' style='margin-top:12px;'>", unsafe_allow_html=True)
+    st.markdown(f"<div class='sectionTitle'>📡 Car Telemetry (last {TELEMETRY_LAPS} laps)</div>", unsafe_allow_html=True)
+    if not len(car) and not len(loc):
+        st.info("No telemetry available for this driver/session.")
+    else:
+        col_trace, col_map = st.columns([3, 2])
+        with col_trace:
+            if len(car):
+                with metrics().span("figure:telemetry"):
+                    fig = telemetry_figure(car)
+                st.plotly_chart(fig, use_container_width=True)
+                latest = car[-1]
+                st.caption(f"{latest['speed']:.0f} km/h • gear {latest['n_gear']} • {latest['rpm']:.0f} rpm • DRS {latest['drs']}")
+        with col_map:
+            if len(loc):
+                st.plotly_chart(track_map_figure(loc), use_container_width=True)
+    st.markdown("</div>", unsafe_allow_html=True)
+
+@live_fragment(10)
+def render_race_progress():
+    if not total_laps:
+        return
+    laps = current_snapshot().laps.driver(driver_number)
+    current_lap_number = int(laps.index[-1]) if not laps.empty else 0
     st.markdown("<div class='card' style='margin-top:12px;'><div class='sectionTitle'>🏁 Race Progress</div></div>",
                 unsafe_allow_html=True)
     st.progress(min(current_lap_number / total_laps, 1.0))
     st.caption(f"Lap {current_lap_number} / {total_laps}")
 
+render_header_cards()
+render_timing_tower()
+render_race_rewind()
+render_stint_card()
+render_pace_card()
+render_lap_chart()
+render_session_compare()
+render_telemetry()
+render_race_progress()
+
 st.markdown("</div>", unsafe_allow_html=True)  # end container
 
-# Auto refresh
-if refresh_seconds > 0:
-    time.sleep(refresh_seconds)
-    st.rerun()
+metrics().observe("script", time.perf_counter() - _script_started)
+
+if debug:
+    spans = metrics().spans()
+    if spans:
+        st.caption("Timing breakdown (per stage)")
+        st.dataframe(pd.DataFrame.from_dict(spans, orient="index").sort_values("avg_ms", ascending=False),
+                     use_container_width=True)
+    http_stats = openf1_http().stats()
+    if http_stats:
+        st.caption("OpenF1 transport (per endpoint)")
+        st.dataframe(pd.DataFrame.from_dict(http_stats, orient="index"), use_container_width=True)
+    renders = render_cache().stats()
+    if renders:
+        st.caption("HTML render cache (per fragment)")
+        st.dataframe(pd.DataFrame.from_dict(renders, orient="index"), use_container_width=True)
+    sched = openf1_http().scheduler.stats()
+    st.caption(" • ".join(f"{k}: {v}" for k, v in sched.items()))
+    if prefetcher() is not None:
+        st.caption("Prefetch • " + " • ".join(f"{k}: {v}" for k, v in prefetcher().stats().items()))
+    with st.expander("Prometheus metrics"):
+        st.code(metrics().prometheus_text(), language="text")
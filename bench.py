@@ -0,0 +1,416 @@
+"""Headless benchmark of app.py against a synthetic full-race session.
+
+Generates realistic OpenF1 payloads (by default 20 drivers, 70 laps,
+interval rows every ~4 s, two or three stints per driver), writes them as a
+replay log and runs the script under Streamlit's AppTest with
+F1_REPLAY_PATH pointing at it, so every `get_json` / `fetch_openf1` call is
+answered locally. Each scenario reports wall time, peak traced memory and
+the memory blocks it left allocated, plus the per-stage spans the app
+records (fetches, snapshot, merges, HTML fragments, figure builds).
+Results are appended to bench_output.txt under the current commit so runs
+can be compared across commits.
+
+    python bench.py [--drivers 20] [--laps 70] [--reruns 5] [--no-memory] [--out bench_output.txt]
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from bisect import bisect_right
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+import numpy as np
+
+import metrics as metrics_module
+from json_stream import iso_dates
+from replay import ReplayPlayer
+from telemetry import SAMPLE_HZ
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+MEETING_KEY = 9001
+SESSION_KEY = 99001
+RACE_START = np.datetime64("2024-03-02T15:00:00", "us")
+
+DRIVERS = [
+    (1, "VER", "Max Verstappen", "Red Bull Racing", "3671C6"),
+    (11, "PER", "Sergio Perez", "Red Bull Racing", "3671C6"),
+    (16, "LEC", "Charles Leclerc", "Ferrari", "E8002D"),
+    (55, "SAI", "Carlos Sainz", "Ferrari", "E8002D"),
+    (44, "HAM", "Lewis Hamilton", "Mercedes", "27F4D2"),
+    (63, "RUS", "George Russell", "Mercedes", "27F4D2"),
+    (4, "NOR", "Lando Norris", "McLaren", "FF8000"),
+    (81, "PIA", "Oscar Piastri", "McLaren", "FF8000"),
+    (14, "ALO", "Fernando Alonso", "Aston Martin", "229971"),
+    (18, "STR", "Lance Stroll", "Aston Martin", "229971"),
+    (10, "GAS", "Pierre Gasly", "Alpine", "FF87BC"),
+    (31, "OCO", "Esteban Ocon", "Alpine", "FF87BC"),
+    (23, "ALB", "Alexander Albon", "Williams", "64C4FF"),
+    (2, "SAR", "Logan Sargeant", "Williams", "64C4FF"),
+    (22, "TSU", "Yuki Tsunoda", "RB", "6692FF"),
+    (3, "RIC", "Daniel Ricciardo", "RB", "6692FF"),
+    (77, "BOT", "Valtteri Bottas", "Kick Sauber", "52E252"),
+    (24, "ZHO", "Zhou Guanyu", "Kick Sauber", "52E252"),
+    (20, "MAG", "Kevin Magnussen", "Haas F1 Team", "B6BABD"),
+    (27, "HUL", "Nico Hulkenberg", "Haas F1 Team", "B6BABD"),
+]
+
+# Seconds lost per lap of tyre age, per compound
+DEGRADATION = {"SOFT": 0.085, "MEDIUM": 0.05, "HARD": 0.03}
+FUEL_GAIN = 0.055
+PIT_LOSS = 21.0
+
+
+def _dates(seconds):
+    """Seconds after the race start -> OpenF1 ISO date strings."""
+    offsets = np.round(np.asarray(seconds, dtype="float64") * 1e6).astype("timedelta64[us]")
+    return iso_dates(RACE_START + offsets).tolist()
+
+
+def _driver_list(n: int):
+    drivers = list(DRIVERS[:n])
+    for i in range(len(drivers), n):
+        drivers.append((30 + i, f"D{i:02d}", f"Driver {i}", f"Team {i // 2}", "888888"))
+    return drivers
+
+
+def _strategy(rng, n_laps: int, stops: int):
+    """Stint lap ranges and compounds for `stops` pit stops (fewer if the race is too short for them)."""
+    # Pit at the end of a lap that leaves at least one lap for the next stint
+    window = np.arange(max(n_laps // 6, 2), min(max(n_laps - 8, 3), n_laps))
+    stops = min(stops, len(window))
+    pits = sorted(rng.choice(window, size=stops, replace=False))
+    bounds = [1] + [int(p) + 1 for p in pits] + [n_laps + 1]
+    compounds = [rng.choice(["SOFT", "MEDIUM"])] + ["HARD" if i % 2 == 0 else "MEDIUM" for i in range(stops)]
+    return [(bounds[i], bounds[i + 1] - 1, str(compounds[i])) for i in range(stops + 1)]
+
+
+def synthetic_race(n_drivers: int = 20, n_laps: int = 70, interval_every: float = 4.0,
+                   telemetry_drivers: int = 2, seed: int = 7):
+    """OpenF1-shaped rows for one race: {endpoint: rows}, plus the race length in seconds.
+
+    Lap times follow a base pace per driver plus tyre degradation, fuel burn,
+    pit-out losses and noise. Intervals and gaps are derived from each car's
+    progress round the lap, so cars fall a lap down, positions change at pit
+    stops, and the interval stream looks like the live one.
+    """
+    rng = np.random.default_rng(seed)
+    drivers = _driver_list(n_drivers)
+    session = {
+        "session_key": SESSION_KEY, "meeting_key": MEETING_KEY, "session_name": "Race", "session_type": "Race",
+        "location": "Sakhir", "country_name": "Bahrain", "circuit_short_name": "Sakhir", "year": 2024,
+        "date_start": _dates([0])[0], "date_end": _dates([2 * 3600])[0], "total_laps": n_laps,
+    }
+    meeting = {
+        "meeting_key": MEETING_KEY, "year": 2024, "meeting_name": "Bahrain Grand Prix",
+        "meeting_official_name": "FORMULA 1 GULF AIR BAHRAIN GRAND PRIX 2024", "location": "Sakhir",
+        "date_start": session["date_start"], "circuit_short_name": "Sakhir",
+    }
+    driver_rows = [
+        {"session_key": SESSION_KEY, "driver_number": num, "name_acronym": acr, "broadcast_name": acr,
+         "full_name": name, "team_name": team, "team_colour": colour}
+        for num, acr, name, team, colour in drivers
+    ]
+
+    laps, stints = [], []
+    # Lap end times per driver, as seconds after the start: ends[k, lap - 1]
+    ends = np.zeros((n_drivers, n_laps))
+    lap_numbers = np.arange(1, n_laps + 1)
+    for k, (num, *_) in enumerate(drivers):
+        plan = _strategy(rng, n_laps, stops=1 + k % 2)
+        age = np.zeros(n_laps)
+        compound = np.empty(n_laps, dtype=object)
+        for i, (start, end, comp) in enumerate(plan):
+            age[start - 1:end] = np.arange(end - start + 1) + (0 if i == 0 else 2 * (k % 3 == 0))
+            compound[start - 1:end] = comp
+            stints.append({"session_key": SESSION_KEY, "driver_number": num, "stint_number": i + 1,
+                           "lap_start": start, "lap_end": end, "compound": comp,
+                           "tyre_age_at_start": 3 if i == 0 and comp == "SOFT" else 0})
+        pit_out = np.isin(lap_numbers, [start for start, _, _ in plan[1:]])
+        durations = (
+            92.0 + 0.08 * k
+            + np.array([DEGRADATION[c] for c in compound]) * age
+            - FUEL_GAIN * lap_numbers
+            + rng.normal(0.0, 0.25, n_laps)
+            + PIT_LOSS * pit_out
+        )
+        durations[0] += 6.0  # standing start
+        starts = 0.3 * k + np.concatenate([[0.0], np.cumsum(durations)[:-1]])
+        ends[k] = starts + durations
+        sectors = durations[:, None] * np.array([0.31, 0.36, 0.33])
+        speeds = rng.normal(305.0 - 0.4 * k, 3.0, n_laps)
+        for lap, date, dur, s, speed, out in zip(lap_numbers.tolist(), _dates(starts), durations.tolist(),
+                                                 sectors.tolist(), speeds.tolist(), pit_out.tolist()):
+            laps.append({
+                "session_key": SESSION_KEY, "driver_number": num, "lap_number": lap, "date_start": date,
+                "lap_duration": None if lap == 1 else round(dur, 3), "is_pit_out_lap": out,
+                "duration_sector_1": None if lap == 1 else round(s[0], 3),
+                "duration_sector_2": round(s[1], 3), "duration_sector_3": round(s[2], 3),
+                "i1_speed": round(speed * 0.9), "i2_speed": round(speed * 0.95), "st_speed": round(speed),
+            })
+
+    race_end = float(ends.max())
+    # Progress (laps completed, fractional) of every car at every tick
+    ticks = np.arange(0.0, race_end, interval_every)
+    starts = np.concatenate([0.3 * np.arange(n_drivers)[:, None], ends[:, :-1]], axis=1)
+    progress = np.empty((len(ticks), n_drivers))
+    for k in range(n_drivers):
+        progress[:, k] = np.interp(ticks, np.concatenate([[starts[k, 0]], ends[k]]), np.arange(n_laps + 1))
+
+    def time_at(k, p):
+        # When car k reached progress p
+        return np.interp(p, np.arange(n_laps + 1), np.concatenate([[starts[k, 0]], ends[k]]))
+
+    intervals, positions = [], []
+    last_pos = {}
+    jitter = rng.uniform(0.0, interval_every * 0.6, n_drivers)
+    for i, t in enumerate(ticks):
+        p = progress[i]
+        order = np.argsort(-p, kind="stable")
+        leader = order[0]
+        dates = _dates(t + jitter)
+        for rank, k in enumerate(order.tolist()):
+            num = drivers[k][0]
+            if rank == 0:
+                gap, interval = 0.0, 0.0
+            else:
+                down = int(p[leader] - p[k])
+                gap = f"+{down} LAP{'S' if down > 1 else ''}" if down >= 1 else round(t - time_at(leader, p[k]), 3)
+                interval = round(t - time_at(order[rank - 1], p[k]), 3)
+            intervals.append({"session_key": SESSION_KEY, "driver_number": num, "date": dates[k],
+                              "gap_to_leader": gap, "interval": interval})
+            if last_pos.get(num) != rank + 1:
+                last_pos[num] = rank + 1
+                positions.append({"session_key": SESSION_KEY, "driver_number": num, "date": dates[k],
+                                  "position": rank + 1})
+
+    data = {
+        "meetings": [meeting],
+        "sessions": [session],
+        "drivers": driver_rows,
+        "laps": laps,
+        "stints": stints,
+        "intervals": sorted(intervals, key=lambda r: r["date"]),
+        "positions": sorted(positions, key=lambda r: r["date"]),
+    }
+    for k, (num, *_) in enumerate(drivers[:telemetry_drivers]):
+        data[f"car_data/{num}"], data[f"location/{num}"] = _telemetry(rng, num, starts[k], ends[k], race_end)
+    return data, race_end
+
+
+def _telemetry(rng, num: int, starts, ends, race_end: float):
+    t = np.arange(0.0, race_end, 1.0 / SAMPLE_HZ) + rng.uniform(0.0, 0.1)
+    lap = np.clip(np.searchsorted(ends, t), 0, len(ends) - 1)
+    frac = np.clip((t - starts[lap]) / (ends[lap] - starts[lap]), 0.0, 1.0)
+    wave = np.abs(np.sin(2 * np.pi * 7 * frac))
+    speed = np.round(95 + 225 * wave + rng.normal(0, 3, len(t)))
+    throttle = np.where(wave > 0.35, 100, np.round(100 * wave))
+    brake = (wave < 0.2).astype(int) * 100
+    gear = np.clip(np.round(speed / 42), 1, 8).astype(int)
+    rpm = np.round(9000 + 2800 * wave)
+    drs = np.where((wave > 0.9) & (frac < 0.15), 12, 0)
+    dates = _dates(t)
+    car = [
+        {"session_key": SESSION_KEY, "driver_number": num, "date": d, "speed": s, "throttle": th, "brake": b,
+         "rpm": r, "n_gear": g, "drs": z}
+        for d, s, th, b, r, g, z in zip(dates, speed.tolist(), throttle.tolist(), brake.tolist(), rpm.tolist(),
+                                       gear.tolist(), drs.tolist())
+    ]
+    angle = 2 * np.pi * frac
+    location = [
+        {"session_key": SESSION_KEY, "driver_number": num, "date": d, "x": x, "y": y, "z": 0}
+        for d, x, y in zip(dates, np.round(3000 * np.cos(angle)).tolist(), np.round(1800 * np.sin(2 * angle)).tolist())
+    ]
+    return car, location
+
+
+def write_replay_log(path: str, data: dict, race_end: float, slice_seconds: float = 60.0, t0: float = 1.7e9):
+    """Write `data` as a ReplayRecorder log: reference endpoints once, date-stamped ones as `date>` deltas."""
+    reference = {
+        "meetings": "meetings",
+        "sessions": f"sessions?meeting_key={MEETING_KEY}",
+        "session": f"sessions?session_key={SESSION_KEY}",
+        "drivers": f"drivers?session_key={SESSION_KEY}",
+        "laps": f"laps?session_key={SESSION_KEY}",
+        "stints": f"stints?session_key={SESSION_KEY}",
+    }
+    streams = {"intervals": f"intervals?session_key={SESSION_KEY}", "positions": f"positions?session_key={SESSION_KEY}"}
+    for name in data:
+        if "/" in name:
+            endpoint, num = name.split("/")
+            streams[name] = f"{endpoint}?session_key={SESSION_KEY}&driver_number={num}"
+
+    bounds = np.arange(-1.0, race_end + slice_seconds, slice_seconds)
+    cutoffs = _dates(bounds)
+    with open(path, "w", encoding="utf-8") as f:
+        def record(t, endpoint, payload):
+            f.write(json.dumps({"t": t, "endpoint": endpoint, "status": 200, "payload": payload}) + "\n")
+
+        for name, endpoint in reference.items():
+            record(t0, endpoint, data["sessions" if name == "session" else name])
+        for name, endpoint in streams.items():
+            rows = data[name]
+            dates = [r["date"] for r in rows]
+            lo = 0
+            for i in range(1, len(bounds)):
+                hi = bisect_right(dates, cutoffs[i])
+                if hi > lo:
+                    record(t0 + bounds[i], f"{endpoint}&date>{quote(cutoffs[i - 1], safe=':')}", rows[lo:hi])
+                lo = hi
+
+
+class _RecordingMetrics(metrics_module.Metrics):
+    # Lets the benchmark read the app's (cache_resource) Metrics instance
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.instances.append(self)
+
+
+def _select(at, label: str, value):
+    box = next(s for s in at.selectbox if s.label == label)
+    if isinstance(value, int) and value not in box.options:
+        value = box.options[value]
+    return box.set_value(value)
+
+
+def _check(at, scenario: str):
+    if at.exception:
+        messages = "; ".join(e.message for e in at.exception)
+        raise RuntimeError(f"{scenario}: the script raised: {messages}")
+
+
+def run_scenarios(app_path: str, reruns: int, trace: bool):
+    """Run every scenario once through AppTest -> [(scenario, wall_ms, peak_kib, blocks, spans)].
+
+    Wall time is the mean over the scenario's repeats. With `trace`,
+    tracemalloc is on (which slows everything down, so those wall times are
+    not comparable with untraced ones): peak is the highest traced memory
+    above the starting point and blocks the net count of blocks still
+    allocated once the scenario has finished.
+    """
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    _RecordingMetrics.instances.clear()
+    at = AppTest.from_file(app_path, default_timeout=300)
+    results = []
+
+    def measure(scenario, action, repeat=1):
+        for m in _RecordingMetrics.instances:
+            m.reset()
+        gc.collect()
+        if trace:
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        t0 = time.perf_counter()
+        for i in range(repeat):
+            action(i)
+            _check(at, scenario)
+        wall = (time.perf_counter() - t0) * 1000.0 / repeat
+        peak = blocks = None
+        if trace:
+            peak = (tracemalloc.get_traced_memory()[1] - base) / 1024.0
+            blocks = sum(s.count_diff for s in tracemalloc.take_snapshot().compare_to(before, "filename"))
+            tracemalloc.stop()
+        spans = _RecordingMetrics.instances[-1].spans() if _RecordingMetrics.instances else {}
+        results.append((scenario, wall, peak, blocks, spans))
+
+    measure("cold start (live)", lambda i: at.run())
+    measure("rerun (live)", lambda i: at.run(), reruns)
+    measure("refresh off", lambda i: _select(at, "Auto Refresh", "Off").run())
+    measure("rerun (refresh off)", lambda i: at.run(), reruns)
+    measure("driver switch", lambda i: _select(at, "Driver", 1).run())
+    measure("driver switch back", lambda i: _select(at, "Driver", 0).run())
+    return results
+
+
+def _commit():
+    try:
+        head = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True, text=True)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=HERE,
+                               capture_output=True, text=True)
+    except OSError:
+        return "-"
+    return (head.stdout.strip() or "-") + ("+dirty" if dirty.stdout.strip() else "")
+
+
+def report(header: str, timings, memory):
+    lines = [header, f"{'scenario':<24}{'wall_ms':>10}{'peak_kib':>12}{'blocks':>10}"]
+    memory = {scenario: (peak, blocks) for scenario, _, peak, blocks, _ in memory or []}
+    for scenario, wall, _, _, _ in timings:
+        peak, blocks = memory.get(scenario, (None, None))
+        lines.append(f"{scenario:<24}{wall:>10.1f}"
+                     + (f"{peak:>12.0f}{blocks:>10d}" if peak is not None else f"{'-':>12}{'-':>10}"))
+    for scenario, _, _, _, spans in timings:
+        lines.append("")
+        lines.append(f"{scenario} — stages")
+        lines.append(f"  {'span':<30}{'count':>7}{'avg_ms':>10}{'max_ms':>10}")
+        for name, s in sorted(spans.items(), key=lambda kv: -kv[1]["avg_ms"] * kv[1]["count"]):
+            lines.append(f"  {name:<30}{s['count']:>7}{s['avg_ms']:>10.2f}{s['max_ms']:>10.2f}")
+    return "\n".join(lines) + "\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--drivers", type=int, default=20)
+    parser.add_argument("--laps", type=int, default=70)
+    parser.add_argument("--interval-every", type=float, default=4.0, help="seconds between interval rows")
+    parser.add_argument("--reruns", type=int, default=5, help="repeats for the rerun scenarios")
+    parser.add_argument("--no-memory", action="store_true", help="skip the (slow) tracemalloc pass")
+    parser.add_argument("--out", default=os.path.join(HERE, "bench_output.txt"), help="results are appended here")
+    args = parser.parse_args(argv)
+    if args.laps < 1 or args.drivers < 1:
+        parser.error("--laps and --drivers must be at least 1")
+
+    t0 = time.perf_counter()
+    data, race_end = synthetic_race(args.drivers, args.laps, args.interval_every)
+    generated = time.perf_counter() - t0
+
+    with tempfile.TemporaryDirectory(prefix="f1-bench-") as tmp:
+        log = os.path.join(tmp, "race.jsonl")
+        write_replay_log(log, data, race_end)
+        t0 = time.perf_counter()
+        ReplayPlayer(log)
+        # Also paid once inside the cold start, when the app opens the log
+        loaded = time.perf_counter() - t0
+        for name in ("F1_RECORD_PATH", "F1_METRICS_FILE", "F1_METRICS_PORT", "F1_REPLAY_LOOP"):
+            os.environ.pop(name, None)
+        os.environ.update(F1_REPLAY_PATH=log, F1_REPLAY_SPEED="1e9", F1_CACHE_DIR="off")
+        metrics_module.Metrics = _RecordingMetrics
+        os.chdir(HERE)
+
+        app = os.path.join(HERE, "app.py")
+        timings = run_scenarios(app, args.reruns, trace=False)
+        memory = None if args.no_memory else run_scenarios(app, args.reruns, trace=True)
+        log_mib = os.path.getsize(log) / 2**20
+
+    rows = ", ".join(f"{name} {len(rows)}" for name, rows in data.items())
+    header = (
+        f"# {datetime.now(timezone.utc).isoformat(timespec='seconds')} commit {_commit()} • "
+        f"python {platform.python_version()} • {args.drivers} drivers × {args.laps} laps, "
+        f"intervals every {args.interval_every:g}s • reruns {args.reruns}\n"
+        f"# rows: {rows} • replay log {log_mib:.1f} MiB, generated in {generated:.1f}s, "
+        f"loaded in {loaded * 1000:.0f}ms"
+    )
+    text = report(header, timings, memory)
+    print(text)
+    with open(args.out, "a", encoding="utf-8") as f:
+        f.write(text + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""Persistent SQLite cache of OpenF1 responses for sessions that have finished."""
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+# Endpoints worth keeping as a stale fallback for offline use, even while
+# they can still change (the season calendar, a weekend's session list).
+FALLBACK_ENDPOINTS = ("meetings", "sessions")
+
+
+def _parse_date(value):
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def query_params(endpoint: str):
+    parts = urlsplit(endpoint)
+    return parts.path.strip("/"), dict(parse_qsl(parts.query))
+
+
+def _pack(values: np.ndarray, dtype: str):
+    # Object columns (raw gaps) hold floats, strings and None: JSON keeps them as they were
+    if dtype in ("object", "str"):
+        return json.dumps(values.tolist()).encode()
+    buf = io.BytesIO()
+    np.save(buf, np.asarray(values, dtype=dtype), allow_pickle=False)
+    return buf.getvalue()
+
+
+def _unpack(blob: bytes, dtype: str):
+    if dtype in ("object", "str"):
+        values = json.loads(blob)
+        out = np.empty(len(values), dtype=object)
+        out[:] = values
+        return out
+    return np.load(io.BytesIO(blob), allow_pickle=False)
+
+
+class SessionStore:
+    """Responses keyed by endpoint, remembered forever once their session is over.
+
+    A session counts as finished once its `date_end` is more than `settle`
+    in the past (OpenF1 keeps correcting data for a little while after the
+    flag). Every `sessions` response that passes through `put` updates that
+    registry, so no separate bookkeeping is needed by callers.
+
+    Typed feeds (`get_columns`/`put_columns`) are kept one blob per column,
+    so a finished session's intervals or telemetry come back as arrays
+    without ever building a list of rows.
+    """
+
+    def __init__(self, directory: str, settle: timedelta = timedelta(hours=1)):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "openf1.sqlite3")
+        self.settle = settle
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " endpoint TEXT PRIMARY KEY, path TEXT, session_key INTEGER,"
+                " final INTEGER NOT NULL, payload TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS columns ("
+                " endpoint TEXT NOT NULL, name TEXT NOT NULL, dtype TEXT NOT NULL, data BLOB NOT NULL,"
+                " stored_at REAL NOT NULL, PRIMARY KEY (endpoint, name, dtype))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS finished_sessions (session_key INTEGER PRIMARY KEY, date_end TEXT)"
+            )
+        self._finished = self._load_finished()
+
+    def _load_finished(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT session_key FROM finished_sessions").fetchall()
+        return {int(r[0]) for r in rows}
+
+    def is_finished(self, session_key):
+        try:
+            return int(session_key) in self._finished
+        except (TypeError, ValueError):
+            return False
+
+    def note_sessions(self, rows):
+        cutoff = datetime.now(timezone.utc) - self.settle
+        done = []
+        for row in rows or []:
+            key = row.get("session_key")
+            end = _parse_date(row.get("date_end"))
+            if key is not None and end is not None and end < cutoff and int(key) not in self._finished:
+                done.append((int(key), row.get("date_end")))
+        if done:
+            with self._lock, self._conn:
+                self._conn.executemany("INSERT OR IGNORE INTO finished_sessions VALUES (?, ?)", done)
+            self._finished.update(k for k, _ in done)
+
+    def _is_final(self, endpoint: str, payload):
+        path, params = query_params(endpoint)
+        if "session_key" in params:
+            return self.is_finished(params["session_key"])
+        if path == "sessions" and payload:
+            return all(self.is_finished(r.get("session_key")) for r in payload)
+        return False
+
+    def get(self, endpoint: str, stale_ok: bool = False):
+        """Stored payload for `endpoint`, or None. Non-final copies need `stale_ok`."""
+        sql = "SELECT payload FROM responses WHERE endpoint = ?"
+        if not stale_ok:
+            sql += " AND final = 1"
+        with self._lock:
+            row = self._conn.execute(sql, (endpoint,)).fetchone()
+        if row is None:
+            if not stale_ok:
+                self.misses += 1
+            return None
+        if not stale_ok:
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, endpoint: str, payload):
+        """Store a 200 response if it can never change again (or as an offline fallback)."""
+        path, params = query_params(endpoint)
+        if path == "sessions":
+            self.note_sessions(payload)
+        final = self._is_final(endpoint, payload)
+        if not final and path not in FALLBACK_ENDPOINTS:
+            return False
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (endpoint, path, params.get("session_key"), int(final), json.dumps(payload), time.time()),
+            )
+        return final
+
+    def get_columns(self, endpoint: str, schema: dict):
+        """Stored {column: ndarray} for `endpoint` with every `schema` column, or None."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name, dtype, data FROM columns WHERE endpoint = ?", (endpoint,)
+            ).fetchall()
+        blobs = {(name, dtype): data for name, dtype, data in rows}
+        if not blobs or any((name, str(dtype)) not in blobs for name, dtype in schema.items()):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {name: _unpack(blobs[(name, str(dtype))], str(dtype)) for name, dtype in schema.items()}
+
+    def put_columns(self, endpoint: str, columns: dict, schema: dict):
+        """Store a typed 200 response if its session is over; True if stored."""
+        if not self._is_final(endpoint, None):
+            return False
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO columns VALUES (?, ?, ?, ?, ?)",
+                [(endpoint, name, str(dtype), _pack(columns[name], str(dtype)), now) for name, dtype in schema.items()],
+            )
+        return True
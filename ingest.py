@@ -0,0 +1,284 @@
+"""Race-weekend ingestion worker: polls OpenF1 and writes every response to a SegmentStore.
+
+Run one worker per deployment; it is the only process holding the OpenF1
+credentials. Start the dashboards with F1_BACKEND=store and F1_STORE_DIR
+pointing at the same directory (a local or shared disk) and they read from
+the store instead of calling OpenF1, so any number of them can run side by
+side and all see the same data.
+
+The worker follows one session (`latest` by default, re-resolved as the
+weekend moves on): its meeting's session list, drivers, laps, stints,
+intervals and positions on the dashboard's poll schedule, and car_data /
+location for the drivers given with `--telemetry`. Anything else a
+dashboard asks the store for (another weekend, a past season, a driver's
+telemetry) is picked up from the store's `wanted/` list on the next cycle,
+and dropped again once no dashboard has read it for WANTED_TTL.
+
+    OPENF1_USERNAME=... OPENF1_PASSWORD=... python ingest.py [--store .f1_store] [--session latest]
+        [--telemetry 1,16|all] [--once]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qsl, quote, urlsplit
+
+from live_data import POLL_SCHEDULE, SNAPSHOT_ENDPOINTS
+from openf1_client import ENDPOINT_PRIORITY, OPENF1_BASE, OPENF1_TOKEN_URL, OpenF1Http, RequestScheduler, TokenManager
+from segment_store import SegmentStore, is_incremental, payload_digest
+from telemetry import TELEMETRY_FIELDS, TELEMETRY_POLL
+
+# Seconds between polls of endpoints outside the followed session (other
+# weekends, past seasons): they rarely change, if ever.
+WANTED_EVERY = 600.0
+MEETINGS_EVERY = 3600.0
+# `wanted/` entries no dashboard has read for this long are dropped
+WANTED_TTL = 6 * 3600.0
+# A session's endpoints stop being polled once it ended SETTLE ago and
+# their last STABLE_POLLS polls brought nothing new
+SETTLE = timedelta(hours=1)
+STABLE_POLLS = 3
+# An incremental stream is merged into one segment once it has this many
+COMPACT_SEGMENTS = 64
+
+
+def log(message: str):
+    print(f"{time.strftime('%H:%M:%S')} {message}", file=sys.stderr, flush=True)
+
+
+def openf1_fetch(http: OpenF1Http, tokens: TokenManager):
+    """`fetch(endpoint) -> (status_code, payload)` against OpenF1, refreshing the token once on a 401."""
+    def fetch(endpoint: str):
+        token = tokens.token()
+        if not token:
+            return 401, "No OpenF1 access token"
+        url = f"{OPENF1_BASE}/{endpoint}"
+        code, payload = http.get_json(url, headers={"Authorization": f"Bearer {token}"})
+        if code == 401:
+            token = tokens.invalidate(token)
+            if not token:
+                return code, payload
+            code, payload = http.get_json(url, headers={"Authorization": f"Bearer {token}"})
+        return code, payload
+    return fetch
+
+
+def _poll_every(base: str):
+    name = base.split("?", 1)[0]
+    if name in TELEMETRY_FIELDS:
+        return TELEMETRY_POLL
+    return POLL_SCHEDULE.get("session" if name == "sessions" else name, WANTED_EVERY)
+
+
+def _priority(base: str):
+    return ENDPOINT_PRIORITY.get(base.split("?", 1)[0], 5)
+
+
+def _session_key(base: str):
+    try:
+        return int(dict(parse_qsl(urlsplit(base).query))["session_key"])
+    except (KeyError, ValueError):
+        return None
+
+
+def _parse_date(value):
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+class Ingestor:
+    """Polls every endpoint that is due and publishes what changed as one store version per cycle.
+
+    Incremental endpoints are asked only for rows newer than the newest
+    `date` already stored (so a restarted worker carries on where it
+    stopped); reference endpoints get a new segment only when their
+    payload differs from the stored one, which then replaces it on disk.
+    Incremental streams are merged into one segment every
+    COMPACT_SEGMENTS polls that brought rows, and once they settle.
+
+    Telemetry only gets the time left before the next interval/position
+    poll is due, longest-waiting endpoint first, so it can never hold the
+    live feeds back. Endpoints of a session that has ended are dropped
+    once they stop changing, and `wanted/` entries nobody reads expire.
+    """
+
+    def __init__(self, store: SegmentStore, fetch, session="latest", telemetry=()):
+        self.store = store
+        self.fetch = fetch
+        self.session = str(session)
+        self.telemetry = telemetry  # driver numbers, or "all"
+        self.session_key = None
+        self.meeting_key = None
+        self.drivers = []
+        self.errors = 0
+        self.settled = set()  # base endpoints of finished sessions that stopped changing
+        self._due = {}  # base endpoint -> monotonic time of its next poll
+        self._ends = {}  # session_key -> date_end, from every sessions response polled
+        self._unchanged = {}  # base endpoint -> polls in a row that brought nothing new
+
+    def schedule(self):
+        """{base endpoint: seconds between polls} for this cycle."""
+        plan = {"meetings": MEETINGS_EVERY, f"sessions?session_key={self.session}": POLL_SCHEDULE["session"]}
+        for base in self.store.wanted(max_age=WANTED_TTL):
+            plan[base] = _poll_every(base) if self._follows(base) else WANTED_EVERY
+            key = _session_key(base)
+            if key is not None and key not in self._ends:
+                # Its end date tells when the endpoint can settle
+                plan.setdefault(f"sessions?session_key={key}", WANTED_EVERY)
+        if self.session_key is not None:
+            self._follow_plan(plan)
+        return {base: every for base, every in plan.items() if base not in self.settled}
+
+    def _follow_plan(self, plan: dict):
+        sk = self.session_key
+        if self.meeting_key is not None:
+            plan[f"sessions?meeting_key={self.meeting_key}"] = POLL_SCHEDULE["session"]
+        for name, endpoint in SNAPSHOT_ENDPOINTS.items():
+            plan[f"{endpoint}?session_key={sk}"] = POLL_SCHEDULE[name]
+        for name in ("intervals", "positions"):
+            plan[f"{name}?session_key={sk}"] = POLL_SCHEDULE[name]
+        drivers = self.drivers if self.telemetry == "all" else self.telemetry
+        for number in drivers:
+            for endpoint in TELEMETRY_FIELDS:
+                plan[f"{endpoint}?session_key={sk}&driver_number={int(number)}"] = TELEMETRY_POLL
+
+    def _follows(self, base: str):
+        return self.session_key is not None and _session_key(base) == self.session_key
+
+    def _finished(self, base: str):
+        end = self._ends.get(_session_key(base))
+        return end is not None and end < datetime.now(timezone.utc) - SETTLE
+
+    def poll(self, base: str):
+        """Fetch `base` and append what is new; returns the status code."""
+        incremental = is_incremental(base)
+        cutoff = self.store.last_date(base) if incremental else None
+        endpoint = f"{base}&date>{quote(cutoff, safe=':')}" if cutoff else base
+        code, payload = self.fetch(endpoint)
+        if code != 200 or not isinstance(payload, list):
+            self.errors += 1
+            log(f"{base}: {code}")
+            return code
+
+        if incremental:
+            # Backoff answers may repeat an earlier response: keep strictly newer rows
+            rows = [r for r in payload if cutoff is None or (r.get("date") or "") > cutoff]
+            changed = bool(rows)
+            if changed:
+                self.store.append(base, rows)
+                if self.store.segments(base) - self.store.first(base) >= COMPACT_SEGMENTS:
+                    self.store.compact(base)
+        else:
+            digest = payload_digest(payload)
+            changed = digest != self.store.last_digest(base)
+            if changed:
+                self.store.append(base, payload, digest=digest)
+        self._settle(base, changed)
+        if base.startswith("sessions?"):
+            for row in payload:
+                end = _parse_date(row.get("date_end"))
+                if row.get("session_key") is not None and end is not None:
+                    self._ends[int(row["session_key"])] = end
+        if base == f"sessions?session_key={self.session}":
+            self._follow(payload)
+        if self.session_key is not None and base == f"drivers?session_key={self.session_key}":
+            self.drivers = sorted({int(r["driver_number"]) for r in payload if r.get("driver_number") is not None})
+        return code
+
+    def _settle(self, base: str, changed: bool):
+        self._unchanged[base] = 0 if changed else self._unchanged.get(base, 0) + 1
+        if self._unchanged[base] >= STABLE_POLLS and self._finished(base):
+            self.settled.add(base)
+            self.store.unwant(base)
+            self.store.compact(base)
+            log(f"{base}: session over and stable, no longer polled")
+
+    def _follow(self, rows):
+        if not rows:
+            return
+        row = rows[-1]
+        key, meeting = row.get("session_key"), row.get("meeting_key")
+        if key is not None and int(key) != self.session_key:
+            self.session_key = int(key)
+            self.meeting_key = int(meeting) if meeting is not None else None
+            self.drivers = []
+            log(f"following session {self.session_key} (meeting {self.meeting_key})")
+
+    def run_once(self):
+        """Poll whatever is due, most urgent endpoints first, then commit; returns the endpoints polled."""
+        now = time.monotonic()
+        plan = self.schedule()
+        due = [b for b in plan if self._due.get(b, 0.0) <= now]
+        telemetry = sorted((b for b in due if b.split("?", 1)[0] in TELEMETRY_FIELDS), key=lambda b: self._due.get(b, 0.0))
+        due = sorted((b for b in due if b.split("?", 1)[0] not in TELEMETRY_FIELDS), key=_priority)
+        for base in due:
+            self._poll_due(base, plan[base])
+        # Telemetry fills the time until the live feeds are due again; the rest waits for the next cycle
+        deadline = min((self._due[b] for b in plan if _priority(b) == 0 and b in self._due), default=float("inf"))
+        for base in telemetry:
+            if time.monotonic() >= deadline:
+                break
+            self._poll_due(base, plan[base])
+            due.append(base)
+        version = self.store.commit()
+        if due:
+            log(f"polled {len(due)} endpoint(s) → store version {version}")
+        return due
+
+    def _poll_due(self, base: str, every: float):
+        self._due[base] = time.monotonic() + every
+        try:
+            self.poll(base)
+        except Exception as e:
+            self.errors += 1
+            log(f"{base}: {e}")
+
+    def run(self, stop: threading.Event):
+        while not stop.is_set():
+            self.run_once()
+            plan = self.schedule()
+            # New endpoints (a followed session, a wanted request) are due at once
+            upcoming = [self._due.get(b, 0.0) for b in plan]
+            stop.wait(min(max(min(upcoming) - time.monotonic(), 0.5), 5.0))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--store", default=os.environ.get("F1_STORE_DIR", ".f1_store"), help="store directory")
+    parser.add_argument("--session", default="latest", help="session_key to follow, or 'latest'")
+    parser.add_argument("--telemetry", default="", help="driver numbers (comma separated) or 'all'")
+    parser.add_argument("--once", action="store_true", help="run one polling cycle and exit")
+    args = parser.parse_args(argv)
+
+    username, password = os.environ.get("OPENF1_USERNAME"), os.environ.get("OPENF1_PASSWORD")
+    if not username or not password:
+        parser.error("set OPENF1_USERNAME and OPENF1_PASSWORD")
+    telemetry = "all" if args.telemetry == "all" else [int(d) for d in args.telemetry.split(",") if d.strip()]
+
+    http = OpenF1Http(scheduler=RequestScheduler(
+        per_second=float(os.environ.get("OPENF1_RATE_PER_SECOND", 6)),
+        per_minute=float(os.environ.get("OPENF1_RATE_PER_MINUTE", 60)),
+    ))
+    tokens = TokenManager(http, OPENF1_TOKEN_URL, username, password)
+    worker = Ingestor(SegmentStore(args.store), openf1_fetch(http, tokens), session=args.session, telemetry=telemetry)
+    if args.once:
+        # Twice: the first cycle only resolves which session to follow
+        worker.run_once()
+        worker.run_once()
+        return 0 if not worker.errors else 1
+
+    stop = threading.Event()
+    try:
+        worker.run(stop)
+    except KeyboardInterrupt:
+        stop.set()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""Parse OpenF1's JSON arrays while they download, straight into typed column arrays."""
+import codecs
+import json
+
+import numpy as np
+import pandas as pd
+
+_SKIP = " \t\r\n,"
+
+
+def iter_json_array(chunks):
+    """Yield each element of a top-level JSON array as soon as its text has arrived."""
+    decoder = json.JSONDecoder()
+    buf, pos, started = "", 0, False
+    for chunk in chunks:
+        buf = buf[pos:] + chunk
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in _SKIP:
+                pos += 1
+            if pos >= len(buf):
+                break
+            if not started:
+                if buf[pos] != "[":
+                    raise ValueError("expected a JSON array")
+                started = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                item, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                break  # element not complete yet
+            yield item
+    raise ValueError("truncated JSON array")
+
+
+def iter_text(byte_chunks, encoding: str = "utf-8"):
+    decode = codecs.getincrementaldecoder(encoding)().decode
+    for chunk in byte_chunks:
+        yield decode(chunk)
+
+
+def typed_array(values, dtype: str):
+    """Column values -> ndarray of `dtype`; missing or unparsable entries become NaN/NaT/0."""
+    if dtype.startswith("datetime64"):
+        dates = pd.to_datetime(pd.Series(values, dtype=object), utc=True, format="ISO8601", errors="coerce")
+        return dates.dt.tz_convert(None).to_numpy(dtype=dtype)
+    if dtype in ("object", "str"):
+        return np.array(values, dtype=object)
+    numbers = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce")
+    if np.dtype(dtype).kind in "iu":
+        numbers = numbers.fillna(0)
+    return numbers.to_numpy(dtype=dtype)
+
+
+class ColumnBuilder:
+    """Collects rows `block` at a time into typed arrays, keeping only the `schema` columns."""
+
+    def __init__(self, schema: dict, block: int = 4096):
+        self.schema = schema
+        self.block = block
+        self._pending = {name: [] for name in schema}
+        self._blocks = {name: [] for name in schema}
+        self.rows = 0
+
+    def add(self, row: dict):
+        for name, values in self._pending.items():
+            values.append(row.get(name))
+        self.rows += 1
+        if self.rows % self.block == 0:
+            self._flush()
+
+    def _flush(self):
+        for name, dtype in self.schema.items():
+            if self._pending[name]:
+                self._blocks[name].append(typed_array(self._pending[name], dtype))
+                self._pending[name] = []
+
+    def columns(self):
+        self._flush()
+        return {
+            name: np.concatenate(blocks) if blocks else typed_array([], self.schema[name])
+            for name, blocks in self._blocks.items()
+        }
+
+
+def columns_from_rows(rows, schema: dict):
+    """The same columns for a payload that is already a list of dicts (store, replay log)."""
+    builder = ColumnBuilder(schema)
+    for row in rows or []:
+        builder.add(row)
+    return builder.columns()
+
+
+def iso_dates(values):
+    """datetime64 (UTC) -> OpenF1-style ISO strings, for `date>` filters."""
+    return np.char.add(np.datetime_as_string(np.asarray(values, dtype="datetime64[us]"), unit="us"), "+00:00")
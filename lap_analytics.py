@@ -0,0 +1,215 @@
+"""Session-wide lap analytics: rolling pace, tyre degradation and fuel-corrected deltas."""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from live_data import LapTable, StintIndex
+
+# Seconds a car gains per lap as fuel burns off (~1.6 kg/lap at ~0.035 s/kg)
+FUEL_SECONDS_PER_LAP = 0.055
+# Laps slower than this multiple of the best clean lap seen are not pace laps
+OUTLIER_RATIO = 1.07
+PACE_WINDOW = 5
+
+_SUMS = ["n", "sx", "sy", "sxy", "sxx"]
+
+
+class LapAnalytics:
+    """Incremental analytics over one session's LapTable, for every driver at once.
+
+    Each `update` only looks at laps completed since the previous call. A
+    lap is classified (lap 1, pit-out lap, or slower than `outlier_ratio`
+    times the best clean lap known when it arrives) and given its
+    fuel-corrected time and rolling pace once, and the per-stint
+    least-squares sums for the degradation slopes are added to rather than
+    rebuilt. When the StintIndex changes (a pit stop reported late, a stint
+    corrected), laps already processed whose stint or tyre age changed are
+    moved: their terms come off the old stint's sums and go onto the new
+    one. `key` is (session_key, max lap seen, stint revision), so callers
+    can cache anything derived from the results on it.
+
+    Fuel-corrected times are expressed at the lap-1 fuel load, so laps from
+    any point of the race compare directly.
+    """
+
+    def __init__(self, session_key: int, window: int = PACE_WINDOW, fuel_per_lap: float = FUEL_SECONDS_PER_LAP,
+                 outlier_ratio: float = OUTLIER_RATIO):
+        self.session_key = int(session_key)
+        self.window = window
+        self.fuel_per_lap = fuel_per_lap
+        self.outlier_ratio = outlier_ratio
+        self.max_lap = 0
+        self.revision = 0
+        self._done = {}  # driver_number -> last lap processed
+        self._best = np.inf
+        self._batches = []
+        self._frame = None
+        self._sums = pd.DataFrame(
+            {c: pd.Series(dtype="float64") for c in _SUMS},
+            index=pd.MultiIndex.from_arrays([[], []], names=["driver_number", "stint_number"]),
+        )
+        self._compounds = {}
+        self._laps = None
+        self._stints = None
+        self._lock = threading.Lock()
+
+    @property
+    def key(self):
+        return self.session_key, self.max_lap, self.revision
+
+    def update(self, laps: LapTable, stints: StintIndex):
+        """Fold in any laps completed since the last call; returns `key`."""
+        with self._lock:
+            if stints is not self._stints and self._batches:
+                self._reattribute(stints)
+            self._stints = stints
+            if laps is self._laps:
+                return self.key
+            self._laps = laps
+            frame = laps.frame
+            if frame.empty:
+                return self.key
+            drivers = frame.index.get_level_values("driver_number")
+            lap_numbers = frame.index.get_level_values("lap_number").to_numpy()
+            done = drivers.map(lambda d: self._done.get(d, 0)).to_numpy()
+            new = frame[(lap_numbers > done) & frame["lap_duration_num"].notna().to_numpy()]
+            if not new.empty:
+                self._ingest(new, stints)
+            return self.key
+
+    @staticmethod
+    def _attribute(stints: StintIndex, drivers, lap_numbers):
+        """(stint_number, tyre_age, compound) of each lap; NaN/None where no stint covers it."""
+        rows = stints.locate(drivers, lap_numbers)
+        hit = rows >= 0
+        stint_number = np.full(len(rows), np.nan)
+        tyre_age = np.full(len(rows), np.nan)
+        compound = np.full(len(rows), None, dtype=object)
+        located = stints.frame.iloc[rows[hit]]
+        stint_number[hit] = pd.to_numeric(located["stint_number"], errors="coerce").to_numpy()
+        tyre_age[hit] = located["tyre_age_at_start"].to_numpy() + lap_numbers[hit] - located["lap_start"].to_numpy()
+        compound[hit] = located["compound"].to_numpy()
+        return stint_number, tyre_age, compound
+
+    def _add_sums(self, fit: pd.DataFrame, sign: float = 1.0):
+        x, y = fit["tyre_age"], fit["fuel_corrected"]
+        sums = pd.DataFrame({"n": 1.0, "sx": x, "sy": y, "sxy": x * y, "sxx": x * x}).groupby(
+            [fit.index.get_level_values("driver_number"), fit["stint_number"]]
+        ).sum()
+        sums.index.names = ["driver_number", "stint_number"]
+        self._sums = self._sums.add(sign * sums, fill_value=0.0)
+
+    def _ingest(self, new: pd.DataFrame, stints: StintIndex):
+        drivers = new.index.get_level_values("driver_number").to_numpy()
+        lap_numbers = new.index.get_level_values("lap_number").to_numpy()
+        duration = new["lap_duration_num"].to_numpy(dtype="float64")
+        stint_number, tyre_age, compound = self._attribute(stints, drivers, lap_numbers)
+        hit = ~np.isnan(stint_number)
+
+        pit_out = np.zeros(len(new), dtype=bool)
+        if "is_pit_out_lap" in new:
+            pit_out = new["is_pit_out_lap"].fillna(False).to_numpy(dtype=bool)
+        clean = (lap_numbers > 1) & ~pit_out
+        if clean.any():
+            self._best = min(self._best, duration[clean].min())
+        clean &= duration <= self._best * self.outlier_ratio
+
+        corrected = duration + self.fuel_per_lap * (lap_numbers - 1)
+        batch = pd.DataFrame({
+            "lap_duration_num": duration,
+            "clean": clean,
+            "stint_number": stint_number,
+            "compound": compound,
+            "tyre_age": tyre_age,
+            "fuel_corrected": corrected,
+            "rolling_pace": self._rolling_pace(pd.Series(np.where(clean, duration, np.nan), index=new.index)),
+        }, index=new.index)
+
+        fit = batch[clean & hit]
+        if not fit.empty:
+            self._add_sums(fit)
+            self._compounds.update(fit.groupby(["driver_number", "stint_number"])["compound"].last().to_dict())
+
+        self._batches.append(batch)
+        self._frame = None
+        self._done.update(pd.Series(lap_numbers, index=drivers).groupby(level=0).max().to_dict())
+        self.max_lap = max(self.max_lap, int(lap_numbers.max()))
+
+    def _reattribute(self, stints: StintIndex):
+        """Move processed laps whose stint or tyre age changed onto their new stint's sums."""
+        frame = self._combined()
+        drivers = frame.index.get_level_values("driver_number").to_numpy()
+        lap_numbers = frame.index.get_level_values("lap_number").to_numpy()
+        stint_number, tyre_age, compound = self._attribute(stints, drivers, lap_numbers)
+        old_stint = frame["stint_number"].to_numpy(dtype="float64")
+        old_age = frame["tyre_age"].to_numpy(dtype="float64")
+        same_stint = (old_stint == stint_number) | (np.isnan(old_stint) & np.isnan(stint_number))
+        same_age = (old_age == tyre_age) | (np.isnan(old_age) & np.isnan(tyre_age))
+        moved = ~(same_stint & same_age & (frame["compound"].to_numpy(dtype=object) == compound))
+        if not moved.any():
+            return
+
+        clean = frame["clean"].to_numpy(dtype=bool)
+        old_fit = frame[moved & clean & ~np.isnan(old_stint)]
+        if not old_fit.empty:
+            self._add_sums(old_fit, sign=-1.0)
+        frame = frame.assign(stint_number=stint_number, tyre_age=tyre_age, compound=compound)
+        new_fit = frame[moved & clean & ~np.isnan(stint_number)]
+        if not new_fit.empty:
+            self._add_sums(new_fit)
+        # Stints left without laps disappear rather than keep float residue
+        self._sums = self._sums[self._sums["n"] > 0.5]
+        fit = frame[clean & ~np.isnan(stint_number)]
+        self._compounds = fit.groupby(["driver_number", "stint_number"])["compound"].last().to_dict()
+        self._batches = [frame]
+        self._frame = None
+        self.revision += 1
+
+    def _rolling_pace(self, clean_times: pd.Series):
+        """Mean of each driver's last `window` clean laps, using history only as far back as needed."""
+        new = clean_times.dropna()
+        if new.empty:
+            return clean_times
+        if self._batches:
+            seen = self._combined()
+            tail = seen.loc[seen["clean"], "lap_duration_num"].groupby(level="driver_number").tail(self.window - 1)
+            new = pd.concat([tail, new]).sort_index()
+        rolled = new.groupby(level="driver_number", group_keys=False).transform(
+            lambda s: s.rolling(self.window, min_periods=1).mean()
+        )
+        return rolled.reindex(clean_times.index)
+
+    def _combined(self):
+        if len(self._batches) > 1:
+            self._batches = [pd.concat(self._batches).sort_index()]
+        return self._batches[0] if self._batches else pd.DataFrame()
+
+    def frame(self):
+        """Every processed lap, with `delta` to the best fuel-corrected clean lap of its stint."""
+        with self._lock:
+            if self._frame is None:
+                if not self._batches:
+                    return pd.DataFrame()
+                frame = self._combined()
+                pace = frame["fuel_corrected"].where(frame["clean"])
+                stint_best = pace.groupby([frame.index.get_level_values("driver_number"), frame["stint_number"]]).transform("min")
+                self._frame = frame.assign(delta=frame["fuel_corrected"] - stint_best)
+            return self._frame
+
+    def degradation(self):
+        """Least-squares fit of fuel-corrected time against tyre age for every stint.
+
+        `slope` is seconds lost per lap of tyre age; `pace` is the mean
+        fuel-corrected clean lap of the stint.
+        """
+        with self._lock:
+            s, compounds = self._sums, self._compounds
+        denom = s["n"] * s["sxx"] - s["sx"] ** 2
+        slope = (s["n"] * s["sxy"] - s["sx"] * s["sy"]) / denom.where(denom > 0)
+        return pd.DataFrame({
+            "compound": [compounds.get(k) for k in s.index],
+            "laps": s["n"].astype("int64"),
+            "slope": slope,
+            "pace": s["sy"] / s["n"],
+        }, index=s.index)
@@ -0,0 +1,98 @@
+"""Persistent lap-time comparison figure, extended lap by lap and downsampled with LTTB."""
+import threading
+
+import numpy as np
+import plotly.graph_objects as go
+from plotly.colors import qualitative
+
+from live_data import LapTable, StintIndex
+
+# Colour by role (you, ahead, behind, then picks), like px.line gave by order
+COLOURS = qualitative.Plotly
+
+
+def lttb(x, y, threshold: int):
+    """Largest-Triangle-Three-Buckets: indices of `threshold` points that keep the shape of (x, y)."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    every = (n - 2) / (threshold - 2)
+    keep = np.empty(threshold, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = int(i * every) + 1, int((i + 1) * every) + 1
+        nxt_lo, nxt_hi = hi, min(int((i + 2) * every) + 1, n)
+        avg_x, avg_y = x[nxt_lo:nxt_hi].mean(), y[nxt_lo:nxt_hi].mean()
+        areas = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(areas))
+        keep[i + 1] = a
+    return keep
+
+
+class LapChart:
+    """One figure per (session, set of drivers), kept across reruns.
+
+    `update` appends only the laps each driver completed since the last
+    call, so the work per refresh is proportional to the new laps rather
+    than the race so far. Traces longer than `max_points` are drawn from
+    an LTTB downsample, which keeps the figure sent to the browser the same
+    size however long the series get. Names, legend order and colours
+    depend on who is looking (the same drivers can be "ahead" for one
+    viewer and "behind" for another), so `show` sets them just before the
+    figure is drawn. Hold `lock` from `show` until the figure is
+    serialized, since viewers share it.
+    """
+
+    def __init__(self, numbers, max_points: int = 150, layout=None):
+        self.numbers = tuple(numbers)
+        self.max_points = max_points
+        self.lock = threading.Lock()
+        self._x = {d: np.empty(0) for d in self.numbers}
+        self._y = {d: np.empty(0) for d in self.numbers}
+        self._compound = {d: np.empty(0, dtype=object) for d in self.numbers}
+        self._shown = {d: (self._x[d], self._y[d], self._compound[d]) for d in self.numbers}
+        self._laps = None
+        self.figure = go.Figure()
+        for number in self.numbers:
+            self.figure.add_scatter(x=[], y=[], mode="lines", name=str(number))
+        if layout is not None:
+            layout(self.figure)
+
+    def update(self, laps: LapTable, stints: StintIndex):
+        with self.lock:
+            if laps is self._laps:
+                return
+            self._laps = laps
+            for number in self.numbers:
+                s = laps.driver(number)["lap_duration_num"].dropna()
+                known = self._x[number]
+                if len(known):
+                    s = s[s.index > known[-1]]
+                if s.empty:
+                    continue
+                compounds, _ = stints.at_laps(number, s.index)
+                self._x[number] = np.concatenate([known, s.index.to_numpy(dtype="float64")])
+                self._y[number] = np.concatenate([self._y[number], s.to_numpy()])
+                self._compound[number] = np.concatenate([self._compound[number], compounds])
+                keep = lttb(self._x[number], self._y[number], self.max_points)
+                self._shown[number] = (self._x[number][keep], self._y[number][keep], self._compound[number][keep])
+
+    def show(self, series, last_lap=None):
+        """The figure as one viewer sees it; call with `lock` held.
+
+        `series` is ((driver_number, label), ...) in legend order, covering
+        `numbers`. Laps after `last_lap` (the viewer's own current lap) are
+        left out, so a car a lap ahead is compared like for like.
+        """
+        for i, (number, label) in enumerate(series):
+            x, y, compounds = self._shown[number]
+            if last_lap is not None:
+                n = np.searchsorted(x, last_lap, side="right")
+                x, y, compounds = x[:n], y[:n], compounds[:n]
+            self.figure.data[self.numbers.index(number)].update(
+                x=x, y=y, customdata=compounds, name=label, legendrank=1000 + i,
+                line_color=COLOURS[i % len(COLOURS)],
+                hovertemplate="Lap %{x}<br>%{y:.3f}s<br>%{customdata}<extra>" + label + "</extra>",
+            )
+        return self.figure
@@ -0,0 +1,624 @@
+"""Incremental, per-session stores for OpenF1 live timing endpoints."""
+import threading
+import time
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+from json_stream import iso_dates
+from schema import DATE, typed_frame
+
+
+class IncrementalFeed:
+    """Latest row per driver for a date-stamped endpoint (intervals, positions).
+
+    Only the first refresh downloads the whole session; after that each
+    refresh asks OpenF1 for rows newer than the last `date` seen, so the cost
+    of a refresh is proportional to the number of new rows. With a `schema`
+    the feed asks `fetch(endpoint, schema=...)` for typed columns instead of
+    rows, and only the newest row per driver is ever turned into a dict.
+    With `keep_history` (schema feeds only) every row received is also kept
+    as typed columns, for consumers that need the whole stream.
+    """
+
+    def __init__(self, endpoint: str, session_key: int, schema: dict = None, keep_history: bool = False):
+        self.endpoint = endpoint
+        self.session_key = int(session_key)
+        self.schema = schema
+        self.keep_history = keep_history
+        self.last_date = None
+        self.history_rows = 0
+        self.refreshes = 0
+        self._latest = {}
+        self._frame = None
+        self._history = []  # column chunks in arrival order
+        self._lock = threading.Lock()
+        self._history_lock = threading.Lock()
+
+    def query(self):
+        q = f"{self.endpoint}?session_key={self.session_key}"
+        if self.last_date:
+            q += f"&date>{quote(self.last_date, safe=':')}"
+        return q
+
+    def apply(self, rows):
+        """Fold newly fetched rows into the latest-per-driver table."""
+        changed = False
+        for row in rows or []:
+            dn = row.get("driver_number")
+            if dn is None:
+                continue
+            date = row.get("date") or ""
+            prev = self._latest.get(dn)
+            if prev is None or date >= (prev.get("date") or ""):
+                self._latest[dn] = row
+                changed = True
+            if date and (self.last_date is None or date > self.last_date):
+                self.last_date = date
+        if changed:
+            self._frame = None
+        return changed
+
+    def apply_columns(self, columns):
+        """`apply` for a dict of column arrays with datetime64 `date`s."""
+        frame = pd.DataFrame(columns)
+        if frame.empty or "driver_number" not in frame.columns or "date" not in frame.columns:
+            return False
+        frame = frame.dropna(subset=["date", "driver_number"])
+        if self.keep_history and len(frame):
+            with self._history_lock:
+                self._history.append({c: frame[c].to_numpy() for c in frame.columns})
+                self.history_rows += len(frame)
+        latest = frame.sort_values("date", kind="stable").groupby("driver_number").tail(1)
+        latest = latest.assign(date=iso_dates(latest["date"].to_numpy()))
+        return self.apply(latest.to_dict("records"))
+
+    def refresh(self, fetch):
+        # Single flight: callers that arrive while a refresh is in flight wait
+        # for it and share its result instead of sending their own request.
+        seen = self.refreshes
+        with self._lock:
+            if self.refreshes != seen:
+                return self.latest()
+            try:
+                if self.schema is None:
+                    self.apply(fetch(self.query()))
+                else:
+                    self.apply_columns(fetch(self.query(), schema=self.schema))
+            finally:
+                self.refreshes += 1
+            return self.latest()
+
+    def latest(self):
+        if self._frame is None:
+            self._frame = typed_frame(self.endpoint, list(self._latest.values()))
+        return self._frame
+
+    def history(self, since: int = 0):
+        """Rows received after the first `since`, as column arrays in arrival order, and the total so far.
+
+        Never waits on a refresh in flight, so it is safe to call from a render.
+        """
+        with self._history_lock:
+            if len(self._history) > 1:
+                self._history = [{c: np.concatenate([h[c] for h in self._history]) for c in self._history[0]}]
+            total = self.history_rows
+            columns = {c: v[since:total] for c, v in self._history[0].items()} if self._history else {}
+        return columns, total
+
+
+class LapTable:
+    """Every driver's laps for one session, from a single `laps?session_key=` call.
+
+    The frame is indexed by (driver_number, lap_number) and sorted, so each
+    driver's laps are one contiguous block; `driver()` hands out positional
+    slices of it rather than copies.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame
+        numbers = frame.index.get_level_values("driver_number").to_numpy()
+        starts = np.flatnonzero(np.r_[True, numbers[1:] != numbers[:-1]]) if len(numbers) else np.array([], dtype=int)
+        stops = np.r_[starts[1:], len(numbers)].astype(int)
+        self._bounds = {int(numbers[a]): (int(a), int(b)) for a, b in zip(starts, stops)}
+
+    @classmethod
+    def from_rows(cls, rows):
+        df = pd.DataFrame(list(rows))
+        if df.empty or "driver_number" not in df.columns or "lap_number" not in df.columns:
+            index = pd.MultiIndex.from_arrays(
+                [np.array([], dtype="int16"), np.array([], dtype="int16")], names=["driver_number", "lap_number"]
+            )
+            return cls(pd.DataFrame({"lap_duration_num": pd.Series(dtype="float64")}, index=index))
+        df = typed_frame("laps", df)
+
+        if "lap_duration" in df.columns:
+            df["lap_duration_num"] = pd.to_numeric(df["lap_duration"], errors="coerce")
+        elif "lap_time" in df.columns:
+            df["lap_duration_num"] = pd.to_numeric(df["lap_time"], errors="coerce")
+        else:
+            df["lap_duration_num"] = np.nan
+
+        df = df.sort_values(["driver_number", "lap_number"], kind="stable").set_index(["driver_number", "lap_number"])
+        return cls(df)
+
+    @property
+    def driver_numbers(self):
+        return list(self._bounds)
+
+    def driver(self, driver_number: int):
+        """One driver's laps indexed by lap_number (empty frame if none)."""
+        a, b = self._bounds.get(int(driver_number), (0, 0))
+        return self.frame.iloc[a:b].droplevel("driver_number")
+
+    def summary(self):
+        """Current lap, last completed lap time and best lap time for every driver."""
+        durations = self.frame["lap_duration_num"].groupby(level="driver_number")
+        lap_numbers = pd.Series(
+            self.frame.index.get_level_values("lap_number"),
+            index=self.frame.index.get_level_values("driver_number"),
+        )
+        return pd.DataFrame({
+            "lap_number": lap_numbers.groupby(level="driver_number").max(),
+            "last_lap": durations.last(),
+            "best_lap": durations.min(),
+        })
+
+    def __len__(self):
+        return len(self.frame)
+
+
+# Laps per driver never get near this, so driver * _LAP_SPAN + lap sorts like (driver, lap)
+_LAP_SPAN = 10_000
+
+
+class StintIndex:
+    """Every driver's stints for one session, sorted by (driver_number, lap_start).
+
+    Answers "compound and tyre age for driver D at lap N" with a bisect over
+    that driver's stint starts instead of masking the whole stints frame;
+    `at_laps` does the same for a whole array of laps with `searchsorted`.
+    An open stint (no `lap_end` yet) runs to infinity.
+    """
+
+    COLUMNS = ["driver_number", "stint_number", "lap_start", "lap_end", "compound", "tyre_age_at_start"]
+
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame
+        numbers = frame["driver_number"].to_numpy()
+        starts = np.flatnonzero(np.r_[True, numbers[1:] != numbers[:-1]]) if len(numbers) else np.array([], dtype=int)
+        stops = np.r_[starts[1:], len(numbers)].astype(int)
+        self._bounds = {int(numbers[a]): (int(a), int(b)) for a, b in zip(starts, stops)}
+        self._lap_start = frame["lap_start"].to_numpy(dtype="int64")
+        self._lap_end = frame["lap_end"].to_numpy(dtype="float64")
+        self._compound = frame["compound"].to_numpy(dtype=object)
+        self._age = frame["tyre_age_at_start"].to_numpy(dtype="float64")
+        self._starts = {d: self._lap_start[a:b].tolist() for d, (a, b) in self._bounds.items()}
+        # One sorted key per stint so a batch of (driver, lap) pairs is a single searchsorted
+        self._keys = numbers.astype("int64") * _LAP_SPAN + self._lap_start
+
+    @classmethod
+    def from_rows(cls, rows):
+        df = pd.DataFrame(list(rows or ()))
+        if df.empty or not {"driver_number", "lap_start"} <= set(df.columns):
+            df = pd.DataFrame(columns=cls.COLUMNS)
+        for col in cls.COLUMNS:
+            if col not in df.columns:
+                df[col] = None
+        df["compound"] = df["compound"].map(lambda c: _text(c).upper() or None)
+        df = typed_frame("stints", df)
+        df["lap_end"] = df["lap_end"].fillna(np.inf)
+        df["tyre_age_at_start"] = df["tyre_age_at_start"].fillna(0.0)
+        df = df.sort_values(["driver_number", "lap_start"], kind="stable").reset_index(drop=True)
+        return cls(df)
+
+    def driver(self, driver_number: int):
+        """One driver's stints in lap order (empty frame if none)."""
+        a, b = self._bounds.get(int(driver_number), (0, 0))
+        return self.frame.iloc[a:b]
+
+    def at(self, driver_number, lap_number):
+        """(compound, tyre_age) on `lap_number`, or (None, None) outside every stint."""
+        if driver_number is None or lap_number is None:
+            return None, None
+        a, _ = self._bounds.get(int(driver_number), (0, 0))
+        i = bisect_right(self._starts.get(int(driver_number), ()), lap_number) - 1
+        if i < 0 or lap_number > self._lap_end[a + i]:
+            return None, None
+        return self._compound[a + i], self._age[a + i] + lap_number - self._lap_start[a + i]
+
+    def locate(self, driver_numbers, lap_numbers):
+        """Row of `frame` holding each (driver, lap) pair, -1 where no stint covers it."""
+        laps = np.asarray(lap_numbers, dtype="float64")
+        drivers = np.broadcast_to(np.asarray(driver_numbers, dtype="int64"), laps.shape)
+        if not len(self._keys) or not len(laps):
+            return np.full(laps.shape, -1, dtype=int)
+        rows = np.searchsorted(self._keys, drivers * _LAP_SPAN + laps, side="right") - 1
+        safe = np.maximum(rows, 0)
+        hit = (rows >= 0) & (self.frame["driver_number"].to_numpy()[safe] == drivers) & (laps <= self._lap_end[safe])
+        return np.where(hit, rows, -1)
+
+    def at_laps(self, driver_number, lap_numbers):
+        """Vectorized `at` for an array of laps -> (compounds, tyre_ages); misses are None/NaN."""
+        laps = np.asarray(lap_numbers, dtype="float64")
+        rows = self.locate(driver_number, laps)
+        hit = rows >= 0
+        compounds = np.full(len(laps), None, dtype=object)
+        ages = np.full(len(laps), np.nan)
+        compounds[hit] = self._compound[rows[hit]]
+        ages[hit] = self._age[rows[hit]] + laps[hit] - self._lap_start[rows[hit]]
+        return compounds, ages
+
+    def current(self, lap_numbers: pd.Series):
+        """Compound and tyre age of every driver's latest stint at their current lap."""
+        if not self._bounds:
+            return pd.DataFrame()
+        last = np.fromiter((b - 1 for _, b in self._bounds.values()), dtype=int, count=len(self._bounds))
+        drivers = pd.Index(list(self._bounds), dtype="int64", name="driver_number")
+        laps_on_set = np.clip(lap_numbers.reindex(drivers).to_numpy(dtype="float64") - self._lap_start[last], 0, None)
+        return pd.DataFrame({"compound": self._compound[last], "tyre_age": self._age[last] + laps_on_set}, index=drivers)
+
+    def __len__(self):
+        return len(self.frame)
+
+
+class DriverInfo:
+    __slots__ = ("number", "acronym", "full_name", "team", "colour")
+
+    def __init__(self, number: int, acronym: str, full_name: str, team: str, colour: str):
+        self.number = number
+        self.acronym = acronym
+        self.full_name = full_name
+        self.team = team
+        self.colour = colour
+
+    def __repr__(self):
+        return f"DriverInfo({self.number!r}, {self.acronym!r}, {self.full_name!r}, {self.team!r}, {self.colour!r})"
+
+
+def _text(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return ""
+    return str(value).strip()
+
+
+class DriverRegistry:
+    """Driver identity by number, built once per `drivers?session_key=` load.
+
+    Replaces boolean-mask scans of the drivers frame with O(1) lookups. The
+    repr spells out every record, so a registry can be part of a render
+    cache key.
+    """
+
+    __slots__ = ("_by_number",)
+
+    def __init__(self, records=()):
+        self._by_number = {r.number: r for r in records}
+
+    @classmethod
+    def from_rows(cls, rows):
+        records = []
+        for row in rows or []:
+            number = row.get("driver_number")
+            if number is None:
+                continue
+            number = int(number)
+            acronym = _text(row.get("name_acronym")) or str(number)
+            records.append(DriverInfo(
+                number,
+                acronym,
+                _text(row.get("full_name")) or acronym,
+                _text(row.get("team_name")),
+                _text(row.get("team_colour")),
+            ))
+        return cls(records)
+
+    def get(self, number):
+        return self._by_number.get(int(number)) if number is not None else None
+
+    def acronym(self, number):
+        info = self.get(number)
+        return info.acronym if info is not None else str(number)
+
+    def __iter__(self):
+        return iter(self._by_number.values())
+
+    def __repr__(self):
+        return f"DriverRegistry({list(self._by_number.values())!r})"
+
+    def __len__(self):
+        return len(self._by_number)
+
+    def __contains__(self, number):
+        return number is not None and int(number) in self._by_number
+
+
+@dataclass(frozen=True)
+class SessionSnapshot:
+    """Immutable view of one session's data, as published by a LivePoller.
+
+    A new snapshot is built for every update, so readers never see a
+    half-refreshed state and never need a lock.
+    """
+
+    session_key: int
+    session: tuple = ()
+    drivers: DriverRegistry = field(default_factory=DriverRegistry)
+    laps: LapTable = field(default_factory=lambda: LapTable.from_rows(()))
+    stints: StintIndex = field(default_factory=lambda: StintIndex.from_rows(()))
+    intervals: pd.DataFrame = field(default_factory=pd.DataFrame)
+    positions: pd.DataFrame = field(default_factory=pd.DataFrame)
+    version: int = 0
+    updated: tuple = ()
+
+
+# Seconds between refreshes of each part of the snapshot
+# Column projections for feeds fetched as typed arrays rather than rows
+FEED_SCHEMAS = {
+    # Gaps stay raw on the wire; typed_frame splits them into seconds + laps down
+    "intervals": {"date": DATE, "driver_number": "int16", "gap_to_leader": "object", "interval": "object"},
+    "positions": {"date": DATE, "driver_number": "int16", "position": "int16"},
+}
+
+POLL_SCHEDULE = {
+    "session": 60.0,
+    "drivers": 60.0,
+    "laps": 8.0,
+    "stints": 15.0,
+    "intervals": 4.0,
+    "positions": 4.0,
+}
+
+SNAPSHOT_ENDPOINTS = {
+    "session": "sessions",
+    "drivers": "drivers",
+    "laps": "laps",
+    "stints": "stints",
+}
+
+
+def _snapshot_part(name: str, rows):
+    if name == "laps":
+        return LapTable.from_rows(rows)
+    if name == "drivers":
+        return DriverRegistry.from_rows(rows)
+    if name == "stints":
+        return StintIndex.from_rows(rows)
+    return tuple(rows)
+
+
+def snapshot_requests(session_key: int):
+    """The `(endpoint, schema)` pairs a cold `fetch_snapshot` asks for, e.g. to warm them ahead of time."""
+    session_key = int(session_key)
+    reqs = [(f"{endpoint}?session_key={session_key}", None) for endpoint in SNAPSHOT_ENDPOINTS.values()]
+    for name, schema in FEED_SCHEMAS.items():
+        reqs.append((IncrementalFeed(name, session_key, schema=schema).query(), schema))
+    return reqs
+
+
+def fetch_snapshot(session_key: int, fetch, feeds=None, max_workers: int = 6):
+    """Fetch every part of a session snapshot at the same time.
+
+    `fetch(endpoint)` returns `(status_code, payload)` and runs on pool
+    threads, so it must not touch the Streamlit page. Returns
+    `(snapshot, failures)`, where failures maps each endpoint that did not
+    answer 200 to its status code or exception text.
+    """
+    session_key = int(session_key)
+    feeds = feeds or {
+        "intervals": IncrementalFeed("intervals", session_key),
+        "positions": IncrementalFeed("positions", session_key),
+    }
+    failures = {}
+
+    def get(endpoint, **kwargs):
+        try:
+            status, payload = fetch(endpoint, **kwargs)
+        except Exception as e:
+            failures[endpoint] = str(e)
+            return []
+        if status != 200:
+            failures[endpoint] = status
+            return []
+        return payload or []
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="openf1-fetch") as pool:
+        futures = {
+            name: pool.submit(get, f"{endpoint}?session_key={session_key}")
+            for name, endpoint in SNAPSHOT_ENDPOINTS.items()
+        }
+        futures.update({name: pool.submit(feed.refresh, get) for name, feed in feeds.items()})
+        parts = {name: f.result() for name, f in futures.items()}
+
+    for name in SNAPSHOT_ENDPOINTS:
+        parts[name] = _snapshot_part(name, parts[name])
+    return SessionSnapshot(session_key=session_key, **parts), failures
+
+
+class LivePoller:
+    """One background poll loop per session, shared by every viewer.
+
+    `fetch(endpoint)` must return `(status_code, payload)` and must not touch
+    the Streamlit page, since it runs on the poller thread. Viewers only ever
+    call `snapshot()`, so upstream traffic does not grow with the audience.
+    The thread stops after `idle_timeout` seconds without readers and is
+    restarted by the next `snapshot()` call.
+    """
+
+    def __init__(self, session_key: int, fetch, feeds=None, schedule=None, idle_timeout: float = 120.0):
+        self.session_key = int(session_key)
+        self.fetch = fetch
+        self.feeds = feeds or {
+            "intervals": IncrementalFeed("intervals", session_key),
+            "positions": IncrementalFeed("positions", session_key),
+        }
+        self.schedule = dict(schedule or POLL_SCHEDULE)
+        self.idle_timeout = idle_timeout
+        self.backoff_until = 0.0
+        self.last_error = None
+        self._snapshot = SessionSnapshot(session_key=self.session_key)
+        self._updated = {}
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._last_read = time.monotonic()
+
+    def snapshot(self, wait: float = 15.0):
+        self._last_read = time.monotonic()
+        self._ensure_running()
+        self._ready.wait(wait)
+        return self._snapshot
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name=f"openf1-poller-{self.session_key}", daemon=True
+                )
+                self._thread.start()
+
+    def _bootstrap(self):
+        # First pass fans out concurrently so the first paint waits for the
+        # slowest endpoint rather than the sum of all of them.
+        snapshot, failures = fetch_snapshot(self.session_key, self.fetch, feeds=self.feeds)
+        if 429 in failures.values():
+            self.backoff_until = time.monotonic() + 30.0
+        if failures:
+            self.last_error = ", ".join(f"{ep} → {status}" for ep, status in failures.items())
+        # Only parts that arrived count as updated; the rest are retried at once
+        failed = {endpoint.split("?", 1)[0] for endpoint in failures}
+        now = time.time()
+        self._updated = {name: now for name in self.schedule if SNAPSHOT_ENDPOINTS.get(name, name) not in failed}
+        self._snapshot = replace(snapshot, version=1, updated=tuple(sorted(self._updated.items())))
+        self._ready.set()
+
+    def _run(self):
+        if self._snapshot.version == 0:
+            self._bootstrap()
+        due = {
+            name: time.monotonic() + (interval if name in self._updated else 0.0)
+            for name, interval in self.schedule.items()
+        }
+        while time.monotonic() - self._last_read < self.idle_timeout:
+            now = time.monotonic()
+            if now >= self.backoff_until:
+                for name, at in due.items():
+                    if at <= now:
+                        self._refresh(name)
+                        due[name] = time.monotonic() + self.schedule[name]
+                        if time.monotonic() < self.backoff_until:
+                            break
+                self._ready.set()
+            next_at = max(min(due.values()), self.backoff_until)
+            # Wake at least once a second so an idle poller notices and exits
+            time.sleep(min(max(next_at - time.monotonic(), 0.05), 1.0))
+
+    def _get(self, endpoint: str, **kwargs):
+        try:
+            status, payload = self.fetch(endpoint, **kwargs)
+        except Exception as e:
+            self.last_error = str(e)
+            return None
+        if status == 429:
+            self.backoff_until = time.monotonic() + 30.0
+        if status != 200:
+            self.last_error = f"{endpoint} → {status}"
+            return None
+        return payload or []
+
+    def _refresh(self, name: str):
+        if name in self.feeds:
+            failed = []
+
+            def fetch_rows(endpoint, **kwargs):
+                rows = self._get(endpoint, **kwargs)
+                if rows is None:
+                    failed.append(endpoint)
+                return rows or []
+
+            value = self.feeds[name].refresh(fetch_rows)
+            if failed:
+                return
+        else:
+            rows = self._get(f"{SNAPSHOT_ENDPOINTS[name]}?session_key={self.session_key}")
+            if rows is None:
+                return
+            value = _snapshot_part(name, rows)
+
+        self._updated[name] = time.time()
+        self._snapshot = replace(
+            self._snapshot,
+            **{name: value},
+            version=self._snapshot.version + 1,
+            updated=tuple(sorted(self._updated.items())),
+        )
+
+
+def _by_driver(frame: pd.DataFrame, columns):
+    """Latest-per-driver frame -> the given columns indexed by driver_number."""
+    if frame.empty or "driver_number" not in frame.columns:
+        return pd.DataFrame()
+    present = [c for c in columns if c in frame.columns]
+    out = frame.dropna(subset=["driver_number"]).set_index("driver_number")[present]
+    out.index = out.index.astype("int64")
+    return out
+
+
+class TimingTower:
+    """Full-grid timing table (one row per driver) for a session.
+
+    `update(snapshot)` only recomputes the columns whose source changed
+    since the last call (snapshots share unchanged parts) and writes them
+    into the existing frame in place. Every column comes from a vectorized
+    groupby/join over the whole field, never a per-driver loop.
+    """
+
+    COLUMNS = {
+        "position": "float64",
+        "gap_to_leader": "float64",
+        "laps_down": "float64",
+        "interval": "float64",
+        "interval_laps": "float64",
+        "lap_number": "float64",
+        "last_lap": "float64",
+        "best_lap": "float64",
+        "compound": "object",
+        "tyre_age": "float64",
+    }
+
+    def __init__(self):
+        self.frame = pd.DataFrame(
+            {c: pd.Series(dtype=t) for c, t in self.COLUMNS.items()},
+            index=pd.Index([], dtype="int64", name="driver_number"),
+        )
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def update(self, snap: SessionSnapshot):
+        with self._lock:
+            parts = {"positions": snap.positions, "intervals": snap.intervals, "laps": snap.laps, "stints": snap.stints}
+            changed = {name for name, part in parts.items() if self._seen.get(name) is not part}
+            if "positions" in changed:
+                self._assign(_by_driver(snap.positions, ["position"]))
+            if "intervals" in changed:
+                self._assign(_by_driver(snap.intervals, ["gap_to_leader", "laps_down", "interval", "interval_laps"]))
+            if "laps" in changed:
+                self._assign(snap.laps.summary())
+            if changed & {"laps", "stints"}:
+                self._assign(snap.stints.current(self.frame["lap_number"]))
+            self._seen = parts
+            return self.frame.sort_values("position", na_position="last")
+
+    def _assign(self, part: pd.DataFrame):
+        if part.empty:
+            return
+        part = part[~part.index.duplicated(keep="last")]
+        if not part.index.isin(self.frame.index).all():
+            self.frame = self.frame.reindex(self.frame.index.union(part.index))
+            self.frame.index.name = "driver_number"
+        for col in part.columns:
+            self.frame.loc[part.index, col] = part[col]
@@ -0,0 +1,163 @@
+"""Timed spans and counters for the dashboard, exportable as Prometheus text."""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class SpanStats:
+    __slots__ = ("count", "total", "max", "last")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + body + "}"
+
+
+class Metrics:
+    """Process-wide spans (count/total/max/last seconds per stage) and labelled counters.
+
+    Other components keep their own counters (transport, scheduler, caches);
+    they are pulled in at export time through `add_collector`, whose
+    callbacks yield `(name, type, labels, value)` samples.
+    """
+
+    def __init__(self, prefix: str = "f1_dashboard"):
+        self.prefix = prefix
+        self._spans = {}
+        self._counters = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0)
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            s = self._spans.get(name)
+            if s is None:
+                s = self._spans[name] = SpanStats()
+            s.count += 1
+            s.total += seconds
+            s.max = max(s.max, seconds)
+            s.last = seconds
+
+    def incr(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_collector(self, collect):
+        self._collectors.append(collect)
+
+    def reset(self):
+        """Forget all spans and counters (collectors stay registered)."""
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+
+    def spans(self):
+        """Copy of the span table in milliseconds, safe to render."""
+        with self._lock:
+            return {
+                name: {
+                    "count": s.count,
+                    "avg_ms": round(1000.0 * s.total / s.count, 2),
+                    "max_ms": round(1000.0 * s.max, 2),
+                    "last_ms": round(1000.0 * s.last, 2),
+                }
+                for name, s in self._spans.items()
+            }
+
+    def counters(self):
+        with self._lock:
+            return {name + _labels(labels): value for (name, labels), value in self._counters.items()}
+
+    def samples(self):
+        with self._lock:
+            spans = [(name, s.count, s.total, s.max) for name, s in self._spans.items()]
+            counters = list(self._counters.items())
+        for name, count, total, longest in spans:
+            labels = (("span", name),)
+            yield "span_seconds_sum", "summary", labels, total
+            yield "span_seconds_count", "summary", labels, count
+            yield "span_seconds_max", "gauge", labels, longest
+        for (name, labels), value in counters:
+            yield f"{name}_total", "counter", labels, value
+        for collect in list(self._collectors):
+            try:
+                for name, kind, labels, value in collect():
+                    yield name, kind, tuple(sorted(labels.items())), value
+            except Exception:
+                continue
+
+    def prometheus_text(self):
+        """Everything in the Prometheus text exposition format (version 0.0.4)."""
+        families = {}
+        for name, kind, labels, value in self.samples():
+            family = name.rsplit("_", 1)[0] if name.startswith("span_seconds_") and kind == "summary" else name
+            families.setdefault(family, (kind, []))[1].append((name, labels, value))
+        lines = []
+        for family, (kind, samples) in families.items():
+            lines.append(f"# TYPE {self.prefix}_{family} {kind}")
+            for name, labels, value in samples:
+                lines.append(f"{self.prefix}_{name}{_labels(labels)} {float(value):g}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp, path)
+
+    def export_to_file(self, path: str, interval: float = 15.0):
+        """Rewrite `path` every `interval` seconds (e.g. for node_exporter's textfile collector)."""
+        def loop():
+            while True:
+                try:
+                    self.write(path)
+                except OSError:
+                    pass
+                time.sleep(interval)
+
+        threading.Thread(target=loop, name="metrics-file", daemon=True).start()
+
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        """Serve GET /metrics on a local port from a daemon thread."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, int(port)), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
@@ -0,0 +1,396 @@
+"""Shared HTTP transport for OpenF1: pooled keep-alive connections, gzip,
+conditional requests, rate-limit scheduling and per-endpoint counters."""
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from json_stream import ColumnBuilder, iter_json_array, iter_text
+
+OPENF1_BASE = "https://api.openf1.org/v1"
+OPENF1_TOKEN_URL = "https://api.openf1.org/token"
+
+
+@dataclass
+class EndpointStats:
+    requests: int = 0
+    not_modified: int = 0
+    stale: int = 0
+    errors: int = 0
+    bytes_wire: int = 0
+    bytes_decoded: int = 0
+    seconds: float = 0.0
+
+    @property
+    def avg_ms(self):
+        return 1000.0 * self.seconds / self.requests if self.requests else 0.0
+
+
+def endpoint_name(url: str):
+    return urlsplit(url).path.rstrip("/").rsplit("/", 1)[-1] or url
+
+
+# Lower runs first when requests queue for the rate limit: live timing
+# before laps and stints, reference data last.
+ENDPOINT_PRIORITY = {
+    "intervals": 0,
+    "positions": 0,
+    "position": 0,
+    "car_data": 1,
+    "location": 1,
+    "laps": 2,
+    "stints": 2,
+    "drivers": 3,
+    "sessions": 3,
+    "meetings": 4,
+}
+# Speculative traffic (prefetching): after everything a viewer is waiting on
+BACKGROUND_PRIORITY = 9
+
+
+class RequestScheduler:
+    """Process-wide token buckets in front of every OpenF1 GET.
+
+    Requests wait (in priority order) for a slot in both the per-second and
+    per-minute buckets. After a 429 nothing is sent until `Retry-After` has
+    passed; during that backoff `acquire` fails straight away so the caller
+    can serve the last good response instead. Background requests
+    (BACKGROUND_PRIORITY) are also refused while the per-minute bucket is
+    down to its last `reserve` share, which is kept for the live feeds.
+    """
+
+    def __init__(self, per_second: float = 6.0, per_minute: float = 60.0, max_wait: float = 10.0,
+                 default_backoff: float = 30.0, reserve: float = 0.25):
+        self.max_wait = max_wait
+        self.reserve = reserve
+        self.default_backoff = default_backoff
+        self.backoff_until = 0.0
+        # [capacity, refill per second, tokens]
+        self._buckets = [
+            [per_second, per_second, per_second],
+            [per_minute, per_minute / 60.0, per_minute],
+        ]
+        self._last_refill = time.monotonic()
+        self._waiting = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.granted = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.rate_limited = 0
+
+    def _refill(self, now):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        for bucket in self._buckets:
+            bucket[2] = min(bucket[0], bucket[2] + elapsed * bucket[1])
+
+    def _seconds_until_token(self):
+        return max([(1.0 - tokens) / rate for _, rate, tokens in self._buckets if tokens < 1.0], default=0.0)
+
+    def acquire(self, endpoint: str, timeout: float = None, priority: int = None):
+        """Block until `endpoint` may be sent; False if backing off or timed out.
+
+        `priority` overrides the endpoint's ENDPOINT_PRIORITY.
+        """
+        priority = ENDPOINT_PRIORITY.get(endpoint, 2) if priority is None else priority
+        ticket = (priority, next(self._seq))
+        deadline = time.monotonic() + (self.max_wait if timeout is None else timeout)
+        waited = False
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if now < self.backoff_until:
+                        self.rejected += 1
+                        return False
+                    self._refill(now)
+                    capacity, _, tokens = self._buckets[1]
+                    if priority >= BACKGROUND_PRIORITY and tokens < 1.0 + self.reserve * capacity:
+                        self.rejected += 1
+                        return False
+                    if self._waiting[0] == ticket and self._seconds_until_token() == 0.0:
+                        for bucket in self._buckets:
+                            bucket[2] -= 1.0
+                        self.granted += 1
+                        self.throttled += int(waited)
+                        return True
+                    wait = min(self._seconds_until_token() or 0.05, deadline - now)
+                    if wait <= 0:
+                        self.rejected += 1
+                        return False
+                    waited = True
+                    self._cond.wait(wait)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def rate_limited_for(self, retry_after=None):
+        """Record a 429 and stop sending for `Retry-After` seconds."""
+        try:
+            seconds = float(retry_after)
+        except (TypeError, ValueError):
+            seconds = self.default_backoff
+        with self._cond:
+            self.rate_limited += 1
+            self.backoff_until = max(self.backoff_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+        return seconds
+
+    @property
+    def backoff_remaining(self):
+        return max(self.backoff_until - time.monotonic(), 0.0)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "queue_depth": len(self._waiting),
+                "granted": self.granted,
+                "throttled": self.throttled,
+                "rejected": self.rejected,
+                "rate_limited": self.rate_limited,
+                "backoff_s": round(self.backoff_remaining, 1),
+            }
+
+
+class OpenF1Http:
+    """Thread-safe client shared by every viewer and background thread.
+
+    One `requests.Session` keeps TLS connections to api.openf1.org alive
+    between calls. Responses carrying an ETag or Last-Modified header are
+    remembered per URL and revalidated, so an unchanged endpoint costs a
+    304 with no body. With a `scheduler`, GETs are rate limited and the
+    last good response for a URL is served while OpenF1 is rate limiting us.
+    `date>` deltas are never remembered: the next call asks a different
+    question. The remembered bodies are bounded by `max_validator_bytes`.
+    """
+
+    def __init__(self, pool_size: int = 16, timeout: float = 12, max_validator_bytes: int = 64 * 2**20,
+                 scheduler: RequestScheduler = None):
+        self.timeout = timeout
+        self.max_validator_bytes = max_validator_bytes
+        self.scheduler = scheduler
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept": "application/json", "Accept-Encoding": "gzip"})
+        self._validators = OrderedDict()  # url -> (etag, last_modified, last good payload, body bytes)
+        self._validator_bytes = 0
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def get_json(self, url: str, headers=None, priority: int = None):
+        """GET `url` -> (status_code, payload); a 304 is answered from the local copy."""
+        headers = dict(headers or {})
+        with self._lock:
+            cached = self._validators.get(url)
+            if cached is not None:
+                self._validators.move_to_end(url)
+        if cached is not None:
+            etag, last_modified, _, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        name = endpoint_name(url)
+        if self.scheduler is not None and not self.scheduler.acquire(name, priority=priority):
+            return self._stale(name, cached, 429, "Throttled locally while backing off from OpenF1")
+
+        r = self._send("GET", url, headers=headers, timeout=self.timeout)
+
+        if r.status_code == 304 and cached is not None:
+            return 200, cached[2]
+        if r.status_code == 429 and self.scheduler is not None:
+            self.scheduler.rate_limited_for(r.headers.get("Retry-After"))
+            return self._stale(name, cached, 429, r.text)
+        if r.status_code != 200:
+            return r.status_code, r.text
+
+        payload = r.json()
+        etag, last_modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+        if (etag or last_modified) and "date>" not in url:
+            self._remember(url, (etag, last_modified, payload, len(r.content)))
+        return 200, payload
+
+    def _remember(self, url, entry):
+        with self._lock:
+            old = self._validators.pop(url, None)
+            if old is not None:
+                self._validator_bytes -= old[3]
+            if entry[3] > self.max_validator_bytes:
+                return
+            self._validators[url] = entry
+            self._validator_bytes += entry[3]
+            while self._validator_bytes > self.max_validator_bytes:
+                _, evicted = self._validators.popitem(last=False)
+                self._validator_bytes -= evicted[3]
+
+    def get_columns(self, url: str, schema: dict, headers=None, chunk_size: int = 65536, priority: int = None):
+        """Streaming GET of a JSON array -> (status_code, {column: ndarray}) for the `schema` columns.
+
+        The body is parsed as it arrives, so neither the whole response text
+        nor a dict per row is ever held in memory. No revalidation: these are
+        large `date>` deltas that change on every call.
+        """
+        name = endpoint_name(url)
+        if self.scheduler is not None and not self.scheduler.acquire(name, priority=priority):
+            return 429, "Throttled locally while backing off from OpenF1"
+
+        t0 = time.perf_counter()
+        decoded = 0
+        try:
+            with self.session.get(url, headers=headers, timeout=self.timeout, stream=True) as r:
+                if r.status_code != 200:
+                    text = r.text
+                    self._record(name, time.perf_counter() - t0, wire=len(r.content), decoded=len(r.content),
+                                 error=True)
+                    if r.status_code == 429 and self.scheduler is not None:
+                        self.scheduler.rate_limited_for(r.headers.get("Retry-After"))
+                    return r.status_code, text
+
+                def body():
+                    nonlocal decoded
+                    for chunk in r.iter_content(chunk_size):
+                        decoded += len(chunk)
+                        yield chunk
+
+                builder = ColumnBuilder(schema)
+                for row in iter_json_array(iter_text(body())):
+                    builder.add(row)
+                wire = r.raw.tell() if hasattr(r.raw, "tell") else decoded
+        except Exception:
+            self._record(name, time.perf_counter() - t0, error=True)
+            raise
+        self._record(name, time.perf_counter() - t0, wire=wire or decoded, decoded=decoded)
+        return 200, builder.columns()
+
+    def _stale(self, name, cached, status, text):
+        if cached is None:
+            return status, text
+        with self._lock:
+            self._stats.setdefault(name, EndpointStats()).stale += 1
+        return 200, cached[2]
+
+    def post_form(self, url: str, data: dict, timeout: float = 10):
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        return self._send("POST", url, data=data, headers=headers, timeout=timeout)
+
+    def _send(self, method: str, url: str, **kwargs):
+        name = endpoint_name(url)
+        t0 = time.perf_counter()
+        try:
+            r = self.session.request(method, url, **kwargs)
+            content = r.content
+        except Exception:
+            self._record(name, time.perf_counter() - t0, error=True)
+            raise
+        # Content-Length is the compressed size when the body was gzipped
+        wire = int(r.headers.get("Content-Length") or 0) or len(content)
+        self._record(
+            name,
+            time.perf_counter() - t0,
+            wire=wire,
+            decoded=len(content),
+            not_modified=r.status_code == 304,
+            error=r.status_code >= 400,
+        )
+        return r
+
+    def _record(self, name, seconds, wire=0, decoded=0, not_modified=False, error=False):
+        with self._lock:
+            s = self._stats.setdefault(name, EndpointStats())
+            s.requests += 1
+            s.seconds += seconds
+            s.bytes_wire += wire
+            s.bytes_decoded += decoded
+            s.not_modified += int(not_modified)
+            s.errors += int(error)
+
+    def stats(self):
+        """Copy of the per-endpoint counters, safe to render."""
+        with self._lock:
+            return {name: dict(asdict(s), avg_ms=round(s.avg_ms, 1)) for name, s in self._stats.items()}
+
+
+class TokenManager:
+    """One OpenF1 access token per process, refreshed before it expires.
+
+    The lifetime comes from the token response's `expires_in`; a timer
+    refreshes the token `refresh_margin` seconds before that. Only one
+    refresh runs at a time, and `token()` returns the current token without
+    locking, so requests never wait on the token endpoint unless there is
+    no valid token at all.
+    """
+
+    def __init__(self, http: OpenF1Http, url: str, username: str, password: str,
+                 refresh_margin: float = 60.0, default_lifetime: float = 3600.0):
+        self.http = http
+        self.url = url
+        self.refresh_margin = refresh_margin
+        self.default_lifetime = default_lifetime
+        self.last_status = None
+        self.refreshes = 0
+        self._credentials = {"username": username, "password": password}
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def token(self):
+        token = self._token
+        if token is not None and time.time() < self._expires_at:
+            return token
+        return self._refresh(stale=token)
+
+    def invalidate(self, stale_token):
+        """Called after a 401: refresh unless another thread already did."""
+        return self._refresh(stale=stale_token)
+
+    @property
+    def expires_in(self):
+        return max(self._expires_at - time.time(), 0.0)
+
+    def _refresh(self, stale=None):
+        with self._lock:
+            # Someone else refreshed while we were waiting for the lock
+            if self._token is not None and self._token != stale and time.time() < self._expires_at:
+                return self._token
+
+            resp = self.http.post_form(self.url, self._credentials)
+            self.last_status = resp.status_code
+            if resp.status_code != 200:
+                return self._token if time.time() < self._expires_at and self._token != stale else None
+
+            data = resp.json()
+            lifetime = float(data.get("expires_in") or self.default_lifetime)
+            self._token = data.get("access_token")
+            self._expires_at = time.time() + lifetime
+            self.refreshes += 1
+            self._schedule(lifetime - self.refresh_margin)
+            return self._token
+
+    def _schedule(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(max(delay, 5.0), self._refresh_in_background)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh_in_background(self):
+        try:
+            if self._refresh(stale=self._token) is not None:
+                return
+        except Exception:
+            pass
+        # Keep the current token until it expires and try again shortly
+        self._schedule(30.0)
@@ -0,0 +1,110 @@
+"""Background warming of the OpenF1 responses a viewer is likely to ask for next."""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _key(endpoint: str, schema):
+    return endpoint, tuple(schema.items()) if schema else None
+
+
+class Prefetcher:
+    """Fetches likely-next endpoints on a few background threads and hands each answer out once.
+
+    Every viewer (`owner`) has one plan at a time: `warm(owner, requests)`
+    replaces it, dropping that owner's requests that have not started yet,
+    so browsing away stops the warming for sessions nobody will open. The
+    `max_workers` threads are shared by all viewers, which bounds how much
+    of the rate limit prefetching can take. `take(endpoint, schema)` returns
+    a warmed `(status, payload)` no older than `max_age` seconds and forgets
+    it, so live data is never served twice from here.
+    """
+
+    def __init__(self, fetch, max_workers: int = 2, max_entries: int = 64, max_age: float = 120.0):
+        self.fetch = fetch
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="openf1-prefetch")
+        self._warm = OrderedDict()  # (endpoint, schema) -> (fetched_at, status, payload)
+        self._plans = OrderedDict()  # owner -> (requests, futures)
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self.warmed = 0
+        self.hits = 0
+        self.expired = 0
+        self.cancelled = 0
+        self.errors = 0
+
+    def warm(self, owner, requests):
+        """Make `requests` ([(endpoint, schema)], most wanted first) `owner`'s plan."""
+        requests = list(requests)
+        with self._lock:
+            plan = self._plans.get(owner)
+            if plan is not None and plan[0] == requests:
+                self._plans.move_to_end(owner)
+                return
+        self.cancel(owner)
+        futures = [self._pool.submit(self._run, endpoint, schema) for endpoint, schema in requests]
+        with self._lock:
+            self._plans[owner] = (requests, futures)
+            while len(self._plans) > 256:
+                self._plans.popitem(last=False)
+
+    def cancel(self, owner):
+        with self._lock:
+            plan = self._plans.pop(owner, None)
+        if plan is not None:
+            dropped = sum(f.cancel() for f in plan[1])
+            with self._lock:
+                self.cancelled += dropped
+
+    def take(self, endpoint: str, schema=None):
+        """The warmed answer for `endpoint`, or None."""
+        with self._lock:
+            entry = self._warm.pop(_key(endpoint, schema), None)
+            if entry is not None and time.monotonic() - entry[0] > self.max_age:
+                self.expired += 1
+                entry = None
+            if entry is None:
+                return None
+            self.hits += 1
+        return entry[1], entry[2]
+
+    def _run(self, endpoint, schema):
+        key = _key(endpoint, schema)
+        with self._lock:
+            entry = self._warm.get(key)
+            if key in self._in_flight or (entry is not None and time.monotonic() - entry[0] <= self.max_age):
+                return
+            self._in_flight.add(key)
+        try:
+            status, payload = self.fetch(endpoint, schema=schema)
+        except Exception:
+            status, payload = None, None
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
+        with self._lock:
+            if status != 200:
+                self.errors += 1
+                return
+            self._warm[key] = (time.monotonic(), status, payload)
+            self._warm.move_to_end(key)
+            while len(self._warm) > self.max_entries:
+                self._warm.popitem(last=False)
+            self.warmed += 1
+
+    def stats(self):
+        with self._lock:
+            pending = sum(not f.done() for _, futures in self._plans.values() for f in futures)
+            return {
+                "pending": pending,
+                "in_flight": len(self._in_flight),
+                "ready": len(self._warm),
+                "warmed": self.warmed,
+                "hits": self.hits,
+                "expired": self.expired,
+                "cancelled": self.cancelled,
+                "errors": self.errors,
+            }
@@ -0,0 +1,203 @@
+"""Per-lap race state (positions, gaps, tyres) for every driver, for rewinding to any lap."""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from live_data import LapTable, StintIndex, TimingTower
+from schema import LAPS_DOWN, split_gap
+
+# Milliseconds in a driver's slot of the as-of key: driver * _SPAN + ms since the origin
+_SPAN = 2 ** 40
+
+
+def _ms(dates, origin):
+    return (np.asarray(dates, dtype="datetime64[ms]") - origin).astype("int64")
+
+
+class AsOfStream:
+    """One date-stamped stream (an IncrementalFeed's history) sorted for as-of lookups.
+
+    Rows are kept sorted by a single (driver, time) key, like StintIndex, so
+    the latest row at or before each of a batch of (driver, time) pairs is one
+    `searchsorted`. `extend` pulls only the rows the feed received since the
+    previous call; gap columns are split into seconds and laps down once.
+    """
+
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self.rows = 0
+        self.origin = None
+        self.newest = None
+        self._keys = np.array([], dtype="int64")
+        self._drivers = np.array([], dtype="int64")
+        self._values = {name: np.array([], dtype="float64") for name in self.fields}
+
+    def extend(self, feed):
+        """Fold in the feed's new rows; True if there were any."""
+        columns, total = feed.history(self.rows)
+        self.rows = total
+        if not columns or not len(columns.get("date", ())):
+            return False
+        dates = np.asarray(columns["date"], dtype="datetime64[ms]")
+        if self.origin is None:
+            self.origin = dates.min()
+        newest = dates.max()
+        self.newest = newest if self.newest is None else max(self.newest, newest)
+
+        values = {}
+        for name in self.fields:
+            if name in columns:
+                raw = columns[name]
+                values[name] = split_gap(raw)[0] if raw.dtype == object else raw.astype("float64")
+            elif name in LAPS_DOWN.values():
+                source = next(k for k, v in LAPS_DOWN.items() if v == name)
+                values[name] = split_gap(columns[source])[1].astype("float64")
+        drivers = np.asarray(columns["driver_number"], dtype="int64")
+        keys = np.concatenate([self._keys, drivers * _SPAN + _ms(dates, self.origin)])
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self._drivers = np.concatenate([self._drivers, drivers])[order]
+        for name in self.fields:
+            self._values[name] = np.concatenate([self._values[name], values[name]])[order]
+        return True
+
+    def lookup(self, drivers, dates):
+        """Each field's latest value for every (driver, date) pair; NaN before a driver's first row."""
+        drivers = np.asarray(drivers, dtype="int64")
+        out = {name: np.full(len(drivers), np.nan) for name in self.fields}
+        if not len(self._keys) or not len(drivers):
+            return out
+        rows = np.searchsorted(self._keys, drivers * _SPAN + _ms(dates, self.origin), side="right") - 1
+        safe = np.maximum(rows, 0)
+        hit = (rows >= 0) & (self._drivers[safe] == drivers)
+        for name in self.fields:
+            out[name][hit] = self._values[name][safe[hit]]
+        return out
+
+
+class RaceState:
+    """One row per (lap, driver): where everyone stood as they completed each lap.
+
+    Lap end times come from the LapTable (start + duration, or the next
+    lap's start when the duration is missing). Positions and gaps are an
+    as-of join of the position and interval streams against them. A row is
+    final once the streams have moved past its lap end, so
+    `update` only ever joins laps completed since it last ran (plus the few
+    still provisional ones). Tyres are filled from the StintIndex and
+    refreshed on every row, final ones included, whenever stints change. `at(lap)` is a slice of a frame
+    sorted by lap, shaped like TimingTower.frame, so scrubbing to a lap
+    recomputes nothing.
+    """
+
+    COLUMNS = {"lap": "int64", "driver_number": "int64", **TimingTower.COLUMNS}
+
+    def __init__(self):
+        self.intervals = AsOfStream(["gap_to_leader", "laps_down", "interval", "interval_laps"])
+        self.positions = AsOfStream(["position"])
+        self.frame = self._empty()
+        self._final = self._empty()
+        self._done = {}  # driver_number -> last lap with a final row
+        self._laps = None
+        self._stints = None
+        self._lap_index = np.array([], dtype="int64")
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _empty(cls):
+        return pd.DataFrame({c: pd.Series(dtype=t) for c, t in cls.COLUMNS.items()})
+
+    @property
+    def max_lap(self):
+        return int(self._lap_index[-1]) if len(self._lap_index) else 0
+
+    def update(self, laps: LapTable, stints: StintIndex, intervals_feed, positions_feed):
+        """Extend the table with newly completed laps; returns `max_lap`."""
+        with self._lock:
+            fresh = self.intervals.extend(intervals_feed) | self.positions.extend(positions_feed)
+            if not fresh and laps is self._laps and stints is self._stints:
+                return self.max_lap
+            new_stints = stints is not self._stints
+            if new_stints and len(self._final):
+                self._final = self._with_tyres(self._final, stints)
+            rebuilt = (fresh or laps is not self._laps) and self._extend(laps, stints)
+            if new_stints and not rebuilt and len(self.frame):
+                self.frame = self._with_tyres(self.frame, stints)
+            self._laps, self._stints = laps, stints
+            self._lap_index = self.frame["lap"].to_numpy(dtype="int64")
+            return self.max_lap
+
+    def _extend(self, laps: LapTable, stints: StintIndex):
+        """Join laps completed since the last call; True if `frame` was rebuilt."""
+        frame = laps.frame
+        if frame.empty or "date_start" not in frame.columns:
+            return False
+        drivers = frame.index.get_level_values("driver_number").to_numpy(dtype="int64")
+        lap_numbers = frame.index.get_level_values("lap_number").to_numpy(dtype="int64")
+        starts = frame["date_start"].to_numpy(dtype="datetime64[ms]")
+        duration = frame["lap_duration_num"].to_numpy(dtype="float64")
+        # The frame is sorted by (driver, lap): the next row is the driver's next lap
+        same_driver = np.r_[drivers[1:] == drivers[:-1], False]
+        next_start = np.where(same_driver, np.r_[starts[1:], np.datetime64("NaT", "ms")], np.datetime64("NaT", "ms"))
+        ends = np.where(
+            np.isfinite(duration),
+            starts + np.nan_to_num(duration * 1000.0).astype("int64").astype("timedelta64[ms]"),
+            next_start,
+        )
+        best = pd.Series(duration).groupby(drivers).cummin().to_numpy()
+
+        done = np.fromiter((self._done.get(d, 0) for d in drivers), dtype="int64", count=len(drivers))
+        new = (lap_numbers > done) & ~np.isnat(ends)
+        if not new.any():
+            return False
+        drivers, lap_numbers, ends = drivers[new], lap_numbers[new], ends[new]
+        rows = pd.DataFrame({
+            "lap": lap_numbers,
+            "driver_number": drivers,
+            **self.positions.lookup(drivers, ends),
+            **self.intervals.lookup(drivers, ends),
+            "lap_number": lap_numbers.astype("float64"),
+            "last_lap": duration[new],
+            "best_lap": best[new],
+        })
+        rows = self._with_tyres(rows, stints)
+
+        # Both feeds are polled together and positions only arrive on a change,
+        # so the newest date either has seen is how far the data is complete
+        horizons = [s.newest for s in (self.intervals, self.positions) if s.newest is not None]
+        final = ends <= max(horizons) if horizons else np.zeros(len(ends), dtype=bool)
+        if final.any():
+            self._final = pd.concat([self._final, rows[final]], ignore_index=True)
+            last = rows[final].groupby("driver_number")["lap"].max()
+            self._done.update({int(d): int(n) for d, n in last.items()})
+        self.frame = (
+            pd.concat([self._final, rows[~final]], ignore_index=True)
+            .sort_values(["lap", "driver_number"], kind="stable")
+            .reset_index(drop=True)
+        )
+        return True
+
+    @staticmethod
+    def _with_tyres(rows: pd.DataFrame, stints: StintIndex):
+        laps = rows["lap"].to_numpy(dtype="float64")
+        hit_rows = stints.locate(rows["driver_number"].to_numpy(dtype="int64"), laps)
+        hit = hit_rows >= 0
+        safe = np.maximum(hit_rows, 0)
+        compound = np.full(len(rows), None, dtype=object)
+        age = np.full(len(rows), np.nan)
+        if len(stints):
+            st = stints.frame
+            compound[hit] = st["compound"].to_numpy(dtype=object)[safe[hit]]
+            age[hit] = (
+                st["tyre_age_at_start"].to_numpy(dtype="float64")[safe[hit]]
+                + laps[hit] - st["lap_start"].to_numpy(dtype="float64")[safe[hit]]
+            )
+        return rows.assign(compound=compound, tyre_age=age)
+
+    def at(self, lap: int):
+        """Every driver's row for `lap`, indexed by driver_number in running order."""
+        with self._lock:
+            a, b = np.searchsorted(self._lap_index, [lap, lap + 1])
+            rows = self.frame.iloc[a:b]
+        out = rows.set_index("driver_number")[list(TimingTower.COLUMNS)]
+        return out.sort_values("position", na_position="last")
@@ -0,0 +1,75 @@
+"""Reuse rendered HTML fragments while the inputs they are built from are unchanged."""
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def fingerprint(value):
+    """Stable digest of the inputs of a fragment: frames, containers and scalars."""
+    h = hashlib.blake2b(digest_size=16)
+    _feed(h, value)
+    return h.hexdigest()
+
+
+def _feed(h, value):
+    if isinstance(value, pd.DataFrame):
+        h.update(b"F" + repr(list(value.columns)).encode())
+        h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, pd.Series):
+        h.update(b"S" + repr(value.name).encode())
+        h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, dict):
+        h.update(b"{")
+        for k in sorted(value, key=repr):
+            _feed(h, k)
+            _feed(h, value[k])
+        h.update(b"}")
+    elif isinstance(value, (list, tuple)):
+        h.update(b"[")
+        for v in value:
+            _feed(h, v)
+        h.update(b"]")
+    else:
+        h.update(repr(value).encode())
+
+
+class RenderCache:
+    """LRU of HTML strings keyed on (fragment name, fingerprint of its inputs).
+
+    Shared by every viewer: the markup only depends on the inputs, so two
+    viewers looking at the same driver reuse each other's renders. Hits and
+    misses are counted per fragment name.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def render(self, name: str, inputs, build):
+        """Markup for `inputs`, calling `build()` only when they have not been seen."""
+        key = (name, fingerprint(inputs))
+        with self._lock:
+            stats = self._stats.setdefault(name, [0, 0])
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+                stats[0] += 1
+                return html
+            stats[1] += 1
+        html = build()
+        with self._lock:
+            self._entries[key] = html
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {"hits": hits, "misses": misses, "hit_rate": round(hits / (hits + misses), 3) if hits + misses else 0.0}
+                for name, (hits, misses) in self._stats.items()
+            }
@@ -0,0 +1,104 @@
+"""Record OpenF1 responses to a log and play them back later at Nx speed."""
+import json
+import threading
+import time
+from bisect import bisect_right
+from urllib.parse import unquote
+
+
+def split_date_filter(endpoint: str):
+    """('intervals?session_key=1', '2024-...') for an endpoint with a `date>` filter."""
+    path, _, query = endpoint.partition("?")
+    kept, cutoff = [], None
+    for part in query.split("&") if query else []:
+        if part.startswith("date>") and not part.startswith("date>="):
+            cutoff = unquote(part[len("date>"):])
+        else:
+            kept.append(part)
+    return (f"{path}?{'&'.join(kept)}" if kept else path), cutoff
+
+
+class ReplayRecorder:
+    """Appends every response to a JSON-lines log: {t, endpoint, status, payload}."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, status, payload):
+        line = json.dumps({"t": time.time(), "endpoint": endpoint, "status": status, "payload": payload})
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class ReplayPlayer:
+    """Serves a recorded log as if it were OpenF1, with time running `speed` times faster.
+
+    Requests see the newest response recorded for the same endpoint at or
+    before the current replay time. Endpoints fetched with a `date>` filter
+    (the incremental feeds) are answered from every row recorded so far, so
+    deltas line up however the replayed app happens to poll.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False):
+        self.path = path
+        self.speed = float(speed) if speed else 1.0
+        self.loop = loop
+        self._entries = {}  # base endpoint -> (times, [(status, payload)])
+        self._incremental = set()
+        first, last = None, None
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                rec = json.loads(line)
+                base, cutoff = split_date_filter(rec["endpoint"])
+                if cutoff is not None:
+                    self._incremental.add(base)
+                times, items = self._entries.setdefault(base, ([], []))
+                times.append(rec["t"])
+                items.append((rec["status"], rec["payload"]))
+                first = rec["t"] if first is None else min(first, rec["t"])
+                last = rec["t"] if last is None else max(last, rec["t"])
+        for base, (times, items) in self._entries.items():
+            order = sorted(range(len(times)), key=times.__getitem__)
+            self._entries[base] = ([times[i] for i in order], [items[i] for i in order])
+        self.start = first or 0.0
+        self.end = last or 0.0
+        self._started = time.monotonic()
+
+    def now(self):
+        """Current position in log time."""
+        elapsed = (time.monotonic() - self._started) * self.speed
+        duration = self.end - self.start
+        if self.loop and duration > 0:
+            elapsed %= duration
+        return min(self.start + elapsed, self.end)
+
+    @property
+    def progress(self):
+        duration = self.end - self.start
+        return (self.now() - self.start) / duration if duration > 0 else 1.0
+
+    def fetch(self, endpoint: str):
+        base, cutoff = split_date_filter(endpoint)
+        times, items = self._entries.get(base, ([], []))
+        n = bisect_right(times, self.now())
+        if base not in self._incremental:
+            # Reference data (meetings, sessions, drivers) may have been first
+            # fetched a little after the log starts: serve the earliest copy.
+            return items[max(n, 1) - 1] if items else (200, [])
+        if n == 0:
+            return 200, []
+
+        rows, seen = [], set()
+        for status, payload in items[:n]:
+            if status != 200:
+                continue
+            for row in payload or []:
+                date = row.get("date") or ""
+                key = (row.get("driver_number"), date)
+                if (cutoff is None or date > cutoff) and key not in seen:
+                    seen.add(key)
+                    rows.append(row)
+        return 200, rows
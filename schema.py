@@ -0,0 +1,90 @@
+"""Compact typed layouts for OpenF1 frames: datetime64 dates, small ints, categoricals, split gaps."""
+import numpy as np
+import pandas as pd
+
+from json_stream import typed_array
+
+DATE = "datetime64[ns]"
+# Seconds, or "+N LAP(S)" for lapped cars: stored as float64 seconds plus an int8 laps-down column
+GAP = "gap"
+
+SCHEMAS = {
+    "laps": {
+        "driver_number": "int16",
+        "lap_number": "int16",
+        "date_start": DATE,
+        "lap_duration": "float64",
+        "is_pit_out_lap": "bool",
+        "duration_sector_1": "float32",
+        "duration_sector_2": "float32",
+        "duration_sector_3": "float32",
+        "i1_speed": "float32",
+        "i2_speed": "float32",
+        "st_speed": "float32",
+    },
+    "stints": {
+        "driver_number": "int16",
+        "stint_number": "int8",
+        "lap_start": "int16",
+        "lap_end": "float32",
+        "compound": "category",
+        "tyre_age_at_start": "float32",
+    },
+    "intervals": {"date": DATE, "driver_number": "int16", "gap_to_leader": GAP, "interval": GAP},
+    "positions": {"date": DATE, "driver_number": "int16", "position": "int16"},
+}
+
+# Rows missing any of these are dropped before typing
+KEYS = {
+    "laps": ("driver_number", "lap_number"),
+    "stints": ("driver_number", "lap_start"),
+    "intervals": ("driver_number",),
+    "positions": ("driver_number",),
+}
+
+# Where the laps-down part of each gap column goes
+LAPS_DOWN = {"gap_to_leader": "laps_down", "interval": "interval_laps"}
+
+
+def split_gap(values):
+    """Mixed gap values -> (float64 seconds, int8 laps down); "+1 LAP" is (NaN, 1)."""
+    values = pd.Series(values, dtype=object)
+    seconds = pd.to_numeric(values, errors="coerce").to_numpy(dtype="float64")
+    laps = values.astype(str).str.extract(r"(\d+)\s*LAP", expand=False)
+    return seconds, pd.to_numeric(laps, errors="coerce").fillna(0).to_numpy(dtype="int8")
+
+
+def convert(values, kind: str):
+    """One column -> `kind` (a NumPy dtype, DATE, "category" or "bool")."""
+    if kind == "category":
+        return pd.Categorical(values)
+    if kind == "bool":
+        return pd.Series(values, dtype=object).fillna(False).to_numpy(dtype=bool)
+    if kind == DATE and np.issubdtype(np.asarray(values).dtype, np.datetime64):
+        return np.asarray(values, dtype=DATE)
+    return typed_array(list(values), kind)
+
+
+def typed_frame(endpoint: str, data):
+    """Rows, column arrays or a frame -> a frame with the endpoint's compact dtypes.
+
+    Columns the schema does not know are kept as they are.
+    """
+    if isinstance(data, pd.DataFrame):
+        frame = data
+    else:
+        frame = pd.DataFrame(data if isinstance(data, dict) else list(data or []))
+    keys = [k for k in KEYS.get(endpoint, ()) if k in frame.columns]
+    if keys:
+        frame = frame.dropna(subset=keys)
+    schema = SCHEMAS.get(endpoint, {})
+    out = {}
+    for name in frame.columns:
+        kind = schema.get(name)
+        if kind is None:
+            out[name] = frame[name]
+        elif kind == GAP:
+            out[name], out[LAPS_DOWN[name]] = split_gap(frame[name])
+        else:
+            out[name] = convert(frame[name], kind)
+    return pd.DataFrame(out, index=frame.index)
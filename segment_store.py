@@ -0,0 +1,404 @@
+"""Append-only columnar segments of OpenF1 responses, written by one ingestion worker and read by every dashboard."""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from json_stream import typed_array
+from replay import split_date_filter
+
+# Endpoints polled with a `date>` filter: their segments are deltas to append,
+# every other endpoint's newest segment replaces the previous ones.
+INCREMENTAL_ENDPOINTS = ("intervals", "positions", "car_data", "location")
+DATE = "datetime64[ns]"
+# Seconds between refreshes of a read endpoint's `wanted/` entry
+WANTED_REFRESH = 300.0
+
+
+def is_incremental(endpoint: str):
+    return endpoint.split("?", 1)[0] in INCREMENTAL_ENDPOINTS
+
+
+def _write_atomic(path: str, text: str):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def rows_to_columns(rows):
+    """List of dicts -> {column: [values]}, keys in first-seen order, None where a row lacks one."""
+    names = {}
+    for row in rows:
+        for name in row:
+            names.setdefault(name, None)
+    return {name: [row.get(name) for row in rows] for name in names}
+
+
+def payload_digest(payload):
+    return hashlib.blake2b(json.dumps(payload, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+
+class _Stream:
+    """One stream as of its first `segments` segments, never changed once built.
+
+    Incremental streams keep only typed arrays: every row's `date`, the
+    newest date of each segment, and each (column, dtype) some reader has
+    asked for. Reference streams keep the raw columns of their newest
+    segment. A reader can hold on to a _Stream while newer versions are
+    loaded next to it.
+    """
+
+    __slots__ = ("first", "segments", "incremental", "dates", "newest", "columns", "typed", "raw_bytes", "nbytes")
+
+    def __init__(self, first, segments, incremental, dates=None, newest=None, columns=None, typed=None, raw_bytes=0):
+        self.first = first
+        self.segments = segments
+        self.incremental = incremental
+        self.dates = dates
+        self.newest = newest
+        self.columns = columns
+        self.typed = typed or {}
+        self.raw_bytes = raw_bytes
+        arrays = [a for a in (dates, newest, *self.typed.values()) if a is not None]
+        self.nbytes = raw_bytes + sum(a.nbytes for a in arrays)
+
+    @property
+    def rows(self):
+        if self.dates is not None:
+            return len(self.dates)
+        return len(next(iter(self.columns.values()), []))
+
+    def with_typed(self, typed):
+        return _Stream(self.first, self.segments, self.incremental, self.dates, self.newest, self.columns,
+                       {**self.typed, **typed}, self.raw_bytes)
+
+
+def _from_dates(stream: _Stream, name: str, dtype):
+    return name == "date" and stream.incremental and str(dtype).startswith("datetime64")
+
+
+def _column(columns: dict, name: str, rows: int):
+    return columns.get(name) or [None] * rows
+
+
+class SegmentStore:
+    """OpenF1 responses on local disk as immutable segments plus a `HEAD` manifest.
+
+    Layout under `root`: `streams/<endpoint>/<n>.json` holds the n-th
+    segment of an endpoint (query string included, `date>` filter
+    stripped) as JSON columns; `HEAD.json` lists how many segments every
+    stream has. The writer (`append` then `commit`) only ever adds files
+    and swaps `HEAD.json` atomically, so a reader sees either the previous
+    or the next version in full. Every process or host reading the same
+    directory therefore serves the same data for the same version.
+
+    Only segments from a stream's `first` on are kept: a reference stream's
+    new segment replaces the older ones, and `compact` merges an
+    incremental stream's segments into one. The files a commit supersedes
+    are deleted right after it; a reader still on the previous HEAD just
+    reloads it.
+
+    `fetch(endpoint, schema=None)` answers like OpenF1: the newest segment
+    for reference endpoints, and every row newer than the `date>` cutoff
+    for incremental ones. Endpoints the store has never seen are written
+    to `wanted/` for the worker to pick up, and answered with 503 meanwhile;
+    the entries of endpoints still being read are refreshed every
+    WANTED_REFRESH seconds so the worker can drop the ones nobody reads.
+
+    Loaded streams are cached as typed arrays, least recently used first
+    out once they hold more than `max_bytes`. A new version builds new
+    arrays instead of growing the cached ones, so readers never see a
+    stream change under them.
+    """
+
+    def __init__(self, root: str, max_bytes: int = 256 * 2**20):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.head_path = os.path.join(root, "HEAD.json")
+        self.wanted_dir = os.path.join(root, "wanted")
+        os.makedirs(os.path.join(root, "streams"), exist_ok=True)
+        os.makedirs(self.wanted_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._head = {"version": 0, "written_at": None, "streams": {}}
+        self._head_stat = None
+        self._loaded = OrderedDict()  # base endpoint -> _Stream
+        self._loaded_bytes = 0
+        self._pending = {}  # base endpoint -> segments written since the last commit
+        self._first = {}  # base endpoint -> its `first` segment once the next commit is out
+        self._wanted_at = {}  # base endpoint -> monotonic time its `wanted/` entry was last refreshed
+        self._lock = threading.Lock()
+        self._reload_head()
+
+    def _stream_dir(self, base: str):
+        return os.path.join(self.root, "streams", quote(base, safe=""))
+
+    def _segment_path(self, base: str, n: int):
+        return os.path.join(self._stream_dir(base), f"{n:08d}.json")
+
+    def _reload_head(self):
+        try:
+            st = os.stat(self.head_path)
+        except FileNotFoundError:
+            return self._head
+        stamp = (st.st_mtime_ns, st.st_size, st.st_ino)
+        if stamp != self._head_stat:
+            with open(self.head_path, encoding="utf-8") as f:
+                self._head = json.load(f)
+            self._head_stat = stamp
+        return self._head
+
+    @property
+    def version(self):
+        with self._lock:
+            return self._reload_head()["version"]
+
+    @property
+    def cached_bytes(self):
+        return self._loaded_bytes
+
+    def _read_segment(self, base: str, n: int):
+        with open(self._segment_path(base, n), encoding="utf-8") as f:
+            return json.load(f)
+
+    def _load(self, base: str, first: int, count: int, incremental: bool, previous: _Stream = None):
+        # Segments never change once written: only read the ones added since,
+        # unless a compaction replaced the ones `previous` was built from
+        if not incremental:
+            path = self._segment_path(base, count - 1)
+            segment = self._read_segment(base, count - 1)
+            return _Stream(first, count, False, columns=segment["columns"], raw_bytes=os.path.getsize(path))
+        if previous is None or not previous.incremental or previous.first != first or previous.segments > count:
+            previous = _Stream(first, first, True, np.array([], dtype=DATE), np.array([], dtype=DATE),
+                               typed={key: typed_array([], key[1]) for key in (previous.typed if previous else ())})
+        dates, newest = [previous.dates], [previous.newest]
+        typed = {key: [values] for key, values in previous.typed.items()}
+        for n in range(previous.segments, count):
+            segment = self._read_segment(base, n)
+            rows, columns = segment["rows"], segment["columns"]
+            part = typed_array(_column(columns, "date", rows), DATE)
+            dates.append(part)
+            newest.append(part.max(keepdims=True) if rows else np.array(["NaT"], dtype=DATE))
+            for (name, dtype), parts in typed.items():
+                parts.append(typed_array(_column(columns, name, rows), dtype))
+        return _Stream(first, count, True, np.concatenate(dates), np.concatenate(newest),
+                       typed={key: np.concatenate(parts) for key, parts in typed.items()})
+
+    def _typed(self, base: str, stream: _Stream, schema: dict):
+        missing = [
+            (name, dtype) for name, dtype in schema.items()
+            if (name, dtype) not in stream.typed and not _from_dates(stream, name, dtype)
+        ]
+        if not missing:
+            return stream
+        if not stream.incremental:
+            rows = stream.rows
+            typed = {(name, dtype): typed_array(_column(stream.columns, name, rows), dtype) for name, dtype in missing}
+            return stream.with_typed(typed)
+        parts = {key: [] for key in missing}
+        for n in range(stream.first, stream.segments):
+            segment = self._read_segment(base, n)
+            for (name, dtype), values in parts.items():
+                values.append(typed_array(_column(segment["columns"], name, segment["rows"]), dtype))
+        return stream.with_typed({key: np.concatenate(values) for key, values in parts.items()})
+
+    def _publish(self, base: str, stream: _Stream):
+        with self._lock:
+            current = self._loaded.get(base)
+            if current is not None and current.segments > stream.segments:
+                return
+            if current is not None:
+                self._loaded_bytes -= current.nbytes
+            self._loaded[base] = stream
+            self._loaded.move_to_end(base)
+            self._loaded_bytes += stream.nbytes
+            while self._loaded_bytes > self.max_bytes and len(self._loaded) > 1:
+                _, evicted = self._loaded.popitem(last=False)
+                self._loaded_bytes -= evicted.nbytes
+
+    def fetch(self, endpoint: str, schema=None):
+        """(status_code, payload) for `endpoint`, like OpenF1 would answer it from this version."""
+        try:
+            return self._fetch(endpoint, schema)
+        except FileNotFoundError:
+            # A commit superseded the segments after HEAD was read: the new HEAD lists their replacement
+            return self._fetch(endpoint, schema)
+
+    def _fetch(self, endpoint: str, schema):
+        base, cutoff = split_date_filter(endpoint)
+        with self._lock:
+            head = self._reload_head()["streams"].get(base)
+            if not head or not head["segments"]:
+                self.misses += 1
+                self.want(base)
+                return 503, f"{base} has not been ingested yet"
+            self.hits += 1
+            now = time.monotonic()
+            if now - self._wanted_at.get(base, -WANTED_REFRESH) >= WANTED_REFRESH:
+                # Keeps the worker polling what dashboards still read
+                self._wanted_at[base] = now
+                self.want(base)
+            first, count, incremental = head.get("first", 0), head["segments"], head["incremental"]
+            cached = self._loaded.get(base)
+            if cached is not None:
+                self._loaded.move_to_end(base)
+
+        # Loading and projecting happen outside the lock on a _Stream nobody else changes
+        stream = cached
+        if stream is None or stream.segments != count:
+            stream = self._load(base, first, count, incremental, previous=cached)
+        if schema is not None:
+            stream = self._typed(base, stream, schema)
+        if stream is not cached:
+            self._publish(base, stream)
+
+        keep = None
+        if stream.incremental and cutoff is not None:
+            keep = np.flatnonzero(stream.dates > typed_array([cutoff], DATE)[0])
+            if len(keep) == stream.rows:
+                keep = None
+        if schema is not None:
+            out = {}
+            for name, dtype in schema.items():
+                if _from_dates(stream, name, dtype):
+                    values = stream.dates.astype(dtype)
+                else:
+                    values = stream.typed[(name, dtype)]
+                out[name] = values if keep is None else values[keep]
+            return 200, out
+        if not stream.incremental:
+            columns = stream.columns
+            return 200, [dict(zip(columns, values)) for values in zip(*columns.values())]
+        return 200, self._rows(base, stream, cutoff)
+
+    def _rows(self, base: str, stream: _Stream, cutoff):
+        # Row answers come straight from the segments holding rows after the cutoff
+        limit = typed_array([cutoff], DATE)[0] if cutoff is not None else None
+        segments = range(stream.segments - stream.first) if limit is None else np.flatnonzero(stream.newest > limit)
+        read = [self._read_segment(base, stream.first + int(n)) for n in segments]
+        names = list(dict.fromkeys(name for segment in read for name in segment["columns"]))
+        out = []
+        for segment in read:
+            rows, columns = segment["rows"], segment["columns"]
+            if limit is None:
+                keep = range(rows)
+            else:
+                keep = np.flatnonzero(typed_array(_column(columns, "date", rows), DATE) > limit)
+            values = [_column(columns, name, rows) for name in names]
+            out.extend({name: column[i] for name, column in zip(names, values)} for i in keep)
+        return out
+
+    def want(self, base: str):
+        """Ask the worker to poll `base`, or tell it `base` is still being read (idempotent)."""
+        path = os.path.join(self.wanted_dir, quote(base, safe=""))
+        try:
+            with open(path, "x", encoding="utf-8"):
+                pass
+        except FileExistsError:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        except OSError:
+            pass
+
+    def unwant(self, base: str):
+        try:
+            os.remove(os.path.join(self.wanted_dir, quote(base, safe="")))
+        except OSError:
+            pass
+
+    def wanted(self, max_age: float = None):
+        """Endpoints readers asked for; entries nobody asked for in `max_age` seconds are dropped."""
+        out = []
+        for name in os.listdir(self.wanted_dir):
+            if name.endswith(".tmp"):
+                continue
+            try:
+                age = time.time() - os.stat(os.path.join(self.wanted_dir, name)).st_mtime
+            except OSError:
+                continue
+            if max_age is not None and age > max_age:
+                self.unwant(unquote(name))
+                continue
+            out.append(unquote(name))
+        return sorted(out)
+
+    def segments(self, base: str):
+        return self._head["streams"].get(base, {}).get("segments", 0) + self._pending.get(base, 0)
+
+    def first(self, base: str):
+        """Number of the oldest segment `base` still needs once pending changes are committed."""
+        return self._first.get(base, self._head["streams"].get(base, {}).get("first", 0))
+
+    def last_digest(self, base: str):
+        return self._head["streams"].get(base, {}).get("digest")
+
+    def last_date(self, base: str):
+        """Newest `date` stored for an incremental stream, as written by OpenF1, or None."""
+        return self._head["streams"].get(base, {}).get("last_date")
+
+    def append(self, endpoint: str, rows, digest: str = None):
+        """Write `rows` as the stream's next segment; visible to readers after `commit`."""
+        base, _ = split_date_filter(endpoint)
+        n = self._write_segment(base, len(rows), rows_to_columns(rows))
+        if not is_incremental(base):
+            # Only the newest payload of a reference endpoint is ever read
+            self._first[base] = n
+        stream = self._head["streams"].setdefault(base, {"segments": 0, "incremental": is_incremental(base)})
+        if digest is not None:
+            stream["digest"] = digest
+        dates = [r.get("date") for r in rows if r.get("date")]
+        if dates:
+            stream["last_date"] = max([stream.get("last_date") or ""] + dates)
+
+    def _write_segment(self, base: str, rows: int, columns: dict, **extra):
+        n = self.segments(base)
+        os.makedirs(self._stream_dir(base), exist_ok=True)
+        segment = {"endpoint": base, "fetched_at": time.time(), "rows": rows, "columns": columns, **extra}
+        _write_atomic(self._segment_path(base, n), json.dumps(segment, separators=(",", ":")))
+        self._pending[base] = self._pending.get(base, 0) + 1
+        return n
+
+    def compact(self, base: str):
+        """Merge an incremental stream's segments into one; the old files go with the next commit."""
+        start, end = self.first(base), self.segments(base)
+        if not is_incremental(base) or end - start < 2:
+            return False
+        read = [self._read_segment(base, n) for n in range(start, end)]
+        names = dict.fromkeys(name for segment in read for name in segment["columns"])
+        columns = {
+            name: [value for segment in read for value in _column(segment["columns"], name, segment["rows"])]
+            for name in names
+        }
+        self._first[base] = self._write_segment(base, sum(s["rows"] for s in read), columns, merged=[start, end])
+        return True
+
+    def commit(self):
+        """Publish every segment appended since the last commit as one new version."""
+        if not self._pending:
+            return self._head["version"]
+        for base, added in self._pending.items():
+            self._head["streams"][base]["segments"] += added
+        superseded = {}
+        for base, first in self._first.items():
+            stream = self._head["streams"][base]
+            superseded[base] = range(stream.get("first", 0), first)
+            stream["first"] = first
+        self._pending, self._first = {}, {}
+        self._head["version"] += 1
+        self._head["written_at"] = time.time()
+        _write_atomic(self.head_path, json.dumps(self._head, separators=(",", ":")))
+        for base, numbers in superseded.items():
+            for n in numbers:
+                try:
+                    os.remove(self._segment_path(base, n))
+                except FileNotFoundError:
+                    pass
+        return self._head["version"]
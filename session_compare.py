@@ -0,0 +1,202 @@
+"""Lap-time distributions across many sessions, from one shared columnar store of clean laps."""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from lap_analytics import OUTLIER_RATIO
+from live_data import LapTable, StintIndex
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+_COLUMNS = {
+    "driver_number": "int16",
+    "lap_number": "int16",
+    "lap_duration": "float64",
+    "stint_number": "int8",
+    "compound": object,
+}
+
+
+def grouped_quantiles(keys, values, qs):
+    """Quantiles of `values` within every distinct row of `keys`, all groups in one sort.
+
+    Returns `(groups, counts, quantiles)`: the distinct key rows
+    (n_groups × len(keys)), the number of values in each group and an
+    n_groups × len(qs) array, interpolated like `np.quantile`'s default.
+    """
+    values = np.asarray(values, dtype="float64")
+    qs = np.asarray(qs, dtype="float64")
+    keys = np.column_stack([np.asarray(k, dtype="int64") for k in keys]) if len(values) else np.empty((0, len(keys)))
+    if not len(values):
+        return keys.astype("int64"), np.zeros(0, dtype=int), np.empty((0, len(qs)))
+    groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    ordered = values[np.lexsort((values, inverse))]
+    counts = np.bincount(inverse, minlength=len(groups))
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    pos = starts[:, None] + (counts[:, None] - 1) * qs[None, :]
+    lo = np.floor(pos).astype("int64")
+    hi = np.minimum(lo + 1, (starts + counts - 1)[:, None])
+    return groups, counts, ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def clean_laps(lap_rows, stint_rows):
+    """One session's laps -> column arrays of its clean laps with their stint and compound.
+
+    Lap 1, pit-out laps, laps without a time and laps slower than
+    `OUTLIER_RATIO` times the session's best are dropped, so what remains
+    is comparable pace.
+    """
+    laps = LapTable.from_rows(lap_rows)
+    stints = StintIndex.from_rows(stint_rows)
+    frame = laps.frame
+    drivers = frame.index.get_level_values("driver_number").to_numpy(dtype="int64")
+    lap_numbers = frame.index.get_level_values("lap_number").to_numpy(dtype="int64")
+    duration = frame["lap_duration_num"].to_numpy(dtype="float64")
+    pit_out = np.zeros(len(frame), dtype=bool)
+    if "is_pit_out_lap" in frame.columns:
+        pit_out = frame["is_pit_out_lap"].to_numpy(dtype=bool)
+    candidate = np.isfinite(duration) & (lap_numbers > 1) & ~pit_out
+    if not candidate.any():
+        return {name: np.array([], dtype=dtype) for name, dtype in _COLUMNS.items()}
+    keep = candidate & (duration <= OUTLIER_RATIO * duration[candidate].min())
+
+    rows = stints.locate(drivers[keep], lap_numbers[keep])
+    hit = rows >= 0
+    safe = np.maximum(rows, 0)
+    stint_number = np.where(hit, stints.frame["stint_number"].to_numpy(dtype="int64")[safe] if len(stints) else 0, 0)
+    compound = np.where(hit, stints.frame["compound"].to_numpy(dtype=object)[safe] if len(stints) else None, None)
+    return {
+        "driver_number": drivers[keep].astype("int16"),
+        "lap_number": lap_numbers[keep].astype("int16"),
+        "lap_duration": duration[keep],
+        "stint_number": stint_number.astype("int8"),
+        "compound": compound.astype(object),
+    }
+
+
+class LapStore:
+    """Clean laps of many sessions as flat arrays, shared by every viewer.
+
+    `load` fetches the laps and stints of any sessions it does not hold yet,
+    all at once on a pool of `max_workers` threads kept for the store's
+    lifetime; sessions listed as `live` are
+    fetched again once their copy is older than `max_age`. `columns` then
+    concatenates the requested sessions, so aggregations run over a single
+    set of arrays however many sessions are compared.
+    """
+
+    def __init__(self, max_sessions: int = 64, max_age: float = 60.0, max_workers: int = 4):
+        self.max_sessions = max_sessions
+        self.max_age = max_age
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="openf1-compare")
+        self._sessions = OrderedDict()  # session_key -> (loaded_at, columns)
+        self._lock = threading.Lock()
+
+    def _missing(self, session_keys, live):
+        now = time.monotonic()
+        with self._lock:
+            return [
+                k for k in session_keys
+                if k not in self._sessions or (k in live and now - self._sessions[k][0] > self.max_age)
+            ]
+
+    def load(self, session_keys, fetch, live=()):
+        """Make sure every session is held; returns {endpoint: status or error} for failed requests.
+
+        `fetch(endpoint)` returns `(status_code, rows)` and runs on pool
+        threads, so it must not touch the Streamlit page.
+        """
+        session_keys = [int(k) for k in session_keys]
+        live = {int(k) for k in live}
+        missing = self._missing(session_keys, live)
+        failures = {}
+        if not missing:
+            return failures
+
+        def get(endpoint):
+            try:
+                status, payload = fetch(endpoint)
+            except Exception as e:
+                failures[endpoint] = str(e)
+                return None
+            if status != 200:
+                failures[endpoint] = status
+                return None
+            return payload or []
+
+        futures = {
+            k: (self._pool.submit(get, f"laps?session_key={k}"), self._pool.submit(get, f"stints?session_key={k}"))
+            for k in missing
+        }
+        results = {k: (laps.result(), stints.result()) for k, (laps, stints) in futures.items()}
+
+        for k, (lap_rows, stint_rows) in results.items():
+            if lap_rows is None:
+                continue
+            columns = clean_laps(lap_rows, stint_rows or [])
+            with self._lock:
+                self._sessions[k] = (time.monotonic(), columns)
+                self._sessions.move_to_end(k)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+        return failures
+
+    def columns(self, session_keys):
+        """Clean laps of `session_keys` (those held) as one set of arrays, plus `session_key`."""
+        with self._lock:
+            parts = [(int(k), self._sessions[int(k)][1]) for k in session_keys if int(k) in self._sessions]
+        out = {
+            name: np.concatenate([cols[name] for _, cols in parts]) if parts else np.array([], dtype=dtype)
+            for name, dtype in _COLUMNS.items()
+        }
+        out["session_key"] = np.repeat(
+            np.array([k for k, _ in parts], dtype="int64"),
+            [len(cols["lap_duration"]) for _, cols in parts],
+        ).astype("int64")
+        return out
+
+
+def _only(columns, drivers):
+    if drivers is None:
+        return columns
+    mask = np.isin(columns["driver_number"], np.asarray(list(drivers), dtype="int64"))
+    return {name: values[mask] for name, values in columns.items()}
+
+
+def pace_bands(columns, drivers=None, percentiles=PERCENTILES):
+    """Clean-lap percentiles per (session_key, driver_number): laps, p10 … p90."""
+    columns = _only(columns, drivers)
+    groups, counts, qs = grouped_quantiles(
+        [columns["session_key"], columns["driver_number"]], columns["lap_duration"], np.asarray(percentiles) / 100.0
+    )
+    index = pd.MultiIndex.from_arrays([groups[:, 0], groups[:, 1]], names=["session_key", "driver_number"])
+    out = pd.DataFrame(qs, index=index, columns=[f"p{p:g}" for p in percentiles])
+    out.insert(0, "laps", counts)
+    return out
+
+
+def stint_pace(columns, drivers=None):
+    """Median clean lap and lap count per (session_key, driver_number, stint_number, compound)."""
+    columns = _only(columns, drivers)
+    compounds = pd.Categorical(columns["compound"])
+    groups, counts, qs = grouped_quantiles(
+        [columns["session_key"], columns["driver_number"], columns["stint_number"], compounds.codes],
+        columns["lap_duration"],
+        [0.5],
+    )
+    # Code -1 (no stint covers the lap) picks the trailing None
+    labels = np.array(list(compounds.categories) + [None], dtype=object)
+    return pd.DataFrame({
+        "session_key": groups[:, 0],
+        "driver_number": groups[:, 1],
+        "stint_number": groups[:, 2],
+        "compound": labels[groups[:, 3]],
+        "laps": counts,
+        "median": qs[:, 0],
+    })
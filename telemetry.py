@@ -0,0 +1,190 @@
+"""Car telemetry (car_data, location) for one driver, held in fixed-size ring buffers."""
+import threading
+import time
+from urllib.parse import quote
+
+import numpy as np
+
+from json_stream import iso_dates
+
+# Seconds between telemetry polls; OpenF1 samples at about 3.7 Hz
+TELEMETRY_POLL = 4.0
+SAMPLE_HZ = 3.7
+
+TELEMETRY_FIELDS = {
+    "car_data": [("speed", "f4"), ("throttle", "f4"), ("brake", "f4"), ("rpm", "f4"), ("n_gear", "i1"), ("drs", "i1")],
+    "location": [("x", "f4"), ("y", "f4"), ("z", "f4")],
+}
+
+
+def samples_for_laps(laps: int, lap_seconds: float = 100.0, hz: float = SAMPLE_HZ):
+    """Ring capacity that holds roughly `laps` laps of samples."""
+    return int(laps * lap_seconds * hz)
+
+
+class RingBuffer:
+    """Fixed-capacity NumPy structured array; the oldest samples are overwritten first."""
+
+    def __init__(self, capacity: int, dtype):
+        self.capacity = int(capacity)
+        self.dtype = np.dtype(dtype)
+        self._data = np.zeros(self.capacity, dtype=self.dtype)
+        self._start = 0
+        self._size = 0
+
+    def extend(self, records: np.ndarray):
+        n = len(records)
+        if n == 0:
+            return
+        if n >= self.capacity:
+            records, n = records[-self.capacity:], self.capacity
+        end = (self._start + self._size) % self.capacity
+        first = min(n, self.capacity - end)
+        self._data[end:end + first] = records[:first]
+        self._data[:n - first] = records[first:]
+        overflow = max(self._size + n - self.capacity, 0)
+        self._start = (self._start + overflow) % self.capacity
+        self._size = min(self._size + n, self.capacity)
+
+    def view(self):
+        """Copy of the buffered samples, oldest first."""
+        stop = self._start + self._size
+        if stop <= self.capacity:
+            return self._data[self._start:stop].copy()
+        return np.concatenate([self._data[self._start:], self._data[:stop - self.capacity]])
+
+    def __len__(self):
+        return self._size
+
+
+class TelemetryFeed:
+    """One driver's car_data or location samples, fetched as deltas.
+
+    Like IncrementalFeed, each refresh only asks for rows newer than the
+    last `date` seen. The first refresh can start at `since` (e.g. the start
+    of the lap N laps ago) instead of the session start. Samples arrive as
+    typed columns and are pushed into a ring buffer `chunk_rows` at a time,
+    so memory stays at `capacity` samples however long the session runs.
+    """
+
+    def __init__(self, endpoint: str, session_key: int, driver_number: int, capacity: int,
+                 chunk_rows: int = 4096):
+        self.endpoint = endpoint
+        self.session_key = int(session_key)
+        self.driver_number = int(driver_number)
+        self.chunk_rows = chunk_rows
+        self.fields = TELEMETRY_FIELDS[endpoint]
+        self.schema = {"date": "datetime64[ns]", **dict(self.fields)}
+        self.buffer = RingBuffer(capacity, [("t", "f8")] + self.fields)
+        self.last_date = None
+        self._lock = threading.Lock()
+
+    def query(self, since=None):
+        q = f"{self.endpoint}?session_key={self.session_key}&driver_number={self.driver_number}"
+        cutoff = self.last_date or since
+        if cutoff:
+            q += f"&date>{quote(cutoff, safe=':')}"
+        return q
+
+    def refresh(self, fetch, since=None):
+        """Fetch and buffer new samples; returns the status code.
+
+        `fetch(endpoint, schema=...)` returns typed column arrays, streamed
+        from OpenF1 without materialising a dict per sample.
+        """
+        with self._lock:
+            status, columns = fetch(self.query(since), schema=self.schema)
+            if status == 200:
+                self.ingest(columns)
+            return status
+
+    def ingest(self, columns):
+        dates = columns["date"]
+        ok = ~np.isnat(dates)
+        if not ok.any():
+            return
+        for i in range(0, int(ok.sum()), self.chunk_rows):
+            rows = np.flatnonzero(ok)[i:i + self.chunk_rows]
+            records = np.zeros(len(rows), dtype=self.buffer.dtype)
+            # Seconds since the epoch whatever the datetime unit (pandas 3 hands out [us])
+            records["t"] = (dates[rows] - np.datetime64(0, "s")) / np.timedelta64(1, "s")
+            for name, _ in self.fields:
+                records[name] = columns[name][rows]
+            self.buffer.extend(records)
+        newest = str(iso_dates(dates[ok].max()))
+        if self.last_date is None or newest > self.last_date:
+            self.last_date = newest
+
+    def samples(self):
+        with self._lock:
+            return self.buffer.view()
+
+
+class TelemetryPoller:
+    """One background refresh of a driver's TelemetryFeeds, shared by every viewer.
+
+    Like LivePoller: viewers only read the buffers through `samples()`, which
+    (re)starts a single poll thread per (session, driver), so upstream
+    traffic does not grow with the audience. The thread refreshes every
+    feed each `every` seconds and stops after `idle_timeout` seconds
+    without readers. With `live=False` (auto refresh off) a read refreshes
+    in the caller's thread instead, at most once per `every` seconds
+    however many viewers ask.
+    """
+
+    def __init__(self, feeds, fetch, every: float = TELEMETRY_POLL, idle_timeout: float = 60.0):
+        self.feeds = feeds
+        self.fetch = fetch
+        self.every = every
+        self.idle_timeout = idle_timeout
+        self.since = None
+        self.status = {}  # endpoint -> status code (or error text) of its last refresh
+        self._polled_at = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._thread = None
+        self._last_read = time.monotonic()
+
+    def samples(self, since=None, live: bool = True, wait: float = 10.0):
+        """{endpoint: buffered samples}; the first read waits up to `wait` seconds for data.
+
+        `since` (an OpenF1 date) is where the first download starts.
+        """
+        self._last_read = time.monotonic()
+        if self.since is None:
+            self.since = since
+        if live:
+            self._ensure_running()
+            self._ready.wait(wait)
+        else:
+            self._refresh()
+        return {endpoint: feed.samples() for endpoint, feed in self.feeds.items()}
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                feed = next(iter(self.feeds.values()))
+                self._thread = threading.Thread(
+                    target=self._run, name=f"openf1-telemetry-{feed.session_key}-{feed.driver_number}", daemon=True
+                )
+                self._thread.start()
+
+    def _refresh(self):
+        # Single flight: whoever waited on the lock skips a refresh that just happened
+        with self._poll_lock:
+            if self._polled_at is not None and time.monotonic() - self._polled_at < self.every:
+                return
+            for endpoint, feed in self.feeds.items():
+                try:
+                    self.status[endpoint] = feed.refresh(self.fetch, self.since)
+                except Exception as e:
+                    self.status[endpoint] = str(e)
+            self._polled_at = time.monotonic()
+            self._ready.set()
+
+    def _run(self):
+        while time.monotonic() - self._last_read < self.idle_timeout:
+            self._refresh()
+            # Wake at least once a second so an idle poller notices and exits
+            time.sleep(min(max(self._polled_at + self.every - time.monotonic(), 0.05), 1.0))
@@ -0,0 +1,88 @@
+"""Shared fixtures: the repo root on sys.path and a local stub of the OpenF1 HTTP API."""
+import gzip
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubOpenF1:
+    """Serves canned JSON per path, with ETags, gzip and scripted status codes.
+
+    `routes[path]` is the payload for `GET /v1/<path>` (query string
+    ignored); `status[path]` overrides the answer with a status code, and
+    `etags = False` stops sending validators. Every
+    request is recorded as (path, query, request headers).
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.status = {}
+        self.requests = []
+        self.etags = True
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path, _, query = self.path.partition("?")
+                name = path.rsplit("/", 1)[-1]
+                stub.requests.append((name, query, dict(self.headers)))
+                code = stub.status.get(name)
+                if code is not None:
+                    body = b"stub error"
+                    self.send_response(code)
+                    if code == 429:
+                        self.send_header("Retry-After", "0.2")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                if name not in stub.routes:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = json.dumps(stub.routes[name]).encode()
+                etag = f'"{hash(body) & 0xffffffff:x}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                if stub.etags:
+                    self.send_header("ETag", etag)
+                if "gzip" in (self.headers.get("Accept-Encoding") or ""):
+                    body = gzip.compress(body)
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def calls(self, name):
+        return [r for r in self.requests if r[0] == name]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def openf1():
+    stub = StubOpenF1()
+    yield stub
+    stub.close()
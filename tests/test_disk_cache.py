@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from disk_cache import SessionStore
+
+NOW = datetime.now(timezone.utc)
+
+
+def _session(key, ended):
+    return {"session_key": key, "meeting_key": 1, "date_end": (NOW - ended).isoformat()}
+
+
+def test_finished_session_responses_are_kept(tmp_path):
+    store = SessionStore(str(tmp_path))
+    store.put("sessions?meeting_key=1", [_session(10, timedelta(days=2)), _session(11, timedelta(minutes=5))])
+
+    assert store.is_finished(10) and not store.is_finished(11)
+    assert store.put("laps?session_key=10", [{"lap_number": 1}])
+    assert not store.put("laps?session_key=11", [{"lap_number": 1}])
+    assert store.get("laps?session_key=10") == [{"lap_number": 1}]
+    assert store.get("laps?session_key=11") is None
+
+
+def test_finished_sessions_survive_a_restart(tmp_path):
+    SessionStore(str(tmp_path)).put("sessions?session_key=10", [_session(10, timedelta(days=2))])
+    store = SessionStore(str(tmp_path))
+    assert store.is_finished(10)
+
+
+def test_live_session_list_is_only_a_stale_fallback(tmp_path):
+    store = SessionStore(str(tmp_path))
+    rows = [_session(11, timedelta(minutes=5))]
+    assert not store.put("sessions?meeting_key=1", rows)
+    assert store.get("sessions?meeting_key=1") is None
+    assert store.get("sessions?meeting_key=1", stale_ok=True) == rows
+
+
+def test_finished_feeds_are_kept_as_columns(tmp_path):
+    schema = {"date": "datetime64[ns]", "driver_number": "int16", "gap_to_leader": "object"}
+    columns = {
+        "date": np.array(["2024-03-02T15:00:00", "2024-03-02T15:00:04"], dtype="datetime64[ns]"),
+        "driver_number": np.array([1, 16], dtype="int16"),
+        "gap_to_leader": np.array([None, "+1 LAP"], dtype=object),
+    }
+    store = SessionStore(str(tmp_path))
+    store.put("sessions?meeting_key=1", [_session(10, timedelta(days=2)), _session(11, timedelta(minutes=5))])
+    assert not store.put_columns("intervals?session_key=11", columns, schema)
+    assert store.put_columns("intervals?session_key=10", columns, schema)
+
+    stored = SessionStore(str(tmp_path)).get_columns("intervals?session_key=10", schema)
+    for name, values in columns.items():
+        assert stored[name].dtype == values.dtype
+        np.testing.assert_array_equal(stored[name], values)
+    assert store.get_columns("intervals?session_key=10", {**schema, "interval": "object"}) is None
+    assert store.get_columns("intervals?session_key=11", schema) is None
@@ -0,0 +1,121 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import ingest
+from ingest import Ingestor
+from segment_store import SegmentStore
+
+
+class FakeOpenF1:
+    """`fetch(endpoint)` over canned payloads keyed by endpoint name; records every call."""
+
+    def __init__(self, ended=timedelta(minutes=5), delay=None):
+        end = (datetime.now(timezone.utc) - ended).isoformat()
+        self.payloads = {
+            "meetings": [{"meeting_key": 10}],
+            "sessions": [{"session_key": 1, "meeting_key": 10, "date_end": end}],
+            "drivers": [{"driver_number": 1}, {"driver_number": 16}],
+            "laps": [{"driver_number": 1, "lap_number": 1}],
+            "stints": [],
+            "intervals": [{"driver_number": 1, "date": "2024-03-02T15:00:00+00:00", "gap_to_leader": 0.0}],
+            "position": [],
+            "car_data": [],
+            "location": [],
+        }
+        self.delay = delay or {}
+        self.calls = []
+
+    def __call__(self, endpoint):
+        self.calls.append(endpoint)
+        name = endpoint.split("?", 1)[0]
+        time.sleep(self.delay.get(name, 0))
+        return 200, self.payloads.get(name, [])
+
+
+def _worker(tmp_path, api, telemetry=()):
+    store = SegmentStore(str(tmp_path))
+    worker = Ingestor(store, api, session="latest", telemetry=telemetry)
+    worker.run_once()
+    worker.run_once()
+    return worker, store
+
+
+def _poll_again(worker):
+    worker._due.clear()
+    return worker.run_once()
+
+
+def test_worker_stores_what_the_dashboard_reads(tmp_path):
+    api = FakeOpenF1()
+    _, store = _worker(tmp_path, api)
+
+    reader = SegmentStore(str(tmp_path))
+    assert reader.fetch("laps?session_key=1") == (200, api.payloads["laps"])
+    assert reader.fetch("intervals?session_key=1")[1] == api.payloads["intervals"]
+    assert reader.fetch("intervals?session_key=1&date>2024-03-02T15:00:00%2B00:00")[1] == []
+    assert store.last_date("intervals?session_key=1") == "2024-03-02T15:00:00+00:00"
+
+
+def test_telemetry_cannot_delay_the_live_feeds(tmp_path):
+    api = FakeOpenF1(delay={"car_data": 0.05, "location": 0.05})
+    worker, _ = _worker(tmp_path, api)
+    worker.telemetry = list(range(1, 11))
+    # The live feeds are due again in 0.2s: only that much telemetry fits before them
+    worker._due = {base: time.monotonic() + 0.2 for base in worker.schedule()
+                   if base.split("?", 1)[0] not in ("car_data", "location")}
+
+    polled = worker.run_once()
+    assert 0 < len(polled) < 20
+    assert all(base.split("?", 1)[0] in ("car_data", "location") for base in polled)
+
+    time.sleep(0.25)
+    polled = worker.run_once()
+    assert polled[0].startswith("intervals?") or polled[0].startswith("position?")
+    assert any(base.startswith("car_data?") for base in polled)
+
+
+def test_finished_sessions_stop_being_polled_once_stable(tmp_path):
+    api = FakeOpenF1(ended=timedelta(days=2))
+    worker, _ = _worker(tmp_path, api)
+    for _ in range(ingest.STABLE_POLLS):
+        _poll_again(worker)
+
+    assert "laps?session_key=1" in worker.settled
+    assert "laps?session_key=1" not in worker.schedule()
+    assert "sessions?session_key=latest" in worker.schedule()
+
+
+def test_live_sessions_keep_being_polled(tmp_path):
+    worker, _ = _worker(tmp_path, FakeOpenF1())
+    for _ in range(ingest.STABLE_POLLS + 1):
+        _poll_again(worker)
+    assert not worker.settled
+    assert "laps?session_key=1" in worker.schedule()
+
+
+def test_wanted_entries_expire_when_nobody_reads_them(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    store.want("laps?session_key=7")
+    store.want("laps?session_key=8")
+    old = time.time() - ingest.WANTED_TTL - 60
+    os.utime(os.path.join(store.wanted_dir, "laps%3Fsession_key%3D7"), (old, old))
+
+    plan = Ingestor(store, FakeOpenF1()).schedule()
+    assert "laps?session_key=7" not in plan and "laps?session_key=8" in plan
+    assert "sessions?session_key=8" in plan
+    assert store.wanted() == ["laps?session_key=8"]
+
+
+def test_incremental_streams_are_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "COMPACT_SEGMENTS", 3)
+    api = FakeOpenF1()
+    worker, store = _worker(tmp_path, api)
+    base = "intervals?session_key=1"
+    dates = [f"2024-03-02T15:00:0{second}+00:00" for second in range(3)]
+    for date in dates[1:]:
+        api.payloads["intervals"] = [{"driver_number": 1, "date": date}]
+        _poll_again(worker)
+
+    assert len(os.listdir(store._stream_dir(base))) == 1
+    assert [row["date"] for row in SegmentStore(str(tmp_path)).fetch(base)[1]] == dates
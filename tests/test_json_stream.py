@@ -0,0 +1,44 @@
+import json
+
+import numpy as np
+import pytest
+
+from json_stream import columns_from_rows, iso_dates, iter_json_array, typed_array
+
+ROWS = [{"driver_number": n, "gap_to_leader": n * 1.5, "date": f"2024-03-02T15:03:{n:02d}.5+00:00"} for n in range(1, 30)]
+
+
+def _chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 7, 4096])
+def test_iter_json_array_yields_rows_however_the_body_is_split(size):
+    assert list(iter_json_array(_chunks(json.dumps(ROWS), size))) == ROWS
+
+
+def test_iter_json_array_rejects_truncated_and_non_array_bodies():
+    with pytest.raises(ValueError):
+        list(iter_json_array(_chunks(json.dumps(ROWS)[:-20], 16)))
+    with pytest.raises(ValueError):
+        list(iter_json_array(['{"detail": "nope"}']))
+
+
+def test_typed_array_coerces_missing_and_bad_values():
+    np.testing.assert_array_equal(typed_array([1, None, "x", "4"], "int16"), [1, 0, 0, 4])
+    floats = typed_array([1.5, None, "+1 LAP"], "float64")
+    assert floats[0] == 1.5 and np.isnan(floats[1:]).all()
+    dates = typed_array(["2024-03-02T15:03:21.123+00:00", None], "datetime64[ns]")
+    assert dates[0] == np.datetime64("2024-03-02T15:03:21.123")
+    assert np.isnat(dates[1])
+
+
+def test_columns_from_rows_keeps_only_the_schema():
+    columns = columns_from_rows(ROWS, {"driver_number": "int16", "date": "datetime64[ns]"})
+    assert set(columns) == {"driver_number", "date"}
+    assert len(columns["date"]) == len(ROWS)
+
+
+def test_iso_dates_round_trip_through_typed_array():
+    dates = typed_array([r["date"] for r in ROWS], "datetime64[ns]")
+    assert list(iso_dates(dates)) == [r["date"].replace(".5+", ".500000+") for r in ROWS]
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from lap_analytics import LapAnalytics
+from live_data import LapTable, StintIndex
+
+
+def _laps(driver, durations):
+    return [{"driver_number": driver, "lap_number": n, "lap_duration": d} for n, d in enumerate(durations, start=1)]
+
+
+def _fit(analytics, driver, stint):
+    """Degradation of one stint recomputed from scratch with numpy."""
+    laps = analytics.frame().loc[driver]
+    fit = laps[laps["clean"] & (laps["stint_number"] == stint)]
+    return np.polyfit(fit["tyre_age"], fit["fuel_corrected"], 1)[0], len(fit)
+
+
+DURATIONS = [95.0, 90.0, 90.1, 90.3, 90.35, 90.5, 90.6, 90.2, 90.25, 90.4]
+
+
+def test_degradation_sums_match_a_direct_fit_across_updates():
+    stints = StintIndex.from_rows([
+        {"driver_number": 44, "stint_number": 1, "lap_start": 1, "lap_end": 6, "compound": "SOFT", "tyre_age_at_start": 2},
+        {"driver_number": 44, "stint_number": 2, "lap_start": 7, "lap_end": None, "compound": "HARD", "tyre_age_at_start": 0},
+    ])
+    analytics = LapAnalytics(9)
+    analytics.update(LapTable.from_rows(_laps(44, DURATIONS[:4])), stints)
+    analytics.update(LapTable.from_rows(_laps(44, DURATIONS)), stints)
+
+    deg = analytics.degradation()
+    for stint in (1, 2):
+        slope, n = _fit(analytics, 44, stint)
+        assert deg.loc[(44, stint), "laps"] == n
+        assert deg.loc[(44, stint), "slope"] == pytest.approx(slope)
+    assert deg.loc[(44, 2), "compound"] == "HARD"
+
+
+def test_laps_move_to_a_stint_reported_late():
+    one_stint = StintIndex.from_rows([
+        {"driver_number": 44, "stint_number": 1, "lap_start": 1, "lap_end": None, "compound": "SOFT", "tyre_age_at_start": 0},
+    ])
+    analytics = LapAnalytics(9)
+    laps = LapTable.from_rows(_laps(44, DURATIONS))
+    analytics.update(laps, one_stint)
+    assert list(analytics.degradation().index) == [(44, 1)]
+    key = analytics.key
+
+    # The pit stop after lap 6 shows up in stints only now
+    two_stints = StintIndex.from_rows([
+        {"driver_number": 44, "stint_number": 1, "lap_start": 1, "lap_end": 6, "compound": "SOFT", "tyre_age_at_start": 0},
+        {"driver_number": 44, "stint_number": 2, "lap_start": 7, "lap_end": None, "compound": "HARD", "tyre_age_at_start": 0},
+    ])
+    assert analytics.update(laps, two_stints) != key
+
+    deg = analytics.degradation()
+    assert list(deg.index) == [(44, 1), (44, 2)]
+    assert list(deg["compound"]) == ["SOFT", "HARD"]
+    for stint in (1, 2):
+        slope, n = _fit(analytics, 44, stint)
+        assert deg.loc[(44, stint), "laps"] == n
+        assert deg.loc[(44, stint), "slope"] == pytest.approx(slope)
+    assert analytics.frame().loc[(44, 7), "tyre_age"] == 0
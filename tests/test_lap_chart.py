@@ -0,0 +1,38 @@
+import numpy as np
+
+from lap_chart import LapChart, lttb
+from live_data import LapTable, StintIndex
+
+
+def test_lttb_keeps_the_ends_and_the_peaks():
+    x = np.arange(1000, dtype="float64")
+    y = np.sin(x / 50.0)
+    y[500] = 10.0
+    keep = lttb(x, y, 100)
+    assert len(keep) == 100
+    assert keep[0] == 0 and keep[-1] == 999
+    assert 500 in keep
+    assert np.all(np.diff(keep) > 0)
+
+
+def test_lttb_leaves_short_series_alone():
+    x = np.arange(10, dtype="float64")
+    np.testing.assert_array_equal(lttb(x, x, 100), np.arange(10))
+
+
+def test_lap_chart_is_labelled_per_viewer_and_cut_at_their_lap():
+    laps = LapTable.from_rows([
+        {"driver_number": d, "lap_number": n, "lap_duration": 90.0 + n / 10}
+        for d, last in ((1, 12), (16, 11)) for n in range(1, last + 1)
+    ])
+    stints = StintIndex.from_rows([])
+    chart = LapChart((1, 16))
+    chart.update(laps, stints)
+
+    fig = chart.show([(16, "LEC (You)"), (1, "VER (Ahead)")], last_lap=11)
+    names = {trace.name: len(trace.x) for trace in fig.data}
+    assert names == {"VER (Ahead)": 11, "LEC (You)": 11}
+
+    fig = chart.show([(1, "VER (You)"), (16, "LEC (Behind)")], last_lap=12)
+    names = {trace.name: (len(trace.x), trace.legendrank) for trace in fig.data}
+    assert names == {"VER (You)": (12, 1000), "LEC (Behind)": (11, 1001)}
@@ -0,0 +1,152 @@
+import threading
+import time
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from live_data import IncrementalFeed, LapTable, LivePoller, SessionSnapshot, StintIndex, TimingTower
+from schema import typed_frame
+
+STINTS = [
+    {"driver_number": 44, "stint_number": 1, "lap_start": 1, "lap_end": 20, "compound": "soft", "tyre_age_at_start": 3},
+    {"driver_number": 44, "stint_number": 2, "lap_start": 21, "lap_end": None, "compound": "HARD", "tyre_age_at_start": 0},
+    {"driver_number": 1, "stint_number": 1, "lap_start": 1, "lap_end": 30, "compound": "MEDIUM", "tyre_age_at_start": 0},
+]
+
+
+def test_stint_index_answers_per_lap_and_in_bulk():
+    stints = StintIndex.from_rows(STINTS)
+    assert stints.at(44, 5) == ("SOFT", 7)
+    assert stints.at(44, 60) == ("HARD", 39)
+    assert stints.at(1, 31) == (None, None)
+    assert stints.at(16, 1) == (None, None)
+
+    compounds, ages = stints.at_laps(44, [1, 20, 21, 50])
+    assert list(compounds) == ["SOFT", "SOFT", "HARD", "HARD"]
+    np.testing.assert_array_equal(ages, [3, 22, 0, 29])
+    rows = stints.locate([1, 1, 16], [30, 31, 1])
+    assert rows[0] >= 0 and list(rows[1:]) == [-1, -1]
+
+
+def test_lap_table_slices_each_driver():
+    laps = LapTable.from_rows([
+        {"driver_number": d, "lap_number": n, "lap_duration": 90 + d + n}
+        for d in (44, 1) for n in (2, 1, 3)
+    ])
+    assert laps.driver_numbers == [1, 44]
+    assert list(laps.driver(44).index) == [1, 2, 3]
+    summary = laps.summary()
+    assert summary.loc[44, "lap_number"] == 3 and summary.loc[1, "best_lap"] == 92
+
+
+def test_incremental_feed_asks_only_for_newer_rows():
+    feed = IncrementalFeed("intervals", 9)
+    sent = []
+
+    def fetch(endpoint):
+        sent.append(endpoint)
+        return [{"driver_number": 1, "gap_to_leader": 0.0, "date": "2024-03-02T15:00:01+00:00"},
+                {"driver_number": 4, "gap_to_leader": 1.5, "date": "2024-03-02T15:00:02+00:00"}]
+
+    frame = feed.refresh(fetch)
+    assert sent == ["intervals?session_key=9"]
+    assert isinstance(frame, pd.DataFrame) and len(frame) == 2
+    assert feed.query() == "intervals?session_key=9&date>2024-03-02T15:00:02%2B00:00"
+
+
+def test_concurrent_refreshes_share_one_request():
+    feed = IncrementalFeed("intervals", 9)
+    started, release = threading.Event(), threading.Event()
+    sent = []
+
+    def fetch(endpoint):
+        sent.append(endpoint)
+        started.set()
+        release.wait(5)
+        return [{"driver_number": 1, "gap_to_leader": 0.0, "date": "2024-03-02T15:00:01+00:00"}]
+
+    first = threading.Thread(target=feed.refresh, args=(fetch,))
+    first.start()
+    started.wait(5)
+    waiting = [threading.Thread(target=feed.refresh, args=(fetch,)) for _ in range(4)]
+    for t in waiting:
+        t.start()
+    time.sleep(0.2)  # let them all queue on the in-flight request
+    release.set()
+    for t in [first, *waiting]:
+        t.join(5)
+
+    assert sent == ["intervals?session_key=9"]
+    # A refresh that starts after the previous one finished asks again
+    feed.refresh(fetch)
+    assert len(sent) == 2
+
+
+def test_poller_retries_parts_that_failed_to_bootstrap():
+    calls = []
+    failing = {"stints"}
+
+    def fetch(endpoint, **kwargs):
+        name = endpoint.split("?", 1)[0]
+        calls.append(name)
+        if name in failing:
+            return 500, "boom"
+        return 200, []
+
+    schedule = {"session": 60, "drivers": 60, "laps": 60, "stints": 60, "intervals": 60, "positions": 60}
+    poller = LivePoller(9, fetch, schedule=schedule, idle_timeout=1.0)
+    first = poller.snapshot()
+    assert "stints" not in dict(first.updated)
+    assert set(dict(first.updated)) == set(schedule) - {"stints"}
+
+    # Retried straight away rather than a full interval later
+    deadline = time.monotonic() + 3
+    while calls.count("stints") < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert calls.count("stints") == 2 and calls.count("laps") == 1
+
+
+def _tower_snapshot():
+    laps = LapTable.from_rows([
+        {"driver_number": d, "lap_number": n, "lap_duration": 90 + d / 100 + n}
+        for d in (1, 44, 16) for n in (1, 2, 3)
+    ])
+    return SessionSnapshot(
+        session_key=9,
+        laps=laps,
+        stints=StintIndex.from_rows(STINTS),
+        positions=typed_frame("positions", [
+            {"driver_number": 44, "position": 2}, {"driver_number": 1, "position": 1}, {"driver_number": 16, "position": 3},
+        ]),
+        intervals=typed_frame("intervals", [
+            {"driver_number": 1, "gap_to_leader": None, "interval": None},
+            {"driver_number": 44, "gap_to_leader": 1.25, "interval": 1.25},
+            {"driver_number": 16, "gap_to_leader": "+1 LAP", "interval": "+1 LAP"},
+        ]),
+    )
+
+
+def test_timing_tower_builds_the_whole_grid():
+    frame = TimingTower().update(_tower_snapshot())
+    assert list(frame.index) == [1, 44, 16]
+    assert frame.loc[44, "gap_to_leader"] == 1.25 and frame.loc[16, "laps_down"] == 1
+    assert frame.loc[1, "lap_number"] == 3 and frame.loc[44, "best_lap"] == 91.44
+    assert frame.loc[1, "compound"] == "MEDIUM" and frame.loc[1, "tyre_age"] == 2
+    assert frame.loc[44, "compound"] == "HARD" and frame.loc[44, "tyre_age"] == 0
+    assert pd.isna(frame.loc[16, "compound"])
+
+
+def test_timing_tower_only_recomputes_changed_parts(monkeypatch):
+    tower = TimingTower()
+    snap = _tower_snapshot()
+    tower.update(snap)
+    monkeypatch.setattr(LapTable, "summary", lambda self: pytest.fail("laps did not change"))
+
+    moved = replace(snap, positions=typed_frame("positions", [
+        {"driver_number": 44, "position": 1}, {"driver_number": 1, "position": 2},
+    ]))
+    frame = tower.update(moved)
+    assert list(frame.index) == [44, 1, 16]
+    assert frame.loc[44, "lap_number"] == 3
@@ -0,0 +1,61 @@
+import time
+import urllib.request
+
+import pytest
+
+from metrics import Metrics
+
+
+def test_spans_record_count_average_and_max():
+    metrics = Metrics()
+    for seconds in (0.01, 0.03):
+        metrics.observe("render:tower", seconds)
+    with metrics.span("render:chart"):
+        time.sleep(0.01)
+    with pytest.raises(ValueError):
+        with metrics.span("render:chart"):
+            raise ValueError
+
+    spans = metrics.spans()
+    assert spans["render:tower"] == {"count": 2, "avg_ms": 20.0, "max_ms": 30.0, "last_ms": 30.0}
+    assert spans["render:chart"]["count"] == 2 and spans["render:chart"]["max_ms"] >= 10
+
+    metrics.reset()
+    assert metrics.spans() == {}
+
+
+def test_prometheus_text_groups_samples_by_family():
+    metrics = Metrics(prefix="f1")
+    metrics.observe("render:tower", 0.5)
+    metrics.observe("render:tower", 1.5)
+    metrics.incr("requests", endpoint="laps")
+    metrics.incr("requests", 2, endpoint='a"b')
+    metrics.add_collector(lambda: [("cache_entries", "gauge", {"cache": "render"}, 7)])
+    metrics.add_collector(lambda: 1 / 0)
+
+    lines = metrics.prometheus_text().splitlines()
+    assert lines == [
+        "# TYPE f1_span_seconds summary",
+        'f1_span_seconds_sum{span="render:tower"} 2',
+        'f1_span_seconds_count{span="render:tower"} 2',
+        "# TYPE f1_span_seconds_max gauge",
+        'f1_span_seconds_max{span="render:tower"} 1.5',
+        "# TYPE f1_requests_total counter",
+        'f1_requests_total{endpoint="laps"} 1',
+        'f1_requests_total{endpoint="a\\"b"} 2',
+        "# TYPE f1_cache_entries gauge",
+        'f1_cache_entries{cache="render"} 7',
+    ]
+
+
+def test_metrics_are_served_over_http():
+    metrics = Metrics()
+    metrics.incr("requests")
+    server = metrics.serve(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as r:
+            assert r.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert r.read().decode() == metrics.prometheus_text()
+    finally:
+        server.shutdown()
@@ -0,0 +1,210 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from openf1_client import BACKGROUND_PRIORITY, OpenF1Http, RequestScheduler, TokenManager
+
+LAPS = [
+    {"driver_number": 1, "lap_number": n, "lap_duration": 90.0 + n / 10, "date_start": "2024-03-02T15:03:21+00:00"}
+    for n in range(1, 200)
+]
+
+
+def test_unchanged_endpoint_is_revalidated_with_its_etag(openf1):
+    openf1.routes["laps"] = LAPS
+    http = OpenF1Http()
+
+    first = http.get_json(f"{openf1.base}/laps?session_key=1")
+    second = http.get_json(f"{openf1.base}/laps?session_key=1")
+
+    assert first == (200, LAPS)
+    assert second == (200, LAPS)
+    sent = openf1.calls("laps")
+    assert "If-None-Match" not in sent[0][2]
+    assert sent[1][2]["If-None-Match"]
+    assert http.stats()["laps"]["not_modified"] == 1
+
+
+def test_changed_endpoint_returns_the_new_payload(openf1):
+    openf1.routes["laps"] = LAPS[:5]
+    http = OpenF1Http()
+    http.get_json(f"{openf1.base}/laps?session_key=1")
+    openf1.routes["laps"] = LAPS[:6]
+
+    assert http.get_json(f"{openf1.base}/laps?session_key=1") == (200, LAPS[:6])
+
+
+def test_gzipped_body_counts_wire_and_decoded_bytes(openf1):
+    openf1.routes["laps"] = LAPS
+    http = OpenF1Http()
+    http.get_json(f"{openf1.base}/laps?session_key=1")
+
+    stats = http.stats()["laps"]
+    assert stats["requests"] == 1
+    assert 0 < stats["bytes_wire"] < stats["bytes_decoded"]
+
+
+def test_get_columns_streams_typed_columns(openf1):
+    openf1.routes["laps"] = LAPS
+    http = OpenF1Http()
+    schema = {"driver_number": "int16", "lap_number": "int16", "lap_duration": "float64",
+              "date_start": "datetime64[ns]", "missing": "float64"}
+
+    code, columns = http.get_columns(f"{openf1.base}/laps?session_key=1", schema, chunk_size=97)
+
+    assert code == 200
+    assert columns["lap_number"].dtype == np.int16
+    np.testing.assert_array_equal(columns["lap_number"], np.arange(1, 200))
+    assert columns["date_start"].dtype == np.dtype("datetime64[ns]")
+    assert np.isnan(columns["missing"]).all()
+
+
+def test_error_status_is_passed_through(openf1):
+    openf1.status["laps"] = 500
+    code, _ = OpenF1Http().get_json(f"{openf1.base}/laps?session_key=1")
+    assert code == 500
+
+
+def test_rate_limited_request_serves_the_last_good_payload(openf1):
+    openf1.routes["laps"] = LAPS[:3]
+    scheduler = RequestScheduler(per_second=100, per_minute=1000)
+    http = OpenF1Http(scheduler=scheduler)
+    url = f"{openf1.base}/laps?session_key=1"
+    http.get_json(url)
+
+    openf1.status["laps"] = 429
+    assert http.get_json(url) == (200, LAPS[:3])
+    assert scheduler.backoff_remaining > 0
+    # While backing off nothing is sent at all
+    sent = len(openf1.calls("laps"))
+    assert http.get_json(url) == (200, LAPS[:3])
+    assert len(openf1.calls("laps")) == sent
+    assert http.stats()["laps"]["stale"] == 2
+
+
+def test_scheduler_spaces_requests_to_the_rate():
+    scheduler = RequestScheduler(per_second=5, per_minute=1000, max_wait=5)
+    t0 = time.monotonic()
+    assert all(scheduler.acquire("laps") for _ in range(8))
+    # Five from the full bucket, three more at 5/s
+    assert time.monotonic() - t0 >= 0.5
+    assert scheduler.stats()["granted"] == 8
+
+
+def test_scheduler_rejects_after_its_deadline():
+    scheduler = RequestScheduler(per_second=1, per_minute=1)
+    assert scheduler.acquire("laps")
+    assert not scheduler.acquire("laps", timeout=0.1)
+    assert scheduler.stats()["rejected"] == 1
+
+
+def test_only_revalidatable_full_responses_are_remembered(openf1):
+    openf1.routes["intervals"] = LAPS[:3]
+    openf1.routes["laps"] = LAPS[:3]
+    http = OpenF1Http()
+    http.get_json(f"{openf1.base}/intervals?session_key=1&date>2024-03-02T15:03:21")
+    openf1.etags = False
+    http.get_json(f"{openf1.base}/laps?session_key=1")
+    assert not http._validators
+
+
+def test_remembered_bodies_are_bounded_by_bytes(openf1):
+    openf1.routes["laps"] = LAPS
+    http = OpenF1Http(max_validator_bytes=30_000)
+    for key in range(4):
+        http.get_json(f"{openf1.base}/laps?session_key={key}")
+
+    assert 0 < http._validator_bytes <= 30_000
+    assert list(http._validators)[-1].endswith("session_key=3")
+    assert not any(url.endswith("session_key=0") for url in http._validators)
+
+
+def test_background_requests_queue_behind_live_ones():
+    scheduler = RequestScheduler(per_second=1, per_minute=1000, reserve=0.0)
+    assert scheduler.acquire("intervals")  # empties the per-second bucket
+    order = []
+
+    def ask(endpoint, priority=None):
+        scheduler.acquire(endpoint, priority=priority)
+        order.append(endpoint)
+
+    background = threading.Thread(target=ask, args=("laps", BACKGROUND_PRIORITY))
+    background.start()
+    time.sleep(0.1)
+    live = threading.Thread(target=ask, args=("positions",))
+    live.start()
+    background.join(5)
+    live.join(5)
+    assert order == ["positions", "laps"]
+
+
+def test_background_requests_leave_the_reserve_to_live_feeds():
+    scheduler = RequestScheduler(per_second=100, per_minute=8, reserve=0.25)
+    granted = sum(scheduler.acquire("laps", priority=BACKGROUND_PRIORITY, timeout=0) for _ in range(8))
+    assert granted == 6
+    assert scheduler.acquire("intervals", timeout=0)
+
+
+class TokenEndpoint:
+    """Stands in for OpenF1Http.post_form against the token URL: token-1, token-2, ... per call."""
+
+    def __init__(self, lifetime=3600, delay=0.0):
+        self.lifetime = lifetime
+        self.delay = delay
+        self.status = 200
+        self.calls = 0
+
+    def post_form(self, url, data, timeout=10):
+        self.calls += 1
+        time.sleep(self.delay)
+        payload = {"access_token": f"token-{self.calls}", "expires_in": self.lifetime}
+        return SimpleNamespace(status_code=self.status, json=lambda: payload)
+
+
+def test_token_is_refreshed_before_it_expires():
+    endpoint = TokenEndpoint(lifetime=600)
+    tokens = TokenManager(endpoint, "https://token", "u", "p", refresh_margin=60)
+    try:
+        assert tokens.token() == "token-1"
+        assert tokens.token() == "token-1" and endpoint.calls == 1
+        assert tokens._timer.interval == 540
+
+        tokens._timer.function()  # the timer firing, while token-1 is still valid
+        assert tokens.token() == "token-2" and tokens.refreshes == 2
+    finally:
+        tokens._timer.cancel()
+
+
+def test_failed_background_refresh_keeps_the_current_token():
+    endpoint = TokenEndpoint(lifetime=600)
+    tokens = TokenManager(endpoint, "https://token", "u", "p")
+    try:
+        tokens.token()
+        endpoint.status = 500
+        tokens._timer.function()
+        assert tokens.token() == "token-1"
+        assert tokens._timer.interval == 30.0
+    finally:
+        tokens._timer.cancel()
+
+
+def test_concurrent_invalidations_refresh_once():
+    endpoint = TokenEndpoint(delay=0.05)
+    tokens = TokenManager(endpoint, "https://token", "u", "p")
+    try:
+        stale = tokens.token()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(tokens.invalidate(stale))) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(5)
+        assert results == ["token-2"] * 8
+        assert endpoint.calls == 2
+
+        # A 401 seen with an already replaced token does not refresh again
+        assert tokens.invalidate(stale) == "token-2" and endpoint.calls == 2
+    finally:
+        tokens._timer.cancel()
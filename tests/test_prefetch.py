@@ -0,0 +1,74 @@
+import threading
+import time
+
+from prefetch import Prefetcher
+
+
+class Fetch:
+    """Records every endpoint asked for; blocks until `gate` is set."""
+
+    def __init__(self, status=200):
+        self.status = status
+        self.gate = threading.Event()
+        self.gate.set()
+        self.calls = []
+
+    def __call__(self, endpoint, schema=None):
+        self.calls.append(endpoint)
+        self.gate.wait(5)
+        return self.status, [endpoint]
+
+
+def _settle(prefetcher, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = prefetcher.stats()
+        if not stats["pending"] and not stats["in_flight"]:
+            return stats
+        time.sleep(0.01)
+    raise AssertionError("prefetches did not finish")
+
+
+def test_warmed_answers_are_handed_out_once():
+    fetch = Fetch()
+    prefetcher = Prefetcher(fetch)
+    prefetcher.warm("viewer", [("laps?session_key=1", None), ("stints?session_key=1", None)])
+    _settle(prefetcher)
+
+    assert prefetcher.take("laps?session_key=1") == (200, ["laps?session_key=1"])
+    assert prefetcher.take("laps?session_key=1") is None
+    assert prefetcher.take("laps?session_key=1", schema={"date": "datetime64[ns]"}) is None
+    assert prefetcher.stats()["hits"] == 1
+
+    # The same plan again is not fetched twice
+    prefetcher.warm("viewer", [("laps?session_key=1", None), ("stints?session_key=1", None)])
+    assert len(fetch.calls) == 2
+
+
+def test_a_new_plan_drops_the_requests_that_have_not_started():
+    fetch = Fetch()
+    fetch.gate.clear()
+    prefetcher = Prefetcher(fetch, max_workers=1)
+    prefetcher.warm("viewer", [(f"laps?session_key={key}", None) for key in (1, 2, 3)])
+    time.sleep(0.05)
+    prefetcher.warm("viewer", [("laps?session_key=4", None)])
+    fetch.gate.set()
+    stats = _settle(prefetcher)
+
+    assert fetch.calls == ["laps?session_key=1", "laps?session_key=4"]
+    assert stats["cancelled"] == 2
+
+
+def test_stale_and_failed_answers_are_not_served():
+    prefetcher = Prefetcher(Fetch(), max_age=0.05)
+    prefetcher.warm("viewer", [("laps?session_key=1", None)])
+    _settle(prefetcher)
+    time.sleep(0.1)
+    assert prefetcher.take("laps?session_key=1") is None
+    assert prefetcher.stats()["expired"] == 1
+
+    failing = Prefetcher(Fetch(status=429))
+    failing.warm("viewer", [("laps?session_key=1", None)])
+    stats = _settle(failing)
+    assert failing.take("laps?session_key=1") is None
+    assert stats["errors"] == 1 and stats["ready"] == 0
@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from json_stream import columns_from_rows
+from live_data import FEED_SCHEMAS, IncrementalFeed, LapTable, StintIndex
+from race_state import AsOfStream, RaceState
+
+T0 = datetime(2024, 3, 2, 15, 0, tzinfo=timezone.utc)
+
+
+def _at(seconds):
+    return (T0 + timedelta(seconds=seconds)).isoformat()
+
+
+def _feed(name, rows):
+    feed = IncrementalFeed(name, 9, schema=FEED_SCHEMAS[name], keep_history=True)
+    _push(feed, rows)
+    return feed
+
+
+def _push(feed, rows):
+    feed.apply_columns(columns_from_rows(rows, feed.schema))
+
+
+def test_as_of_lookup_takes_the_latest_row_per_driver():
+    feed = _feed("intervals", [
+        {"date": _at(10), "driver_number": 1, "gap_to_leader": 0.0, "interval": None},
+        {"date": _at(10), "driver_number": 44, "gap_to_leader": 1.0, "interval": 1.0},
+        {"date": _at(20), "driver_number": 44, "gap_to_leader": "+1 LAP", "interval": 2.0},
+    ])
+    stream = AsOfStream(["gap_to_leader", "laps_down", "interval"])
+    assert stream.extend(feed)
+    assert not stream.extend(feed)
+
+    dates = np.array([_at(5)[:19], _at(15)[:19], _at(25)[:19], _at(25)[:19]], dtype="datetime64[ms]")
+    out = stream.lookup([44, 44, 44, 1], dates)
+    assert np.isnan(out["gap_to_leader"][0])
+    assert out["gap_to_leader"][1] == 1.0 and out["laps_down"][1] == 0
+    assert np.isnan(out["gap_to_leader"][2]) and out["laps_down"][2] == 1
+    assert out["gap_to_leader"][3] == 0.0
+
+
+def _laps(count):
+    return LapTable.from_rows([
+        {"driver_number": d, "lap_number": n, "lap_duration": 90.0, "date_start": _at(90 * (n - 1))}
+        for d in (1, 44) for n in range(1, count + 1)
+    ])
+
+
+def _intervals(until):
+    return [
+        {"date": _at(t), "driver_number": d, "gap_to_leader": gap, "interval": gap}
+        for t in range(5, until, 10) for d, gap in ((1, 0.0), (44, 1.5))
+    ]
+
+
+def test_rows_are_joined_as_of_each_lap_end():
+    state = RaceState()
+    intervals = _feed("intervals", _intervals(300))
+    positions = _feed("positions", [
+        {"date": _at(1), "driver_number": 1, "position": 2},
+        {"date": _at(1), "driver_number": 44, "position": 1},
+        {"date": _at(100), "driver_number": 1, "position": 1},
+        {"date": _at(100), "driver_number": 44, "position": 2},
+    ])
+    assert state.update(_laps(3), StintIndex.from_rows([]), intervals, positions) == 3
+    assert list(state.at(1).index) == [44, 1]
+    assert list(state.at(2).index) == [1, 44]
+    assert state.at(3).loc[44, "gap_to_leader"] == 1.5
+
+
+def test_a_late_pit_stop_retyres_laps_already_final():
+    one_stint = StintIndex.from_rows([
+        {"driver_number": 44, "stint_number": 1, "lap_start": 1, "lap_end": None, "compound": "SOFT", "tyre_age_at_start": 0},
+    ])
+    state = RaceState()
+    intervals = _feed("intervals", _intervals(300))
+    positions = _feed("positions", [{"date": _at(1), "driver_number": d, "position": p} for d, p in ((1, 1), (44, 2))])
+    state.update(_laps(3), one_stint, intervals, positions)
+    assert state.at(3).loc[44, "compound"] == "SOFT"
+
+    # 44 pitted after lap 2; the new stint arrives together with new interval rows
+    two_stints = StintIndex.from_rows([
+        {"driver_number": 44, "stint_number": 1, "lap_start": 1, "lap_end": 2, "compound": "SOFT", "tyre_age_at_start": 0},
+        {"driver_number": 44, "stint_number": 2, "lap_start": 3, "lap_end": None, "compound": "HARD", "tyre_age_at_start": 0},
+    ])
+    _push(intervals, [{"date": _at(305), "driver_number": 44, "gap_to_leader": 20.0, "interval": 20.0}])
+    state.update(_laps(3), two_stints, intervals, positions)
+
+    assert state.at(2).loc[44, "compound"] == "SOFT"
+    assert state.at(3).loc[44, "compound"] == "HARD"
+    assert state.at(3).loc[44, "tyre_age"] == 0
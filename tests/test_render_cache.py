@@ -0,0 +1,35 @@
+import pandas as pd
+
+from live_data import DriverRegistry
+from render_cache import RenderCache, fingerprint
+
+
+def test_fingerprint_follows_frame_contents():
+    a = pd.DataFrame({"x": [1, 2]})
+    assert fingerprint(a) == fingerprint(a.copy())
+    assert fingerprint(a) != fingerprint(pd.DataFrame({"x": [1, 3]}))
+    assert fingerprint({"b": 1, "a": [a]}) == fingerprint({"a": [a.copy()], "b": 1})
+
+
+def test_render_builds_once_per_distinct_input():
+    cache = RenderCache(max_entries=2)
+    built = []
+
+    def build(value):
+        return lambda: built.append(value) or f"<b>{value}</b>"
+
+    assert cache.render("tower", (1,), build(1)) == "<b>1</b>"
+    assert cache.render("tower", (1,), build(1)) == "<b>1</b>"
+    cache.render("tower", (2,), build(2))
+    cache.render("tower", (3,), build(3))
+    cache.render("tower", (1,), build(1))  # evicted by the LRU bound
+    assert built == [1, 2, 3, 1]
+    assert cache.stats()["tower"] == {"hits": 1, "misses": 4, "hit_rate": 0.2}
+
+
+def test_driver_registry_contents_are_part_of_the_fingerprint():
+    rows = [{"driver_number": 1, "name_acronym": "VER", "team_name": "Red Bull", "team_colour": "3671C6"}]
+    before = DriverRegistry.from_rows(rows)
+    assert fingerprint(before) == fingerprint(DriverRegistry.from_rows(rows))
+    rows[0]["team_colour"] = "FF0000"
+    assert fingerprint(before) != fingerprint(DriverRegistry.from_rows(rows))
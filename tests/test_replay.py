@@ -0,0 +1,36 @@
+import time
+
+from replay import ReplayPlayer, ReplayRecorder, split_date_filter
+
+
+def test_split_date_filter():
+    assert split_date_filter("intervals?session_key=1&date>2024-03-02T15:03:21%2B00:00") == (
+        "intervals?session_key=1", "2024-03-02T15:03:21+00:00")
+    assert split_date_filter("laps?session_key=1") == ("laps?session_key=1", None)
+    assert split_date_filter("laps?session_key=1&date>=2024") == ("laps?session_key=1&date>=2024", None)
+
+
+def test_recorded_responses_play_back_in_order(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    recorder = ReplayRecorder(path)
+    recorder.record("laps?session_key=1", 200, [{"lap_number": 1}])
+    time.sleep(0.05)
+    recorder.record("laps?session_key=1", 200, [{"lap_number": 1}, {"lap_number": 2}])
+
+    player = ReplayPlayer(path, speed=1000)
+    time.sleep(0.01)
+    assert player.fetch("laps?session_key=1") == (200, [{"lap_number": 1}, {"lap_number": 2}])
+
+
+def test_incremental_feeds_answer_every_row_after_the_cutoff(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    recorder = ReplayRecorder(path)
+    recorder.record("intervals?session_key=1", 200, [{"driver_number": 1, "date": "2024-01-01T00:00:01"}])
+    recorder.record("intervals?session_key=1&date>2024-01-01T00:00:01", 200,
+                    [{"driver_number": 1, "date": "2024-01-01T00:00:02"}])
+
+    player = ReplayPlayer(path, speed=1e6)
+    time.sleep(0.01)
+    assert len(player.fetch("intervals?session_key=1")[1]) == 2
+    assert player.fetch("intervals?session_key=1&date>2024-01-01T00:00:01")[1] == [
+        {"driver_number": 1, "date": "2024-01-01T00:00:02"}]
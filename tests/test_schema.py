@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+
+from schema import split_gap, typed_frame
+
+
+def test_split_gap_separates_seconds_and_laps_down():
+    seconds, laps = split_gap([1.5, "+1 LAP", "+2 LAPS", None])
+    np.testing.assert_array_equal(laps, [0, 1, 2, 0])
+    assert seconds[0] == 1.5 and np.isnan(seconds[1:]).all()
+
+
+def test_typed_frame_compacts_known_columns_and_keeps_the_rest():
+    frame = typed_frame("intervals", [
+        {"date": "2024-03-02T15:00:01+00:00", "driver_number": 1, "gap_to_leader": 0.0, "interval": None, "x": "a"},
+        {"date": "2024-03-02T15:00:01+00:00", "driver_number": None, "gap_to_leader": 1.0, "interval": 1.0, "x": "b"},
+        {"date": "2024-03-02T15:00:02+00:00", "driver_number": 4, "gap_to_leader": "+1 LAP", "interval": 0.4, "x": "c"},
+    ])
+    assert list(frame["driver_number"]) == [1, 4]
+    assert frame["driver_number"].dtype == np.int16
+    assert frame["date"].dtype == np.dtype("datetime64[ns]")
+    assert list(frame["laps_down"]) == [0, 1]
+    assert list(frame["x"]) == ["a", "c"]
+    assert isinstance(frame, pd.DataFrame)
@@ -0,0 +1,120 @@
+import os
+
+import numpy as np
+
+from segment_store import SegmentStore
+
+SCHEMA = {"date": "datetime64[ns]", "driver_number": "int64", "gap_to_leader": "float64"}
+
+
+def _rows(start, count, driver=1):
+    return [{"date": f"2024-03-02T15:00:{s:02d}+00:00", "driver_number": driver, "gap_to_leader": s / 10}
+            for s in range(start, start + count)]
+
+
+def test_segments_round_trip_through_a_reader(tmp_path):
+    writer = SegmentStore(str(tmp_path))
+    writer.append("intervals?session_key=1", _rows(0, 3))
+    writer.append("intervals?session_key=1", _rows(3, 2, driver=16))
+    writer.append("laps?session_key=1", [{"lap_number": 1}])
+    writer.append("laps?session_key=1", [{"lap_number": 1}, {"lap_number": 2}], digest="b")
+    assert writer.commit() == 1
+    assert writer.last_date("intervals?session_key=1") == "2024-03-02T15:00:04+00:00"
+
+    reader = SegmentStore(str(tmp_path))
+    assert reader.fetch("intervals?session_key=1")[1] == _rows(0, 3) + _rows(3, 2, driver=16)
+    assert reader.fetch("intervals?session_key=1&date>2024-03-02T15:00:02%2B00:00")[1] == _rows(3, 2, driver=16)
+    assert reader.fetch("laps?session_key=1") == (200, [{"lap_number": 1}, {"lap_number": 2}])
+
+    code, columns = reader.fetch("intervals?session_key=1&date>2024-03-02T15:00:01%2B00:00", SCHEMA)
+    assert code == 200
+    np.testing.assert_array_equal(columns["driver_number"], [1, 16, 16])
+    np.testing.assert_allclose(columns["gap_to_leader"], [0.2, 0.3, 0.4])
+    assert columns["date"][0] == np.datetime64("2024-03-02T15:00:02")
+
+
+def test_unknown_endpoints_are_wanted(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    assert store.fetch("laps?session_key=2")[0] == 503
+    assert store.wanted() == ["laps?session_key=2"]
+
+
+def test_answers_from_an_old_version_do_not_change(tmp_path):
+    writer = SegmentStore(str(tmp_path))
+    reader = SegmentStore(str(tmp_path))
+    writer.append("intervals?session_key=1", _rows(0, 2))
+    writer.commit()
+    _, before = reader.fetch("intervals?session_key=1", SCHEMA)
+    kept = {name: values.copy() for name, values in before.items()}
+
+    writer.append("intervals?session_key=1", _rows(2, 3))
+    writer.commit()
+    _, after = reader.fetch("intervals?session_key=1", SCHEMA)
+    assert len(after["date"]) == 5
+    for name, values in kept.items():
+        np.testing.assert_array_equal(before[name], values)
+
+
+def test_loaded_streams_are_bounded(tmp_path):
+    writer = SegmentStore(str(tmp_path))
+    for driver in range(1, 5):
+        writer.append(f"intervals?session_key=1&driver_number={driver}", _rows(0, 50, driver))
+    writer.commit()
+
+    reader = SegmentStore(str(tmp_path), max_bytes=3000)
+    for driver in range(1, 5):
+        reader.fetch(f"intervals?session_key=1&driver_number={driver}", SCHEMA)
+        assert reader.cached_bytes <= 3000
+    assert reader.fetch("intervals?session_key=1&driver_number=1", SCHEMA)[1]["driver_number"].tolist() == [1] * 50
+
+
+def _files(store, base):
+    return sorted(os.listdir(store._stream_dir(base)))
+
+
+def test_reference_streams_keep_only_the_newest_segment(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    for lap in range(1, 4):
+        store.append("laps?session_key=1", [{"lap_number": n} for n in range(1, lap + 1)], digest=str(lap))
+        store.commit()
+    assert _files(store, "laps?session_key=1") == ["00000002.json"]
+    assert SegmentStore(str(tmp_path)).fetch("laps?session_key=1")[1] == [{"lap_number": n} for n in (1, 2, 3)]
+
+
+def test_compacted_streams_answer_the_same(tmp_path):
+    writer = SegmentStore(str(tmp_path))
+    reader = SegmentStore(str(tmp_path))
+    base = "intervals?session_key=1"
+    for start in range(0, 6, 2):
+        writer.append(base, _rows(start, 2))
+        writer.commit()
+    _, before = reader.fetch(base, SCHEMA)
+
+    assert writer.compact(base)
+    writer.append(base, _rows(6, 1, driver=16))
+    writer.commit()
+    assert _files(writer, base) == ["00000003.json", "00000004.json"]
+
+    _, after = reader.fetch(base, SCHEMA)
+    np.testing.assert_array_equal(after["date"][:6], before["date"])
+    np.testing.assert_array_equal(after["driver_number"], [1] * 6 + [16])
+    assert reader.fetch(f"{base}&date>2024-03-02T15:00:04%2B00:00")[1] == _rows(5, 1) + _rows(6, 1, driver=16)
+    assert SegmentStore(str(tmp_path)).fetch(base)[1] == _rows(0, 6) + _rows(6, 1, driver=16)
+
+
+def test_readers_on_a_superseded_head_reload_it(tmp_path):
+    writer = SegmentStore(str(tmp_path))
+    writer.append("laps?session_key=1", [{"lap_number": 1}], digest="a")
+    writer.commit()
+    reader = SegmentStore(str(tmp_path))
+    read = reader._read_segment
+
+    def commit_first(base, n):
+        # The writer publishes (and deletes segment n) between the reader's HEAD and segment reads
+        reader._read_segment = read
+        writer.append("laps?session_key=1", [{"lap_number": 1}, {"lap_number": 2}], digest="b")
+        writer.commit()
+        return read(base, n)
+
+    reader._read_segment = commit_first
+    assert reader.fetch("laps?session_key=1")[1] == [{"lap_number": 1}, {"lap_number": 2}]
@@ -0,0 +1,60 @@
+import threading
+
+import numpy as np
+import pytest
+
+from session_compare import LapStore, clean_laps, grouped_quantiles, pace_bands
+
+
+def test_grouped_quantiles_match_numpy_per_group():
+    rng = np.random.default_rng(7)
+    sessions = rng.integers(0, 3, 500)
+    drivers = rng.integers(1, 6, 500)
+    values = rng.normal(90.0, 1.0, 500)
+    qs = [0.1, 0.25, 0.5, 0.75, 0.9]
+
+    groups, counts, quantiles = grouped_quantiles([sessions, drivers], values, qs)
+
+    assert counts.sum() == 500
+    for (s, d), n, got in zip(groups, counts, quantiles):
+        mine = values[(sessions == s) & (drivers == d)]
+        assert n == len(mine)
+        np.testing.assert_allclose(got, np.quantile(mine, qs))
+
+
+def test_grouped_quantiles_of_nothing():
+    groups, counts, quantiles = grouped_quantiles([[], []], [], [0.5])
+    assert groups.shape == (0, 2) and len(counts) == 0 and quantiles.shape == (0, 1)
+
+
+def _laps(session):
+    return [
+        {"driver_number": d, "lap_number": n, "lap_duration": 90.0 + session + d / 10 + (30 if n == 5 else 0)}
+        for d in (1, 16) for n in range(1, 11)
+    ]
+
+
+def test_clean_laps_drop_lap_one_and_slow_laps():
+    columns = clean_laps(_laps(0), [])
+    assert len(columns["lap_duration"]) == 2 * 8
+    assert not np.isin(columns["lap_number"], [1, 5]).any()
+
+
+def test_lap_store_loads_each_session_once_on_one_pool():
+    calls, threads = [], set()
+
+    def fetch(endpoint):
+        calls.append(endpoint)
+        threads.add(threading.current_thread().name)
+        session = int(endpoint.rsplit("=", 1)[1])
+        return 200, _laps(session) if endpoint.startswith("laps") else []
+
+    store = LapStore(max_workers=2)
+    assert store.load([1, 2], fetch) == {}
+    assert store.load([1, 2, 3], fetch) == {}
+    assert sorted(calls) == sorted(f"{e}?session_key={k}" for e in ("laps", "stints") for k in (1, 2, 3))
+    assert len(threads) <= 2
+
+    bands = pace_bands(store.columns([1, 3]), drivers=[16])
+    assert list(bands.index) == [(1, 16), (3, 16)]
+    assert bands.loc[(3, 16), "p50"] == pytest.approx(94.6)
@@ -0,0 +1,63 @@
+import threading
+
+import numpy as np
+import pytest
+
+from json_stream import columns_from_rows
+from telemetry import RingBuffer, TelemetryFeed, TelemetryPoller
+
+ROWS = [
+    {"date": "2024-03-02T15:03:21.123+00:00", "speed": 301, "throttle": 100, "brake": 0, "rpm": 11800, "n_gear": 8, "drs": 12},
+    {"date": "2024-03-02T15:03:21.393+00:00", "speed": 303, "throttle": 100, "brake": 0, "rpm": 11900, "n_gear": 8, "drs": 12},
+]
+
+
+@pytest.mark.parametrize("unit", ["ns", "us", "ms"])
+def test_sample_times_are_epoch_seconds_whatever_the_datetime_unit(unit):
+    feed = TelemetryFeed("car_data", 9, 1, capacity=16)
+    columns = columns_from_rows(ROWS, feed.schema)
+    columns["date"] = columns["date"].astype(f"datetime64[{unit}]")
+    feed.ingest(columns)
+
+    samples = feed.samples()
+    assert samples["t"][0] == pytest.approx(1709391801.123, abs=1e-3)
+    assert samples["t"][1] - samples["t"][0] == pytest.approx(0.27, abs=1e-3)
+    assert feed.last_date == "2024-03-02T15:03:21.393000+00:00"
+
+
+def test_ring_buffer_keeps_the_newest_samples_in_order():
+    ring = RingBuffer(4, [("t", "f8")])
+    for start in (0, 3, 6):
+        ring.extend(np.array([(start + i,) for i in range(3)], dtype=ring.dtype))
+    assert list(ring.view()["t"]) == [5, 6, 7, 8]
+
+
+def _poller(calls, **kwargs):
+    def fetch(endpoint, schema):
+        calls.append(endpoint)
+        return 200, columns_from_rows(ROWS, schema)
+    feeds = {"car_data": TelemetryFeed("car_data", 9, 1, capacity=16)}
+    return TelemetryPoller(feeds, fetch, **kwargs)
+
+
+def test_viewers_share_one_poll_loop():
+    calls = []
+    poller = _poller(calls, every=60.0, idle_timeout=1.0)
+    readers = [threading.Thread(target=poller.samples, args=("2024-03-02T15:00:00+00:00",)) for _ in range(5)]
+    for t in readers:
+        t.start()
+    for t in readers:
+        t.join(5)
+
+    assert calls == ["car_data?session_key=9&driver_number=1&date>2024-03-02T15:00:00%2B00:00"]
+    assert len(poller.samples()["car_data"]) == 2
+    assert poller.status == {"car_data": 200}
+
+
+def test_reads_without_auto_refresh_poll_at_most_once_per_interval():
+    calls = []
+    poller = _poller(calls, every=60.0)
+    for _ in range(3):
+        assert len(poller.samples(live=False)["car_data"]) == 2
+    assert len(calls) == 1
+    assert poller._thread is None